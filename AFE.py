@@ -3,16 +3,28 @@ import time
 import os.path
 import yaml
 import logging
+import logs  # logging configured once for all the files (see 'logs.py')
 import sys
 
 # --------------------------------------------------
 # I2C
 # --------------------------------------------------
-from smbus2 import SMBus
 from sys import exit
 
+# I2C bus kept open and shared with the CO2 sensor (see 'i2c_bus.py')
+import i2c_bus
+
+# duration of each phase of the sampling cycle
+import timing
+
+# record returned by getdata() (see 'schema.py')
+import schema
+
+# raw frames kept to decode them again later (see 'frame_archive.py')
+import frame_archive
+
 # emplacement variable
-bus = SMBus(1)
+bus = i2c_bus.get_bus(1)  # shared bus, to use with 'with bus as smbus:'
 
 # attributed canals and associated emplacements variable
 address = 0b1110110
@@ -30,8 +42,6 @@ with open(current_working_directory + '/seacanairy_settings.yaml') as file:
 
 store_debug_messages = settings['AFE Board']['Store debug messages (important increase of logs)']
 
-project_name = settings['Seacanairy settings']['Sampling session name']
-
 # calibration = settings['AFE Board']['Calibration']
 
 
@@ -42,47 +52,15 @@ project_name = settings['Seacanairy settings']['Sampling session name']
 # logging = tak a trace of some messages in a file to be reviewed afterward (check for errors fe)
 
 
-def set_logger(message_level, log_file):
-    # set up logging to file
-    logging.basicConfig(level=message_level,
-                        format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
-                        datefmt='%d-%m %H:%M',
-                        filename=log_file,
-                        filemode='a')
+logger = logs.get_logger('AFE Board', store_debug_messages)  # DEBUG messages only if asked in the settings
 
-    logger = logging.getLogger('AFE Board')  # name of the logger
-    # all further logging must be called by logger.'level' and not logging.'level'
-    # if not, the logging will be displayed as 'ROOT' and NOT 'OPC-N3'
-    return logger
-
-
-if __name__ == '__main__':  # if you run this code directly ($ python3 CO2.py)
-    message_level = logging.DEBUG  # show ALL the logging messages
-    # Create a file to store the log if it doesn't exist
+if __name__ == '__main__':  # if you run this code directly ($ python3 AFE.py)
+    # show and store ALL the logging messages
     log_file = current_working_directory + "/log/Alphasense_board-debugging.log"
-    if not os.path.isfile(log_file):
-        os.mknod(log_file)
     print("Alphasense Board DEBUG messages will be shown and stored in '" + str(log_file) + "'")
-    logger = set_logger(message_level, log_file)
-    # define a Handler which writes INFO messages or higher to the sys.stderr/display
-    console = logging.StreamHandler()
-    console.setLevel(message_level)
-    # set a format which is simpler for console use
-    formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
-    # tell the handler to use this format
-    console.setFormatter(formatter)
-    # add the handler to the root logger
-    logging.getLogger().addHandler(console)
-
-else:  # if this file is considered as a library (if you execute 'seacanairy.py' for example)
-    # it will only print and store INFO messages and above in the corresponding log_file
-    if store_debug_messages:
-        message_level = logging.DEBUG
-    else:
-        message_level = logging.INFO
-    log_file = '/home/pi/seacanairy_project/log/' + project_name + '-log.log'  # complete location needed on the RPI
-    # no need to add a handler, because there is already one in seacanairy.py
-    logger = set_logger(message_level, log_file)
+    logs.setup(log_file, logging.DEBUG)
+    logger.setLevel(logging.DEBUG)
+# if this file is used as a library, the logging is set up by seacanairy.py (see 'logs.py')
 
 # all further logging must be called by logger.'level' and not logging.'level'
 # if not, the logging will be displayed as 'ROOT' and NOT 'GPS'
@@ -149,9 +127,12 @@ def getADCreading(adc_address, adc_channel):
     while attempts < 4:
 
         try:
-            bus.write_byte(adc_address, adc_channel)
-            time.sleep(sleep)
-            reading = bus.read_i2c_block_data(adc_address, adc_channel, lange)
+            with bus as smbus:
+                smbus.write_byte(adc_address, adc_channel)
+            time.sleep(sleep)  # the bus is free for the other sensors during the conversion
+            with bus as smbus:
+                reading = smbus.read_i2c_block_data(adc_address, adc_channel, lange)
+            frame_archive.record(frame_archive.ADC, [adc_channel] + list(reading))
             # ----------- Start conversion for the Channel Data ----------
             valor = ((((reading[0] & 0x3F)) << 16)) + ((reading[1] << 8)) + (((reading[2] & 0xE0)))
             # add a debug function
@@ -162,22 +143,19 @@ def getADCreading(adc_address, adc_channel):
             print("Reading tension...", volts, "V", end='\r')
 
             if (reading[0] & 0b11000000) == 0b11000000:
-                logger.error(
-                    "Input voltage to channel " + str(adc_channel) + " is either open or more than " + str(vref) + "Volts."
-                        " Value read is: " + str(reading[0]))
-                logger.warning("The reading may not be correct. Value read is " + str(volts) + " mV")
+                logger.error("Input voltage to channel %s is either open or more than %sVolts. Value read is: %s",
+                             adc_channel, vref, reading[0])
+                logger.warning("The reading may not be correct. Value read is %s mV", volts)
 
             time.sleep(sleep)  # be sure to have some time laps between two I2C reading/writing
             return volts
 
         except:
             if attempts >= 3:
-                logger.critical("i2c transmission failed 3 consecutive times(" + str(sys.exc_info())
-                         + "), skipping i2c reading")
+                logger.critical("i2c transmission failed 3 consecutive times(%s), skipping i2c reading", sys.exc_info())
                 return False  # indicate clearly that system has failed
 
-            logger.error("Error in the i2c transmission (" + str(sys.exc_info())
-                         + "), trying again... (" + str(attempts) + "/3)")
+            logger.error("Error in the i2c transmission (%s), trying again... (%s/3)", sys.exc_info(), attempts)
             attempts += 1  # increment of reading_trials
             time.sleep(1)  # if transmission fails, wait a bit to try again (sensor is maybe busy)
 
@@ -199,7 +177,7 @@ def get_temp():
     volts = getADCreading(address, channel0)
     if volts is not False:
         tempv = ch0_mult * volts
-        logger.debug("Tension from temperature sensor (AFE board) is " + str(tempv) + " mV")
+        logger.debug("Tension from temperature sensor (AFE board) is %s mV", tempv)
         time.sleep(sleep)
 
         temp_to_return = {
@@ -209,7 +187,7 @@ def get_temp():
     else:
         logger.critical("Failed to read temperature")
         temp_to_return = {
-            "temperature raw": "error",
+            "temperature raw": None,
             "temperature": "-"
         }
 
@@ -224,10 +202,10 @@ def get_NO2():
     volts = getADCreading(address, channel1)
     if volts is not False:
         NO2v_main = ch0_mult * volts
-        logger.debug("Tension from NO2 sensor (main) is " + str(NO2v_main) + " mV")
+        logger.debug("Tension from NO2 sensor (main) is %s mV", NO2v_main)
         time.sleep(sleep)
         NO2v_aux = ch0_mult * getADCreading(address, channel2)
-        logger.debug("Tension from NO2 sensor (aux) is " + str(NO2v_aux) + " mV")
+        logger.debug("Tension from NO2 sensor (aux) is %s mV", NO2v_aux)
         time.sleep(sleep)
 
         # ppb = ((calibration['NO2']['WE']))
@@ -240,9 +218,9 @@ def get_NO2():
     else:
         logger.critical("Failed to read NO2 sensor")
         NO2_to_return = {
-            "NO2 main": "error",
-            "NO2 aux": "error",
-            "NO2 ppm": "error"
+            "NO2 main": None,
+            "NO2 aux": None,
+            "NO2 ppm": None
         }
 
     return NO2_to_return
@@ -256,10 +234,10 @@ def get_OX():
     volts = getADCreading(address, channel3)
     if volts is not False:
         Oxv_main = ch0_mult * volts
-        logger.debug("Tension from Ox sensor (main) is " + str(Oxv_main) + " mV")
+        logger.debug("Tension from Ox sensor (main) is %s mV", Oxv_main)
         time.sleep(sleep)
         Oxv_aux = ch0_mult * getADCreading(address, channel4)
-        logger.debug("Tension from Ox sensor (aux) is " + str(Oxv_aux) + " mV")
+        logger.debug("Tension from Ox sensor (aux) is %s mV", Oxv_aux)
         time.sleep(sleep)
 
         OX_to_return = {
@@ -271,9 +249,9 @@ def get_OX():
     else:
         logger.critical("Failed to read OX")
         OX_to_return = {
-            "OX main": "error",
-            "OX aux": "error",
-            "OX ppm": "error"
+            "OX main": None,
+            "OX aux": None,
+            "OX ppm": None
         }
 
     return OX_to_return
@@ -287,10 +265,10 @@ def get_SO2():
     volts = getADCreading(address, channel5)
     if volts is not False:
         SO2v_main = ch0_mult * volts
-        logger.debug("Tension from SO2 sensor (main) is " + str(SO2v_main) + " mV")
+        logger.debug("Tension from SO2 sensor (main) is %s mV", SO2v_main)
         time.sleep(sleep)
         SO2v_aux = ch0_mult * getADCreading(address, channel6)
-        logger.debug("Tension from SO2 sensor (aux) is " + str(SO2v_aux) + " mV")
+        logger.debug("Tension from SO2 sensor (aux) is %s mV", SO2v_aux)
         time.sleep(sleep)
 
         SO2_to_return = {
@@ -303,9 +281,9 @@ def get_SO2():
         logger.critical("Failed to read SO2")
 
         SO2_to_return = {
-            "SO2 main": "error",
-            "SO2 aux": "error",
-            "SO2 ppm": "error"
+            "SO2 main": None,
+            "SO2 aux": None,
+            "SO2 ppm": None
         }
 
     return SO2_to_return
@@ -320,9 +298,9 @@ def get_CO():
     if volts is not False:
         COv_main = ch0_mult * volts
         time.sleep(sleep)
-        logger.debug("Tension from CO sensor (main) is " + str(COv_main) + " mV")
+        logger.debug("Tension from CO sensor (main) is %s mV", COv_main)
         COv_aux = ch0_mult * getADCreading(address, channel8)
-        logger.debug("Tension from CO sensor (aux) is " + str(COv_aux) + " mV")
+        logger.debug("Tension from CO sensor (aux) is %s mV", COv_aux)
         time.sleep(sleep)
 
         CO2_to_return = {
@@ -334,9 +312,9 @@ def get_CO():
         logger.critical("Failed to read CO")
 
         CO2_to_return = {
-            "CO main": "error",
-            "CO aux": "error",
-            "CO ppm": "error"
+            "CO main": None,
+            "CO aux": None,
+            "CO ppm": None
         }
 
     return CO2_to_return
@@ -347,11 +325,9 @@ def getdata(average=None, interval=0.5):
     Get all available data from the 4-AFE Alphasense Board
     :param average: number of measurement to take to make average
     :param interval: interval of time between those measurements
-    :return: List[temperature, NO2, OX, SO2, CO]
+    :return: List[temperature, NO2, OX, SO2, CO] if average is given, else schema.AFERecord (None in case of error)
     """
 
-    to_return = {}
-
     if average is not None:
         temperature = []
         NO2 = []
@@ -387,28 +363,43 @@ def getdata(average=None, interval=0.5):
 
     elif average is None:
         print("\t\tppm\t|\tmain (mV)\t\t|\taux (mV)")
-        NO2_data = get_NO2()
+        with timing.phase("AFE NO2 channels"):
+            NO2_data = get_NO2()
         print("                                                                      ", end='\r')
         print("NO2:\t", NO2_data["NO2 ppm"],"\t|\t", NO2_data["NO2 main"], "\t|\t", NO2_data["NO2 aux"])
-        to_return.update(NO2_data)
-        OX_data = get_OX()
+        with timing.phase("AFE OX channels"):
+            OX_data = get_OX()
         print("                                                                      ", end='\r')
         print("OX:\t", OX_data["OX ppm"], "\t|\t", OX_data["OX main"], "\t|\t", OX_data["OX aux"])
-        to_return.update(OX_data)
-        SO2_data = get_SO2()
+        with timing.phase("AFE SO2 channels"):
+            SO2_data = get_SO2()
         print("                                                                      ", end='\r')
         print("SO2:\t", SO2_data["SO2 ppm"], "\t|\t", SO2_data["SO2 main"], "\t|\t", SO2_data["SO2 aux"])
-        to_return.update(SO2_data)
-        CO_data = get_CO()
+        with timing.phase("AFE CO channels"):
+            CO_data = get_CO()
         print("                                                                      ", end='\r')
         print("CO:\t", CO_data["CO ppm"], "\t|\t", CO_data["CO main"], "\t|\t", CO_data["CO aux"])
-        to_return.update(CO_data)
-        temp = get_temp()
+        with timing.phase("AFE temperature channel"):
+            temp = get_temp()
         print("                                                                      ", end='\r')
         print("Temperature:\t", temp["temperature"], "\t|\t", temp["temperature raw"])
-        to_return.update(temp)
 
-        return to_return
+        return schema.AFERecord(
+            temperature=temp["temperature"],
+            temperature_raw=temp["temperature raw"],
+            NO2=NO2_data["NO2 ppm"],
+            NO2_main=NO2_data["NO2 main"],
+            NO2_aux=NO2_data["NO2 aux"],
+            OX=OX_data["OX ppm"],
+            OX_main=OX_data["OX main"],
+            OX_aux=OX_data["OX aux"],
+            SO2=SO2_data["SO2 ppm"],
+            SO2_main=SO2_data["SO2 main"],
+            SO2_aux=SO2_data["SO2 aux"],
+            CO=CO_data["CO ppm"],
+            CO_main=CO_data["CO main"],
+            CO_aux=CO_data["CO aux"]
+        )
 
     else:
         raise TypeError("Check arguments of AFE.getdata()")
@@ -17,24 +17,41 @@ import sys
 import os
 
 # smbus2 is the new smbus, allow more than 32 bits writing/reading
-from smbus2 import SMBus, i2c_msg
-# 'SMBus' is the general driver for i2c communication
+from smbus2 import i2c_msg
 # 'i2c_msg' allow to make i2c write followed by i2c read WITHOUT any STOP byte (see sensor documentation)
 
+# I2C bus kept open and shared with the AFE board (see 'i2c_bus.py')
+import i2c_bus
+
 # logging
 import logging
 
+# logging configured once for all the files (see 'logs.py')
+import logs
+
 # yaml settings
 import yaml
 
-# progress bar during sampling
-from progress.bar import IncrementalBar
+# CRC8 calculated with a lookup table
+import checksum
+
+# progress bar during sampling, without drift
+from scheduler import loading_bar
+
+# duration of each phase of the sampling cycle
+import timing
+
+# record returned by the sensor (see 'schema.py')
+import schema
+
+# raw frames kept to decode them again later (see 'frame_archive.py')
+import frame_archive
 
 # I²C address of the CO2 device
 CO2_address = 0x33  # i2c address by default, can be changed (see sensor doc)
 
 # emplacement variable
-bus = SMBus(1)  # make it easier to read/write to the sensor (bus.read or bus.write...)
+bus = i2c_bus.get_bus(1)  # shared bus, to use with 'with bus as smbus:' (see 'i2c_bus.py')
 
 # --------------------------------------------------------
 # YAML SETTINGS
@@ -48,8 +65,6 @@ with open(current_working_directory + '/seacanairy_settings.yaml') as file:
 
 store_debug_messages = settings['CO2 sensor']['Store debug messages (important increase of logs)']
 
-project_name = settings['Seacanairy settings']['Sampling session name']
-
 measurement_delay = settings['CO2 sensor']['Amount of time required for the sensor to take the measurement']
 
 max_attempts = settings['CO2 sensor']['Number of reading attempts']
@@ -61,53 +76,15 @@ max_attempts = settings['CO2 sensor']['Number of reading attempts']
 # logging = tak a trace of some messages in a file to be reviewed afterward (check for errors fe)
 
 
-def set_logger(message_level, log_file):
-    # set up logging to file
-    logging.basicConfig(level=message_level,
-                        format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
-                        datefmt='%d-%m %H:%M',
-                        filename=log_file,
-                        filemode='a')
-
-    logger = logging.getLogger('CO2 sensor')  # name of the logger
-    # all further logging must be called by logger.'level' and not logging.'level'
-    # if not, the logging will be displayed as 'ROOT' and NOT 'OPC-N3'
-    return logger
-
+logger = logs.get_logger('CO2 sensor', store_debug_messages)  # DEBUG messages only if asked in the settings
 
 if __name__ == '__main__':  # if you run this code directly ($ python3 CO2.py)
-    message_level = logging.DEBUG  # show ALL the logging messages
-    # Create a file to store the log if it doesn't exist
+    # show and store ALL the logging messages
     log_file = current_working_directory + "/log/CO2-debugging.log"
-    if not os.path.isfile(log_file):
-        os.mknod(log_file)
     print("CO2 Sensor DEBUG messages will be shown and stored in '" + str(log_file) + "'")
-    logger = set_logger(message_level, log_file)
-    # The following HANDLER must be activated ONLY if you run this code alone
-    # Without the 'if __name__ == '__main__' condition, all the logging messages are displayed 3 TIMES
-    # (once for the handler in CO2.py, once for the handler in OPCN3.py, and once for the handler in seacanairy.py)
-
-    # define a Handler which writes INFO messages or higher to the sys.stderr/display (= the console)
-    console = logging.StreamHandler()
-    console.setLevel(message_level)
-    # set a format which is simpler for console use
-    formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
-    # tell the handler to use this format
-    console.setFormatter(formatter)
-    # add the handler to the root logger
-    logging.getLogger().addHandler(console)
-
-else:  # if this file is considered as a library (if you execute seacanairy.py for example)
-    # if the user asked to store all the messages in 'seacanairy_settings.yaml'
-    if store_debug_messages:
-        message_level = logging.DEBUG
-    # if the user don't want to store everything
-    else:
-        message_level = logging.INFO
-    # Create a file to store the log if it doesn't exist yet
-    log_file = current_working_directory + "/" + project_name + "/" + project_name + "-log.log"
-    logger = set_logger(message_level, log_file)
-    # no need to add a handler, because there is already one in seacanairy.py
+    logs.setup(log_file, logging.DEBUG)
+    logger.setLevel(logging.DEBUG)
+# if this file is used as a library, the logging is set up by seacanairy.py (see 'logs.py')
 
 
 # all further logging must be called by logger.'level' and not logging.'level'
@@ -116,48 +93,13 @@ else:  # if this file is considered as a library (if you execute seacanairy.py f
 # --------------------------------------------------------
 
 
-def loading_bar(name, delay):
-    """
-    Show a loading bar on the screen during a a certain amount of time
-    Make the user understand the software is doing/waiting for something
-    :param name: Text to be shown on the left of the loading bar
-    :param length: Amount of time the system is waiting in seconds
-    :return: nothing
-    """
-    bar = IncrementalBar(name, max=(2 * delay), suffix='%(elapsed)s/' + str(delay) + ' seconds')
-    for i in range(2 * delay):
-        time.sleep(0.5)
-        bar.next()
-    bar.finish()
-    return
-
-
 def digest(buf):
     """
-    Calculate the CRC8 checksum (based on the CO2 documentation example)
+    Calculate the CRC8 checksum (polynomial 0x31, see CO2 documentation example and 'checksum.py')
     :param buf: List[bytes to digest]
     :return: checksum
     """
-    # Translation of the C++ code given in the documentation
-    crcVal = 0xff
-    _from = 0  # the first item in a list is named 0
-    _to = len(buf)  # if there are two items in the list, then len() return 1 --> range(0, 1) = 2 loops
-
-    for i in range(_from, _to):
-        curVal = buf[i]
-
-        for j in range(0, 8):  # C++ stops when J is not < 8 --> same for python in range
-            if ((crcVal ^ curVal) & 0x80) != 0:
-                crcVal = (crcVal << 1) ^ 0x31
-
-            else:
-                crcVal = (crcVal << 1)
-
-            curVal = (curVal << 1)  # this line is in the "for j" loop, not in the "for i" loop
-
-    checksum = crcVal & 0xff  # keep only the 8 last bits
-
-    return checksum
+    return checksum.crc8(buf)
 
 
 def check(checksum, data):
@@ -173,9 +115,8 @@ def check(checksum, data):
         return True
     else:
         logger.debug("CRC8 does not fit, data are wrong")
-        logger.error("Checksum is wrong, sensor checksum is: " + str(checksum) +
-                     ", seacanairy checksum is: " + str(calculation) +
-                     ", data returned by the sensor is:" + str(data))
+        logger.error("Checksum is wrong, sensor checksum is: %s, seacanairy checksum is: %s, data returned by the "
+                     "sensor is:%s", checksum, calculation, data)
         if data[0] and data[1] == 0:
             logger.debug("Sensor returned 0 values, it is not ready, waiting a bit")
             print("Sensor not ready, waiting...", end='\r')
@@ -192,8 +133,8 @@ def status(print_information=True):
     """
     logger.debug("Reading sensor status")
     try:
-        with SMBus(1) as bus:
-            reading = bus.read_byte_data(CO2_address, 0x71)
+        with bus as smbus:
+            reading = smbus.read_byte_data(CO2_address, 0x71)
         # see documentation for the following decryption
         CO2_status = reading & 0b00001000
         temperature_status = reading & 0b00000010
@@ -233,10 +174,10 @@ def getRHT():
     attempts = 0  # trial counter for the checksum and the validity of the data received
     reading_trials = 0  # trial counter for the i2c communication
 
-    # In case there is a problem and it return nothing, return "error"
+    # In case there is a problem and it return nothing, return None ("error" in the data file)
     data = {
-        "relative humidity": "error",
-        "temperature": "error"
+        "relative humidity": None,
+        "temperature": None
     }
 
     # all the following code is in a loop so that if the checksum is wrong, it start a new measurement
@@ -244,23 +185,24 @@ def getRHT():
 
         while reading_trials <= max_attempts:  # reading loop, will try again if the i2c communication fails
             try:  # SMBUS stop working in case of error, avoid the software to crash in case of i2c error
-                with SMBus(1) as bus:
-                    bus.i2c_rdwr(write, read)
+                with bus as smbus:
+                    smbus.i2c_rdwr(write, read)
                 break  # break the loop if the try has not failed at the previous line, jump to the process of data
 
             except:  # what happens if the i2c fails
                 if reading_trials == max_attempts:
-                    logger.critical("i2c transmission failed "
-                                    + str(max_attempts) + "consecutive times, skipping this RH and temperature reading")
+                    logger.critical("i2c transmission failed %sconsecutive times, skipping this RH and temperature "
+                                    "reading", max_attempts)
                     return data  # indicate clearly that data are wrong
 
-                logger.error("Error in the i2c transmission (" + str(sys.exc_info())
-                             + "), trying again... (" + str(reading_trials + 1) + "/" + str(max_attempts) + ")")
+                logger.error("Error in the i2c transmission (%s), trying again... (%s/%s)", sys.exc_info(),
+                             reading_trials + 1, max_attempts)
                 reading_trials += 1  # increment of reading_trials
                 time.sleep(3)  # if transmission fails, wait a bit to try again (sensor is maybe busy)
 
         # process the data given by the sensor
         reading = list(read)
+        frame_archive.record(frame_archive.CO2_RHT, reading)
         # if the two checksums are correct...
         if check(reading[2], [reading[0], reading[1]]) and check(reading[5], [reading[3], reading[4]]):
             # reading << 8 = shift bytes 8 times to the left, say differently, add 8 times 0 on the right
@@ -280,14 +222,14 @@ def getRHT():
 
         else:  # if one or both checksums are not corrects
             if attempts == max_attempts:
-                logger.error("Data were wrong "
-                             + str(max_attempts) + " consecutive times, skipping this RH and temperature reading")
+                logger.error("Data were wrong %s consecutive times, skipping this RH and temperature reading",
+                             max_attempts)
                 return data  # indicate on the SD card that data are wrong
 
             else:
                 attempts += 1
-                logger.warning("Error in the data received (wrong checksum), reading data again... ("
-                               + str(attempts) + "/" + str(max_attempts) + ")")
+                logger.warning("Error in the data received (wrong checksum), reading data again... (%s/%s)", attempts,
+                               max_attempts)
                 time.sleep(4)  # avoid to close i2c communication
 
 
@@ -305,11 +247,11 @@ def getCO2P():
     attempts = 0  # trial counter for the checksum and the validity of the data received
     reading_trials = 0  # trial counter for the i2c communication
 
-    # Create a dictionary containing the data, return "error" in case of error
+    # Create a dictionary containing the data, return None ("error" in the data file) in case of error
     data = {
-        "average": "error",
-        "instant": "error",
-        "pressure": "error"
+        "average": None,
+        "instant": None,
+        "pressure": None
     }
 
     # all the following code is in a loop so that if the checksum is wrong, it start a new measurement
@@ -317,24 +259,24 @@ def getCO2P():
 
         while reading_trials <= max_attempts:  # reading loop, will try again if the i2c communication fails
             try:  # SMBUS stop working in case of error, avoid the software to crash in case of i2c error
-                with SMBus(1) as bus:
-                    bus.i2c_rdwr(write, read)
+                with bus as smbus:
+                    smbus.i2c_rdwr(write, read)
                 break  # break the loop if the try has not failed at the previous line, jump to the process of data
 
             except:  # what happens if the i2c fails
                 if reading_trials == max_attempts:
-                    logger.critical("i2c transmission failed "
-                                    + str(max_attempts) + " consecutive times, skipping this CO2 and pressure reading")
+                    logger.critical("i2c transmission failed %s consecutive times, skipping this CO2 and pressure "
+                                    "reading", max_attempts)
                     return data  # indicate clearly that the data are wrong
 
-                logger.error("Error in the i2c transmission, trying again... (" +
-                             str(reading_trials + 1) + "/" + str(max_attempts) + ")")
+                logger.error("Error in the i2c transmission, trying again... (%s/%s)", reading_trials + 1, max_attempts)
                 reading_trials += 1  # increment of reading_trials
                 print("Waiting 4 seconds...", end='\r')
                 time.sleep(3)  # if I²C comm fails, wait a little bit and try again (sensor is maybe busy)
 
         # process the data given by the sensor
         reading = list(read)
+        frame_archive.record(frame_archive.CO2_CO2P, reading)
         # if the two checksums are correct...
         if check(reading[2], [reading[0], reading[1]]) and check(reading[5], [reading[3], reading[4]]) and check(
                 reading[8], [reading[6], reading[7]]):
@@ -362,36 +304,37 @@ def getCO2P():
 
             else:
                 attempts += 1
-                logger.warning("Error in the data received (wrong checksum), reading data again... (" +
-                               str(attempts) + "/" + str(max_attempts) + ")")
+                logger.warning("Error in the data received (wrong checksum), reading data again... (%s/%s)", attempts,
+                               max_attempts)
                 time.sleep(3)  # avoid too close i2c communication
 
 
 def get_data():
     """
     Read all the data available from the CO2 sensor
-    :return: Dictionary{"pressure", "temperature", "CO2 average", "CO2 instant"}
+    :return: schema.CO2Record(relative_humidity, temperature, pressure, CO2_average, CO2_instant)
     """
     # Read status byte
-    attempts = 1
-    while True:
-        if status(True):
-            break
-        else:
-            print("Waiting for data to be ready...", end='\r')
-            time.sleep(2)
-            attempts += 1
-        if attempts >= 6:
-            print("Sensor not ready, trying to read...", end='\r')
-            break
+    with timing.phase("CO2 status polling"):
+        attempts = 1
+        while True:
+            if status(True):
+                break
+            else:
+                print("Waiting for data to be ready...", end='\r')
+                time.sleep(2)
+                attempts += 1
+            if attempts >= 6:
+                print("Sensor not ready, trying to read...", end='\r')
+                break
 
-    # Get CO2 and pressure
-    data1 = getCO2P()
-    # Get RH and temperature
-    data2 = getRHT()
-    # Append those two dictionary
-    data1.update(data2)
-    return data1
+    with timing.phase("CO2 reading"):
+        # Get CO2 and pressure
+        data1 = getCO2P()
+        # Get RH and temperature
+        data2 = getRHT()
+    return schema.CO2Record(relative_humidity=data2["relative humidity"], temperature=data2["temperature"],
+                            pressure=data1["pressure"], CO2_average=data1["average"], CO2_instant=data1["instant"])
 
 
 # ---------------------------------------------------------------------
@@ -419,13 +362,12 @@ def internal_timestamp(new_timestamp=None):
         # ...Python crash if it tries to make calculations with a boolean (True or False)
         measuring_time_interval = (reading[1] + reading[0] * 256) / 10
         if new_timestamp is None:  # adapt the message in function of the wishes of the user (here he want to read)
-            logger.info("Internal measuring time interval is " + str(int(measuring_time_interval)) + " seconds")
+            logger.info("Internal measuring time interval is %s seconds", int(measuring_time_interval))
         else:  # (here he want to write)
-            logger.info(
-                "Internal measuring time interval set successfully on " + str(int(measuring_time_interval)) + " seconds")
+            logger.info("Internal measuring time interval set successfully on %s seconds", int(measuring_time_interval))
         return measuring_time_interval
     else:
-        logger.error("Failed to change the internal timestamp to " + str(new_timestamp) + " seconds")
+        logger.error("Failed to change the internal timestamp to %s seconds", new_timestamp)
 
 
 def trigger_measurement(force=False):
@@ -498,21 +440,21 @@ def read_internal_calibration(item):
     lower_limit = (reading[4] << 8 + reading[5])  # factor taken into account further
     upper_limit = (reading[6] << 8 + reading[7])  # factor taken into account further
 
-    logger.info("Reading calibration for " + str(item) + ":")
-    logger.info("\tOffset: " + str(offset) + " " + str(unit))
-    logger.info("\tGain: " + str(gain))
+    logger.info("Reading calibration for %s:", item)
+    logger.info("\tOffset: %s %s", offset, unit)
+    logger.info("\tGain: %s", gain)
     if lower_limit == 0xFFFF:
         logger.info("\tNo last lower limit adjustment")
         lower_limit = 0
     else:
         lower_limit += factor
-        logger.info("\tLower limit: " + str(lower_limit) + " " + str(unit))
+        logger.info("\tLower limit: %s %s", lower_limit, unit)
     if upper_limit == 0xFFFF:
         logger.info("\tNo last upper minute adjustment")
         upper_limit = 0
     else:
         upper_limit *= factor
-        logger.info("\tUpper limit: " + str(upper_limit) + " " + str(unit))
+        logger.info("\tUpper limit: %s %s", upper_limit, unit)
     return [offset, gain, lower_limit, upper_limit]
 
 
@@ -523,31 +465,32 @@ def read_from_custom_memory(index, number_of_bytes):
     :param number_of_bytes: number of bytes to read (see sensor doc)
     :return: list[bytes] from right to left
     """
-    logger.info("Reading " + str(number_of_bytes) + " bytes from customer memory at index " + str(hex(index)) + "...")
+    logger.info("Reading %s bytes from customer memory at index %s...", number_of_bytes, hex(index))
     write = i2c_msg.write(CO2_address, [0x71, 0x54, index])  # usual bytes to send/write to initiate the reading
     attempts = 1
     read = []  # avoid return issue
 
     while attempts < 4:
         try:
-            with SMBus(1) as bus:
-                bus.i2c_rdwr(write)
             read = i2c_msg.read(CO2_address, number_of_bytes)
-            with SMBus(1) as bus:
-                bus.i2c_rdwr(read)
-                break  # break the trial loop if the above has not failed
+            # the index written and the reading in one single acquisition of the bus: no other transaction
+            # (AFE board, other process) can move the memory pointer between both
+            with bus as smbus:
+                smbus.i2c_rdwr(write)
+                smbus.i2c_rdwr(read)
+            break  # break the trial loop if the above has not failed
         except:  # if i2c communication fails
             if attempts >= 3:
                 logger.warning("i2c communication failed 3 times while writing to customer memory, skipping reading")
                 return False  # indicate that the writing process failed, exit this function
             else:
-                logger.error("i2c communication failed to read from customer memory (" + str(attempts) + "/3)")
+                logger.error("i2c communication failed to read from customer memory (%s/3)", attempts)
                 attempts += 1
                 print("Waiting 3 seconds...", end='\r')
                 time.sleep(3)  # avoid too close i2c communication, let time to the sensor, may be busy
 
     reading = list(read)
-    logger.info("Reading from custom memory returned " + str(reading))
+    logger.info("Reading from custom memory returned %s", reading)
     return reading
 
 
@@ -558,16 +501,16 @@ def write_to_custom_memory(index, *bytes_to_write):
     :param bytes_to_write: unlimited amount of bytes to write
     :return: True (Success) or False (Fail)
     """
-    logger.info("Writing " + str(bytes_to_write) + " inside custom memory at index " + str(hex(index)) + "...")
+    logger.info("Writing %s inside custom memory at index %s...", bytes_to_write, hex(index))
     crc8 = digest([index, *bytes_to_write])  # calculation of the CRC8 based on the index number and all the bytes sent
     attempts = 1  # trial counter for writing into the customer memory
     cycle = 1  # trial counter for i2c communication
 
     while cycle < 4 and attempts < 4:
         try:
-            with SMBus(1) as bus:
+            with bus as smbus:
                 write = i2c_msg.write(CO2_address, [0x71, 0x54, index, *bytes_to_write, crc8])  # see sensor doc
-                bus.i2c_rdwr(write)
+                smbus.i2c_rdwr(write)
                 logger.debug("i2c writing succeeded")
                 # i2c writing function worked, and sensor didn't replied a NACK on the SCK line
                 # (see i2c working principle/theory)
@@ -577,7 +520,7 @@ def write_to_custom_memory(index, *bytes_to_write):
                 logger.error("i2c communication failed 3 times while writing to customer memory, skipping writing")
                 return False  # indicate that the writing process failed, exit this function
             else:
-                logger.warning("i2c communication failed to write into customer memory (" + str(cycle) + "/3)")
+                logger.warning("i2c communication failed to write into customer memory (%s/3)", cycle)
                 cycle += 1
                 time.sleep(1)
 
@@ -587,17 +530,16 @@ def write_to_custom_memory(index, *bytes_to_write):
         cycle = 1  # reset the attempts counter, let the chance of the sensor to fail 3 i2c communication...
         # ...each time it fails the writing process
         if reading == [*bytes_to_write]:  # because reading returns a list
-            logger.debug("Success in writing " + str(bytes_to_write) + " inside custom memory at index " + str(index))
+            logger.debug("Success in writing %s inside custom memory at index %s", bytes_to_write, index)
             return reading  # indicate that the writing process succeeded
         if attempts >= 3:
-            logger.critical("Failed 3 consecutive times to write " + str(bytes_to_write) +
-                            " into customer memory at index " + str(hex(index)))
+            logger.critical("Failed 3 consecutive times to write %s into customer memory at index %s", bytes_to_write,
+                            hex(index))
             return False  # indicate that the writing process failed
         else:
-            logger.error(
-                "Failed in writing " + str(bytes_to_write) + " inside custom memory at index " + str(hex(index))
-                + " (" + str(attempts) + "/3), trying again")
-            logger.debug("Value read is " + str(reading) + " in place of " + str(bytes_to_write))
+            logger.error("Failed in writing %s inside custom memory at index %s (%s/3), trying again", bytes_to_write,
+                         hex(index), attempts)
+            logger.debug("Value read is %s in place of %s", reading, bytes_to_write)
             time.sleep(2)  # avoid too close i2c communication
             attempts += 1
 
@@ -616,7 +558,7 @@ def write_to_custom_memory(index, *bytes_to_write):
 if __name__ == '__main__':
     now = datetime.now()
     logger.info("------------------------------------")  # add a line in the log file
-    logger.info("Launching a new execution on the " + str(now.strftime("%d/%m/%Y %H:%M:%S")))
+    logger.info("Launching a new execution on the %s", now.strftime("%d/%m/%Y %H:%M:%S"))
 
     print("Reading internal timestamp")
     internal_timestamp()
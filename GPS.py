@@ -11,9 +11,15 @@ import serial  # UART libraries, to install this library: pip3 install pyserial
 import time
 import yaml
 import logging
+import logs  # logging configured once for all the files (see 'logs.py')
 import RPi.GPIO as GPIO
 import sys
 import os.path
+import threading  # to read the UART port continuously in the background
+import checksum  # NMEA checksum
+import schema  # record returned by the GPS (see 'schema.py')
+import frame_archive  # raw NMEA lines kept to decode them again later (see 'frame_archive.py')
+from collections import deque  # ring buffer of the last fixes
 
 # --------------------------------------------------------
 # YAML SETTINGS
@@ -28,7 +34,7 @@ with open(current_working_directory + '/seacanairy_settings.yaml') as file:
 
 store_debug_messages = settings['GPS']['Store debug messages (important increase of logs)']
 
-project_name = settings['Seacanairy settings']['Sampling session name']
+fix_buffer_size = settings['GPS']['Number of fixes kept in memory']
 
 # --------------------------------------------------------
 # LOGGING SETTINGS
@@ -36,47 +42,15 @@ project_name = settings['Seacanairy settings']['Sampling session name']
 # all the settings and other code for the logging
 # logging = tak a trace of some messages in a file to be reviewed afterward (check for errors fe)
 
-def set_logger(message_level, log_file):
-    # set up logging to file
-    logging.basicConfig(level=message_level,
-                        format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
-                        datefmt='%d-%m %H:%M',
-                        filename=log_file,
-                        filemode='a')
+logger = logs.get_logger('GPS', store_debug_messages)  # DEBUG messages only if asked in the settings
 
-    logger = logging.getLogger('GPS')  # name of the logger
-    # all further logging must be called by logger.'level' and not logging.'level'
-    # if not, the logging will be displayed as 'ROOT' and NOT 'OPC-N3'
-    return logger
-
-
-if __name__ == '__main__':  # if you run this code directly ($ python3 CO2.py)
-    message_level = logging.DEBUG  # show ALL the logging messages
-    # Create a file to store the log if it doesn't exist
+if __name__ == '__main__':  # if you run this code directly ($ python3 GPS.py)
+    # show and store ALL the logging messages
     log_file = current_working_directory + "/log/GPS-debugging.log"
-    if not os.path.isfile(log_file):
-        os.mknod(log_file)
     print("GPS DEBUG messages will be shown and stored in '" + str(log_file) + "'")
-    logger = set_logger(message_level, log_file)
-    # define a Handler which writes INFO messages or higher to the sys.stderr/display
-    console = logging.StreamHandler()
-    console.setLevel(message_level)
-    # set a format which is simpler for console use
-    formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
-    # tell the handler to use this format
-    console.setFormatter(formatter)
-    # add the handler to the root logger
-    logging.getLogger().addHandler(console)
-
-else:  # if this file is considered as a library (if you execute 'seacanairy.py' for example)
-    # it will only print and store INFO messages and above in the corresponding log_file
-    if store_debug_messages:
-        message_level = logging.DEBUG
-    else:
-        message_level = logging.INFO
-    log_file = '/home/pi/seacanairy_project/log/' + project_name + '-log.log'  # complete location needed on the RPI
-    # no need to add a handler, because there is already one in seacanairy.py
-    logger = set_logger(message_level, log_file)
+    logs.setup(log_file, logging.DEBUG)
+    logger.setLevel(logging.DEBUG)
+# if this file is used as a library, the logging is set up by seacanairy.py (see 'logs.py')
 
 
 # all further logging must be called by logger.'level' and not logging.'level'
@@ -99,18 +73,124 @@ else:  # if this file is considered as a library (if you execute 'seacanairy.py'
 # GPIO.output(25, GPIO.LOW)
 
 
+# --------------------------------------------------------
+# UART SETTINGS
+# --------------------------------------------------------
+
+port = '/dev/ttyAMA0'
+# USB = '/dev/ttyACM0'
+# PL011 = '/dev/serial0' == '/dev/ttyAMA0'
+baudrate = 9600  # must be a multiple of the SPI speed of the OPC-N3 (see OPCN3.py)
+reconnect_delay = 5  # seconds to wait before opening again the UART port after an error
+first_fix_timeout = 3  # seconds to wait for the first fix when the reader has just been started
+max_fix_age = 10  # seconds, a warning is given when the last fix is older than that
+
+# --------------------------------------------------------
+# BACKGROUND READER
+# --------------------------------------------------------
+# The UART port is kept open and read continuously by a thread
+# Each valid fix (GPRMC + GPGGA of the same second) is stored in a ring buffer
+# get_position() takes the fixes from the buffer and never has to wait for the UART
+
+fixes = deque(maxlen=fix_buffer_size)  # last fixes, the oldest are automatically deleted
+fixes_lock = threading.Lock()  # avoid reading the buffer while the reader thread is writing it
+new_fix = threading.Event()  # set each time a fix is stored
+stop_reader = threading.Event()  # set to stop the reader thread
+reader_thread = None
+
+
+def start_reader():
+    """
+    Start the thread reading the UART port in the background (nothing happens if it is already running)
+    :return: nothing
+    """
+    global reader_thread
+    if reader_thread is not None and reader_thread.is_alive():
+        return
+    stop_reader.clear()
+    reader_thread = threading.Thread(target=read_serial_port, name='GPS reader', daemon=True)
+    reader_thread.start()
+    logger.debug("GPS reader thread started on %s", port)
+
+
+def stop():
+    """
+    Stop the background reader thread and close the UART port
+    :return: nothing
+    """
+    stop_reader.set()
+    if reader_thread is not None:
+        reader_thread.join(timeout=2)
+
+
+def read_serial_port():
+    """
+    Loop of the background reader thread
+    Read the NMEA lines one by one, decode the useful ones and store the fixes in the ring buffer
+    Open again the UART port if it fails
+    :return: nothing
+    """
+    while not stop_reader.is_set():
+        try:
+            ser = serial.Serial(port=port, baudrate=baudrate, timeout=1)
+        except:
+            logger.critical("Failed to initiate UART port %s (%s)", port, sys.exc_info())
+            stop_reader.wait(reconnect_delay)
+            continue
+
+        pending = None  # GPRMC data waiting for the GPGGA line of the same second
+        try:
+            ser.reset_input_buffer()  # delete the data received before, the first line could be cut
+            while not stop_reader.is_set():
+                line = ser.readline()  # return b'' if nothing is received before the timeout
+                if not line:
+                    continue
+                frame_archive.record(frame_archive.NMEA, line)
+                line = str(line, 'utf-8', errors='replace').strip()
+                # 'replace' = replace the unencodable unicode to a question mark
+
+                if line[0:6] == "$GPRMC" and check(line):
+                    if pending is not None:  # no GPGGA was received for the previous fix, store it anyway
+                        store_fix(pending)
+                    pending = decode_GPRMC(line.split(","))
+
+                elif line[0:6] == "$GPGGA" and pending is not None and check(line):
+                    GPGGA = decode_GPGGA(line.split(","))
+                    if GPGGA["current time"][0:8] == pending["fix time"]:  # both lines are about the same fix
+                        pending.update(GPGGA)
+                    store_fix(pending)
+                    pending = None
+        except:
+            logger.critical("Failed to read GPS data on UART port %s (%s)", port, sys.exc_info())
+            stop_reader.wait(reconnect_delay)
+        finally:
+            ser.close()
+
+
+def store_fix(fix):
+    """
+    Add a decoded fix in the ring buffer
+    :param fix: Dictionary returned by decode_GPRMC, updated with decode_GPGGA
+    :return: nothing
+    """
+    fix["received"] = time.time()
+    if "current time" in fix:
+        fix["current time"] = fix["fix date"] + " " + fix["current time"]
+    with fixes_lock:
+        fixes.append(fix)
+    new_fix.set()
+
+
 def get_raw_reading():
     """
     Get raw GPS reading via UART
     Read all the lines available on the UART port
+    (NOT USED BY get_position() ANYMORE, see the background reader)
     :return: raw data from the GPS
     """
-    port = '/dev/ttyAMA0'
     try:
-        # USB = '/dev/ttyACM0'
-        # PL011 = '/dev/serial0' == '/dev/ttyAMA0'
-        logger.debug("Port used for UART communication is: " + str(port))
-        ser = serial.Serial(port=port, baudrate=9600)
+        logger.debug("Port used for UART communication is: %s", port)
+        ser = serial.Serial(port=port, baudrate=baudrate)
         print("Starting UART communication...", end='\r')
         time.sleep(1)
         ser.flush()
@@ -122,16 +202,16 @@ def get_raw_reading():
             reading = ser.read_all()
             ser.close()
         except:
-            logger.critical("Failed to read GPS data on UART port " + str(port) + " (" + str(sys.exc_info()) + ")")
+            logger.critical("Failed to read GPS data on UART port %s (%s)", port, sys.exc_info())
             return False  # indicate error
     except:
-        logger.critical("Failed to initiate UART port " + str(port) + " (" + str(sys.exc_info()) + ")")
+        logger.critical("Failed to initiate UART port %s (%s)", port, sys.exc_info())
         return False  # indicate error
 
     reading = str(reading, 'utf-8', errors='replace')  # convert the text sent in b'...' format into readable format...
     # it will also skip the line where the GPS propose it (see NMEA protocol)
     # 'replace' = replace the unencodable unicode to a question mark
-    logger.debug("Raw reading is:\r" + str(reading[:-1]))
+    logger.debug("Raw reading is:\r%s", reading[:-1])
     return reading
 
 
@@ -150,6 +230,122 @@ def lat_long_decode(raw_position, compas):
     return position
 
 
+def decimal_to_lat_long(value, positive, negative):
+    """
+    Convert a position in decimal degrees into the same readable format as lat_long_decode
+    :param value: latitude/longitude in decimal degrees
+    :param positive: compas if the value is positive ('N' or 'E')
+    :param negative: compas if the value is negative ('S' or 'W')
+    :return: string(latitude/longitude)
+    """
+    compas = positive if value >= 0 else negative
+    value = abs(value)
+    deg = int(value)
+    min = (value - deg) * 60
+    return str(deg) + '°' + "%08.5f" % min + "' " + compas
+
+
+def NMEA_to_decimal(raw_position, compas):
+    """
+    Convert the NMEA longitude/latitude into decimal degrees (used to interpolate the position)
+    :param raw_position: raw longitude/latitude word (dddmm.mmmmm)
+    :param compas: compas (N/S/W/E)
+    :return: float(decimal degrees), negative for South and West
+    """
+    deg, min = divmod(float(raw_position), 100)
+    value = deg + min / 60
+    if compas in ("S", "W"):
+        value = -value
+    return value
+
+
+def decode_GPRMC(GPRMC):
+    """
+    Decode the GPRMC line of the NMEA protocol
+    :param GPRMC: List[fields of the line, split on the comas]
+    :return: Dictionary{fix time, fix date, fix date and time, timestamp, latitude, longitude, SOG, COG, status}
+    """
+    fix_time = GPRMC[1][0:2] + ":" + GPRMC[1][2:4] + ":" + GPRMC[1][4:6]
+    date = GPRMC[9][0:2] + "-" + GPRMC[9][2:4] + "-" + GPRMC[9][4:6]
+    to_return = {
+        "fix date and time": date + " " + fix_time,
+        "fix date": date,
+        "fix time": fix_time,
+    }
+    try:
+        # time of the fix in seconds since 1970 (UTC), used to find the fix of a given moment
+        to_return["timestamp"] = datetime.strptime(GPRMC[9] + GPRMC[1][0:6], "%d%m%y%H%M%S") \
+            .replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        to_return["timestamp"] = None  # no date before the first fix
+
+    if GPRMC[2] == "V":  # indicate that GPS is not working good
+        to_return.update({
+            "status": "NOK",
+            "latitude": "no fix",
+            "longitude": "no fix",
+            "SOG": "no fix",
+            "COG": "no fix",
+        })
+    elif GPRMC[2] == "A":  # indicate that GPS is working fine
+        to_return.update({
+            "latitude": lat_long_decode(GPRMC[3], GPRMC[4]),
+            "longitude": lat_long_decode(GPRMC[5], GPRMC[6]),
+            "latitude decimal": NMEA_to_decimal(GPRMC[3], GPRMC[4]),
+            "longitude decimal": NMEA_to_decimal(GPRMC[5], GPRMC[6]),
+            "SOG": GPRMC[7],
+            "COG": GPRMC[8],
+            "status": "OK"
+        })
+    else:
+        logger.critical("Something wrong with the GPRMC data, GPS satus returned is: %s", GPRMC[2])
+    return to_return
+
+
+def decode_GPGGA(GPGGA):
+    """
+    Decode the GPGGA line of the NMEA protocol
+    :param GPGGA: List[fields of the line, split on the comas]
+    :return: Dictionary{altitude, WGS84 correction, fix status, current time, horizontal precision, accuracy}
+    """
+    current_time = GPGGA[1][0:2] + ":" + GPGGA[1][2:4] + ":" + GPGGA[1][4:6] + " UTC"
+    altitude = GPGGA[9] + " m"
+    WGS84_correction = GPGGA[11] + " " + GPGGA[12]
+    position_fix_status_indicator = GPGGA[6]
+    horizontal_precision = float(GPGGA[8]) if GPGGA[8] != '' else 99.99  # empty when there is no fix
+    accuracy = ''
+    if horizontal_precision < 2:
+        accuracy = "very good"
+    elif 2 <= horizontal_precision < 3:
+        accuracy = "good"
+    elif 3 <= horizontal_precision < 5:
+        accuracy = "average"
+    elif 5 <= horizontal_precision < 6:
+        accuracy = "poor"
+    elif horizontal_precision >= 6:
+        accuracy = "very poor"
+    if position_fix_status_indicator == '0':
+        fix_status = "No fix/invalid"
+    elif position_fix_status_indicator == '1':
+        fix_status = "Standard GPS 2D/3D"
+    elif position_fix_status_indicator == '2':
+        fix_status = "DGPS"
+    elif position_fix_status_indicator == '6':
+        fix_status = "DR"
+    else:
+        logger.error("Unknown position fix status indicator in GPGGA: %s", position_fix_status_indicator)
+        fix_status = "Unknown: " + str(position_fix_status_indicator)
+
+    return {
+        "altitude": altitude,
+        "WGS84 correction": WGS84_correction,
+        "fix status": fix_status,
+        "current time": current_time,
+        "horizontal precision": horizontal_precision,
+        "accuracy": accuracy
+    }
+
+
 def decode_NMEA(data):
     """
     Decode the NMEA script and get the useful data
@@ -166,103 +362,26 @@ def decode_NMEA(data):
         print("                                                                                          ", end='\r')
         if data[i][0:6] == "$GPRMC":
             if check(data[i]):
-                GPRMC = data[i].split(",")
-                fix_time = GPRMC[1][0:2] + ":" + GPRMC[1][2:4] + ":" + GPRMC[1][4:6]
-                date = GPRMC[9][0:2] + "-" + GPRMC[9][2:4] + "-" + GPRMC[9][4:6]
-                to_return.update({
-                    "fix date and time": date + " " + fix_time,
-                    "fix date": date,
-                    "fix time": fix_time,
-                })
-                if GPRMC[2] == "V":  # indicate that GPS is not working good
+                to_return.update(decode_GPRMC(data[i].split(",")))
+                if to_return["status"] == "NOK":
                     logger.warning("GPS does not receive signal")
-                    to_return.update({
-                        "status": "NOK",
-                        "latitude": "no fix",
-                        "longitude": "no fix",
-                        "SOG": "no fix",
-                        "COG": "no fix",
-                    })
                     return to_return
-                elif GPRMC[2] == "A":  # indicate that GPS is working fine
-                    latitude = lat_long_decode(GPRMC[3], GPRMC[4])
-                    longitude = lat_long_decode(GPRMC[5], GPRMC[6])
-                    SOG = GPRMC[7]
-                    COG = GPRMC[8]
-
-                    to_return.update({
-                        "latitude": latitude,
-                        "longitude": longitude,
-                        "SOG": SOG,
-                        "COG": COG,
-                        "status": "OK"
-                    })
-
-                else:
-                    logger.critical("Something wrong with the GPRMC data, GPS satus returned is: " + str(GPRMC[2]))
 
         elif data[i][0:6] == "$GPGGA":
             if check(data[i]):
-                GPGGA = data[i].split(",")
-                current_time = GPGGA[1][0:2] + ":" + GPGGA[1][2:4] + ":" + GPGGA[1][4:6] + " UTC"
-                altitude = GPGGA[9] + " m"
-                WGS84_correction = GPGGA[11] + " " + GPGGA[12]
-                position_fix_status_indicator = GPGGA[6]
-                horizontal_precision = float(GPGGA[8])
-                accuracy = ''
-                if horizontal_precision < 2:
-                    accuracy = "very good"
-                elif 2 <= horizontal_precision < 3:
-                    accuracy = "good"
-                elif 3 <= horizontal_precision < 5:
-                    accuracy = "average"
-                elif 5 <= horizontal_precision < 6:
-                    accuracy = "poor"
-                elif horizontal_precision >= 6:
-                    accuracy = "very poor"
-                if position_fix_status_indicator == '0':
-                    fix_status = "No fix/invalid"
-                elif position_fix_status_indicator == '1':
-                    fix_status = "Standard GPS 2D/3D"
-                elif position_fix_status_indicator == '2':
-                    fix_status = "DGPS"
-                elif position_fix_status_indicator == '6':
-                    fix_status = "DR"
-                else:
-                    logger.error(
-                        "Unknown position fix status indicator in GPGGA: " + str(position_fix_status_indicator))
-                    fix_status = "Unknown: " + str(position_fix_status_indicator)
-
-                to_return.update({
-                    "altitude": altitude,
-                    "WGS84 correction": WGS84_correction,
-                    "fix status": fix_status,
-                    "current time": current_time,
-                    "horizontal precision": horizontal_precision,
-                    "accuracy": accuracy
-                })
+                to_return.update(decode_GPGGA(data[i].split(",")))
 
     return to_return
 
 
 def digest(string_line):
     """
-    Calculate the checksum based on the transmitted data
+    Calculate the checksum based on the transmitted data (XOR of the characters, see 'checksum.py')
     Put the whole NMEA line in the argument, function will automatically remove the checksum at the end
-    COPY-PASTED AND ADAPTED FROM WIKIPEDIA
-    :param NMEAstring: line of data transmitted by the GPS
-    :return:
+    :param string_line: line of data transmitted by the GPS
+    :return: checksum, as written at the end of the NMEA line (2 hexadecimal characters, uppercase)
     """
-    calc_cksum = 0
-    NMEAstring = string_line[1:-3]
-    for s in NMEAstring:
-        # it is XOR of each Unicode integer representation
-        calc_cksum ^= ord(s)
-
-    calc_cksum = str(hex(calc_cksum))[2:]  # get hex representation
-    calc_cksum = calc_cksum.upper()  # convert the lowercase to uppercase (abc to ABC)
-    # if not, Python does not recognize this string as an hexadecimal
-    return calc_cksum
+    return "%02X" % checksum.nmea_checksum(string_line)
 
 
 def check(NMEA_line):
@@ -278,78 +397,122 @@ def check(NMEA_line):
         logger.debug("Checksum is correct")
         return True
     else:
-        logger.warning("Checksum is not correct: calculation is " + str(calc) + "| sensor's checksum is " + str(checksum))
+        logger.warning("Checksum is not correct: calculation is %s| sensor's checksum is %s", calc, checksum)
         return False
 
 
-def get_position():
+def interpolate_fix(before, after, timestamp):
+    """
+    Estimate the position at a given moment between two fixes (linear interpolation)
+    :param before: fix just before the given moment
+    :param after: fix just after the given moment
+    :param timestamp: moment (seconds since 1970, UTC)
+    :return: Dictionary with the same items as a fix
+    """
+    ratio = (timestamp - before["timestamp"]) / (after["timestamp"] - before["timestamp"])
+    # the other values (time, speed, accuracy...) are taken from the closest fix
+    fix = dict(before if ratio < 0.5 else after)
+    if before["status"] == "OK" and after["status"] == "OK":
+        latitude = before["latitude decimal"] + ratio * (after["latitude decimal"] - before["latitude decimal"])
+        longitude = before["longitude decimal"] + ratio * (after["longitude decimal"] - before["longitude decimal"])
+        fix.update({
+            "latitude decimal": latitude,
+            "longitude decimal": longitude,
+            "latitude": decimal_to_lat_long(latitude, "N", "S"),
+            "longitude": decimal_to_lat_long(longitude, "E", "W"),
+        })
+    return fix
+
+
+def find_fix(timestamp=None):
+    """
+    Take a fix from the ring buffer, without communicating with the GPS
+    :param timestamp: None for the last fix, or moment (seconds since 1970, UTC) at which the position is wanted
+    :return: Dictionary of the fix, None if there is no fix in the buffer
+    """
+    with fixes_lock:
+        if not fixes:
+            return None
+        if timestamp is None:
+            return dict(fixes[-1])  # last fix
+
+        dated = [fix for fix in fixes if fix["timestamp"] is not None]
+
+    if not dated:
+        return None
+    if timestamp <= dated[0]["timestamp"]:
+        return dict(dated[0])  # older than the buffer, return the oldest one
+    if timestamp >= dated[-1]["timestamp"]:
+        return dict(dated[-1])  # newer than the buffer, return the last one
+
+    for i in range(1, len(dated)):
+        if dated[i]["timestamp"] >= timestamp:
+            return interpolate_fix(dated[i - 1], dated[i], timestamp)
+
+
+def get_position(timestamp=None):
     """
     Get position and all other data from the GPS
-    :return:    Dictionary{fix time, fix date, fix date and time, latitude, longitude, SOG, COG, status,
-                horizontal precision, altitude, WGS84 correction, current time, accuracy}
+    The data are taken from the fixes read in the background (see 'start_reader()')
+    :param timestamp: Optional: moment (seconds since 1970, UTC) at which the position is wanted,
+                      the position is interpolated between the two closest fixes. Last fix if None.
+    :return:    schema.GPSRecord(current_time, fix_date_and_time, latitude, longitude, SOG, COG,
+                horizontal_precision, accuracy, altitude, WGS84_correction, fix_status, status),
+                all the fields are None in case of error
     """
     logger.debug("Get position")
 
-    attempts = 1
-
-    to_return = {
-        "fix date and time": "error",
-        "fix date": "error",
-        "fix time": "error",
-        "latitude": "error",
-        "longitude": "error",
-        "SOG": "error",
-        "COG": "error",
-        "status": "error",
-        "horizontal precision": "error",
-        "altitude": "error",
-        "WGS84 correction": "error",
-        "current time": "error",
-        "fix status": "error",
-        "accuracy": "error"
-    }  # you must return all those items to avoid bugs in seacanairy.py (f-e looking for an item which doesn't exist)
-
-    while attempts <= 4:
-        reading = get_raw_reading()
-        if not reading:  # if it failed to read UART, it returns False
-            logger.critical("Unable to read GPS data, skipping reading")
-            return to_return  # return a dictionary full of "error"
-        else:
-            try:  # avoid errors because of 'I don't know why the sensor sometimes delete items in the NMEA at random'
-                data = decode_NMEA(reading)  # decode the raw reading
-                to_return.update(data)  # update the dictionary with the data the function got
-                logger.debug("'to_return' is:\r" + str(to_return))
-                # At each trial, it will update the dictionary
-            except:
-                logger.error("There were an error while decoding NMEA protocol (" + str(str(sys.exc_info())) + ")")
-
-            if "error" in to_return.values():  # if the dictionary contains an error, try again
-                attempts += 1
-                if attempts >= 4:  # if the system has tried 3 times to read the data but that there are still errors
-                    logger.error("Tried 3 times to get full GPS data, still a value 'error'")
-                    break  # exit the loop and print the data anyway
-                logger.warning("Data missing in GPS transmission, reading again (" + str(attempts) + "/3)")
-            else:  # if there are no errors, then exit the loop and proceed
-                break
-
-    to_return["current time"] = to_return["fix date"] + " " + to_return["current time"]
-
-    print("Current time:\t", to_return["current time"])
-    print("Latitude:\t", to_return["latitude"], "\t|\tLongitude:\t", to_return["longitude"])
-    print("Altitude:\t", to_return["altitude"], "\t\t|\tWGS84 correction:", to_return["WGS84 correction"])
-    print("SOG:\t\t", to_return["SOG"], "kts", "\t\t|\tCOG:\t\t ", end='')
-    if to_return["COG"] == '':
+    if reader_thread is None or not reader_thread.is_alive():
+        start_reader()
+        new_fix.wait(first_fix_timeout)  # let a chance to the GPS to send a first fix
+
+    fix = find_fix(timestamp)
+    if fix is None:
+        logger.error("No GPS data received yet, skipping reading")
+        return schema.GPSRecord()  # all the fields are None ("error" in the data file)
+
+    age = time.time() - fix["received"]
+    if age > max_fix_age:
+        logger.warning("Last GPS data received %s seconds ago", int(age))
+
+    if fix["status"] == "NOK":
+        logger.warning("GPS does not receive signal")
+
+    # the items missing in the fix (f-e no GPGGA line received) stay on None
+    to_return = schema.GPSRecord(
+        current_time=fix.get("current time"),
+        fix_date_and_time=fix.get("fix date and time"),
+        latitude=fix.get("latitude"),
+        longitude=fix.get("longitude"),
+        SOG=fix.get("SOG"),
+        COG=fix.get("COG"),
+        horizontal_precision=fix.get("horizontal precision"),
+        accuracy=fix.get("accuracy"),
+        altitude=fix.get("altitude"),
+        WGS84_correction=fix.get("WGS84 correction"),
+        fix_status=fix.get("fix status"),
+        status=fix.get("status")
+    )
+    logger.debug("'to_return' is:\r%s", to_return)
+
+    print("Current time:\t", to_return.current_time)
+    print("Latitude:\t", to_return.latitude, "\t|\tLongitude:\t", to_return.longitude)
+    print("Altitude:\t", to_return.altitude, "\t\t|\tWGS84 correction:", to_return.WGS84_correction)
+    print("SOG:\t\t", to_return.SOG, "kts", "\t\t|\tCOG:\t\t ", end='')
+    if to_return.COG == '':
         print("no speed")
     else:
-        print(to_return["COG"])
-    print("Horizontal deviation:\t", to_return["horizontal precision"])
-    print("Fix date/time:\t", to_return["fix date and time"], "UTC", "\t|\tGPS mode:\t", to_return["fix status"])
-    print("Accuracy:\t", to_return["accuracy"], "\t\t|\tGPS status:\t", to_return["status"])
+        print(to_return.COG)
+    print("Horizontal deviation:\t", to_return.horizontal_precision)
+    print("Fix date/time:\t", to_return.fix_date_and_time, "UTC", "\t|\tGPS mode:\t", to_return.fix_status)
+    print("Accuracy:\t", to_return.accuracy, "\t\t|\tGPS status:\t", to_return.status)
 
     return to_return
 
 
 if __name__ == '__main__':
     print("GPS.py is running alone")
-    get_position()
-    time.sleep(1)
+    start_reader()
+    while True:
+        get_position()
+        time.sleep(1)
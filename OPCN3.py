@@ -1,18 +1,32 @@
 #! /home/pi/seacanairy_project/venv/bin/python3
 """
 Library for the use and operation of the Alphasense OPC-N3 sensor
+Each sensor is an OPCN3 object, with its own SPI device (CE0 or CE1), settings and logger:
+    second_sensor = OPCN3.OPCN3(device=1, name='OPC-N3 CE1')
+    second_sensor.getdata(flushing_time, sampling_time)
+The SPI port is opened at the first communication, and the sensors of a same bus can be read from different threads
+(each SPI transfer takes the lock of the bus, see 'get_bus_lock').
+The functions of the module (OPCN3.getdata(), OPCN3.fan_on()...) use the sensor of the settings ('sensor').
 """
 
 import spidev  # driver for the SPI/serial communication
 import time
+import threading  # to read the PM continuously in the background ('PM only' mode) and share the SPI bus
+from collections import deque  # rolling window of the SPI statistics
 import struct  # to convert the IEEE bytes to float
+import checksum  # CRC16 calculated with a lookup table
 import datetime
 import sys
 import os  # to create folders/files and read current path
-from progress.bar import IncrementalBar  # beautiful progress bar during sampling
+import json  # configurations of the sensors already read (see 'load_configuration')
+from scheduler import loading_bar  # beautiful progress bar during sampling, without drift
+import timing  # duration of each phase of the sampling cycle
+import schema  # record returned by the sensor (see 'schema.py')
+import frame_archive  # raw frames kept to decode them again later (see 'frame_archive.py')
 # import RPi.GPIO as GPIO  # used for CS (Chip Select line)
 
 import logging  # save logger messages into memory
+import logs  # logging configured once for all the files (see 'logs.py')
 
 # yaml settings
 import yaml  # read user settings
@@ -28,17 +42,12 @@ with open(current_working_directory + '/seacanairy_settings.yaml') as file:
     settings = yaml.safe_load(file)
     file.close()
 
-store_debug_messages = settings['CO2 sensor']['Store debug messages (important increase of logs)']
+# settings of the sensor (the other sensors can be given their own settings, see 'OPCN3')
+sensor_settings = settings['OPC-N3 sensor']
 
-project_name = settings['Seacanairy settings']['Sampling session name']
+store_debug_messages = sensor_settings['Store debug messages (important increase of logs)']
 
-OPC_flushing_time = settings['OPC-N3 sensor']['Flushing time']
-
-OPC_sampling_time = settings['OPC-N3 sensor']['Sampling time']
-
-take_new_sample_if_checksum_is_wrong = \
-    settings['OPC-N3 sensor'][
-        'Take a new measurement if checksum is wrong (avoid shorter sampling periods when errors)']
+chip_select = sensor_settings['SPI chip select (0 = CE0, 1 = CE1)']
 
 
 # --------------------------------------------------------
@@ -48,47 +57,15 @@ take_new_sample_if_checksum_is_wrong = \
 # logging = keep a trace of some messages in a file to be reviewed afterward (check for errors f-e)
 
 
-def set_logger(message_level, log_file):
-    # set up logging to file
-    logging.basicConfig(level=message_level,
-                        format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
-                        datefmt='%d-%m %H:%M',
-                        filename=log_file,
-                        filemode='a')
-
-    logger = logging.getLogger('OPC-N3')  # name of the logger
-    # all further logging must be called by logger.'level' and not logging.'level'
-    # if not, the logging will be displayed as 'ROOT' and NOT 'OPC-N3'
-    return logger
-
+logger = logs.get_logger('OPC-N3', store_debug_messages)  # DEBUG messages only if asked in the settings
 
-if __name__ == '__main__':  # if you run this code directly ($ python3 CO2.py)
-    message_level = logging.DEBUG  # show ALL the logging messages
-    # Create a file to store the log if it doesn't exist
-    log_file = current_working_directory + "/log/OPCN3-debugging.log"  # complete file location required for the Raspberry
-    if not os.path.isfile(log_file):
-        os.mknod(log_file)
+if __name__ == '__main__':  # if you run this code directly ($ python3 OPCN3.py)
+    # show and store ALL the logging messages
+    log_file = current_working_directory + "/log/OPCN3-debugging.log"
     print("DEBUG messages will be shown and stored in '" + str(log_file) + "'")
-    logger = set_logger(message_level, log_file)
-    # define a Handler which writes INFO messages or higher to the sys.stderr/display
-    console = logging.StreamHandler()
-    console.setLevel(message_level)
-    # set a format which is simpler for console use
-    formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
-    # tell the handler to use this format
-    console.setFormatter(formatter)
-    # add the handler to the root logger
-    logging.getLogger().addHandler(console)
-
-else:  # if this file is considered as a library (if you execute 'seacanairy.py' for example)
-    # it will only print and store INFO messages and above in the corresponding log_file
-    if store_debug_messages:
-        message_level = logging.DEBUG
-    else:
-        message_level = logging.INFO
-    log_file = current_working_directory + "/" + project_name + "/" + project_name + "-log.log"
-    # no need to add a handler, because there is already one in seacanairy.py
-    logger = set_logger(message_level, log_file)
+    logs.setup(log_file, logging.DEBUG)
+    logger.setLevel(logging.DEBUG)
+# if this file is used as a library, the logging is set up by seacanairy.py (see 'logs.py')
 
 # ----------------------------------------------
 # SPI CONFIGURATION
@@ -97,16 +74,14 @@ else:  # if this file is considered as a library (if you execute 'seacanairy.py'
 
 
 bus = 0  # name of the SPI bus on the Raspberry Pi 3B+, only one bus
-device = 0  # name of the SS (Ship Selection) pin used for the OPC-N3
-spi = spidev.SpiDev()  # enable SPI (SPI must be enable in the RPi settings beforehand)
-spi.open(bus, device)  # open the spi port at start
-spi.max_speed_hz = 307200  # must be between 300 and 750 kHz
+# the SS (Ship Selection) pin of each sensor is its device: 0 = CE0, 1 = CE1
+SPI_speed = 307200  # must be between 300 and 750 kHz
 # Personal experiment shown that UART and SPI speeds must be multiple
 # UART baud rate is 9600 for the GPS sensor
 # 9600 * 2 * 2 * 2 * 2 * 2 = 307200
 # If not, both sensor data are corrupted
 # If not, OPCN3 returns alternately int(48) = hex(0x30) = bytes(00110000)
-spi.mode = 0b01  # bytes(0b01) = int(1) --> SPI mode 1
+SPI_mode = 0b01  # bytes(0b01) = int(1) --> SPI mode 1
 # first bit (from right) = CPHA = 0 --> data are valid when clock is rising
 # second bit (from right) = CPOL = 0 --> clock is kept low when idle
 wait_10_milli = 0.015  # 15 ms
@@ -114,6 +89,94 @@ wait_10_micro = 1e-06
 wait_reset_SPI_buffer = 3  # seconds
 time_available_for_initiate_transmission = 10  # seconds - timeout for SPI response
 
+# The sensors of a same bus (CE0 and CE1) can be used from different threads: one SPI transfer at a time per bus
+bus_locks = {}  # lock of each bus already in use, by bus number
+bus_locks_lock = threading.Lock()
+
+
+def get_bus_lock(bus_number):
+    """
+    Give the lock shared by all the sensors of a SPI bus, create it at the first call
+    :param bus_number: number of the SPI bus (0 on the Raspberry Pi 3B+)
+    :return: threading.Lock
+    """
+    with bus_locks_lock:
+        if bus_number not in bus_locks:
+            bus_locks[bus_number] = threading.Lock()
+        return bus_locks[bus_number]
+
+# ----------------------------------------------
+# SPI POLLING
+# ----------------------------------------------
+# After a command byte, the OPC-N3 answers 'busy' (0x31) until it is ready (0xF3). Instead of always waiting
+# 15 ms between two polls, the first wait is the usual time the sensor needs for this command (median of the last
+# initiations answered 'busy', see 'CommandStatistics'), then the wait is doubled after each 'busy' answer.
+# The counters of each command (busy polls, resets, time to ready) are given by transmission_statistics().
+min_poll_delay = 0.002  # seconds - shortest wait between two polls
+max_poll_delay = 0.1  # seconds - longest wait between two polls
+busy_time_before_reset = 1  # seconds of 'busy' answers before resetting the SPI buffer
+statistics_window = 100  # number of initiations used for the time to ready
+
+# ----------------------------------------------
+# HISTOGRAM FRAME
+# ----------------------------------------------
+# The histogram is read in one single SPI transaction and decoded in one go (see sensor documentation)
+# All values are little endian:
+# 24 bins (16 bits), 4 MToF (8 bits), sampling time, sample flow rate, temperature, relative humidity (16 bits),
+# PM 1, PM 2.5, PM 10 (IEEE 754 float), reject count glitch, long TOF, ratio, out of range, fan revolution count,
+# laser status (16 bits) and the checksum (16 bits)
+histogram_struct = struct.Struct('<24H4B4H3f6HH')
+histogram_length = histogram_struct.size  # 86 bytes
+histogram_request = [0x00] * histogram_length  # bytes sent while reading, always the same
+# ----------------------------------------------
+# MODES
+# ----------------------------------------------
+HISTOGRAM = 'histogram'  # one histogram (bins, PM, flow rate...) per measurement
+PM_ONLY = 'PM only'  # PM read in the background every PM_reading_period seconds, mean and max per measurement
+modes = (HISTOGRAM, PM_ONLY)
+
+
+# 'PM only' frame: PM 1, PM 2.5, PM 10 (IEEE 754 float) and the checksum (16 bits), little endian
+PM_struct = struct.Struct('<3fH')
+PM_length = PM_struct.size  # 14 bytes
+PM_request = [0x32] * PM_length  # bytes sent while reading, always the same
+
+# ----------------------------------------------
+# CONTINUOUS SAMPLING
+# ----------------------------------------------
+# Each reading of the histogram empties the buffer of the OPC-N3: it ends the sample and starts the next one.
+# If the fan and the laser are kept on between the measurements, reading the histogram once per cycle gives samples
+# following each other, without any time during which the air is not sampled (and without the fan/laser start).
+# (see 'OPCN3.getdata' and 'OPCN3.read_next_histogram')
+# The sampling time of the histogram is on 16 bits in 1/100 s: it goes back to 0 after 655.35 seconds, so a sample
+# is never longer than that (the fan and the laser are turned off before, see 'OPCN3.idle').
+max_continuous_sample = 650  # seconds, with a margin for the delay of the reading
+
+# ----------------------------------------------
+# PM ONLY
+# ----------------------------------------------
+# The fan and the laser are kept on, and a thread reads the PM (command 0x32, much shorter than the histogram)
+# every PM_reading_period seconds. Each measurement gives the mean and the maximum of the PM read since the
+# previous one: short pollution events (f-e the plume of a ship) are not missed between two measurements.
+
+PM_restart_delay = 5  # seconds to wait before starting again the fan and the laser after an error
+
+# ----------------------------------------------
+# CONFIGURATION OF THE SENSOR
+# ----------------------------------------------
+# The bin boundaries, bin weightings and PM calculation parameters are stored inside the OPC-N3 (command 0x3C).
+# They are read once at start (see 'load_configuration') and kept in a json file, one entry per serial number:
+# at the next starts only the serial number and the firmware version are read, the rest is taken from the file.
+# The values are then available without any SPI communication (see 'get_configuration', 'bin_boundaries').
+
+configuration_cache_file = current_working_directory + "/OPCN3-configurations.json"
+
+# 168 bytes, little endian: bin boundaries (ADC), bin boundaries (µm x 100), bin weightings (x 100),
+# PM A, B, C diameters (µm x 100), max time of flight, AM sampling interval count, AM idle interval count,
+# AM max data arrays in file (16 bits), AM only save PM data, AM fan on in idle, AM laser on in idle,
+# TOF to SFR factor, PVP (particle validation period), bin weighting index (8 bits)
+configuration_struct = struct.Struct('<25H25H24H7H6B')
+configuration_length = configuration_struct.size  # 168 bytes
 
 # if the sensor is disconnected, it can happen that the RPi wait for its answer, which never comes...
 # avoid the system to wait for unlimited time for that answer
@@ -138,335 +201,55 @@ time_available_for_initiate_transmission = 10  # seconds - timeout for SPI respo
 #     # time.sleep(delay)
 
 
-def initiate_transmission(command_byte):
-    """
-    Initiate SPI transmission to the OPC-N3
-    First loop of the Flow Chart
-    :return: TRUE when power state has been initiated
-    """
-    attempts = 1  # sensor is busy loop
-    cycle = 1  # SPI buffer reset loop (going to the right on the flowchart)
-
-    logger.debug("Initiate transmission with command byte " + str(hex(command_byte)))
-
-    stop = time.time() + time_available_for_initiate_transmission
-    # time in seconds at which we consider it took too much time to answer
-
-    # cs_low()  # not used anymore
-
-    while time.time() < stop:
-        # logger.debug("attempts = " + str(attempts))  # disable to reduce the amount of time between spi.xfer
-        reading = spi.xfer([command_byte])  # initiate control of power state
-        # spi.xfer() means write a byte AND READ AT THE SAME TIME
-
-        if reading == [243]:  # SPI ready = 0xF3 = 243
-            time.sleep(wait_10_micro)
-            return True  # indicate that the initiation succeeded
-
-        if reading == [49]:  # SPI busy = 0x31 = 49
-            time.sleep(wait_10_milli)
-            attempts += 1
-
-        elif reading == [230] or reading == [99] or reading == [0]:
-            # During developing, I noticed that these were the answers given by the sensor when the CS line was
-            # facing troubles.
-            # This comes from personal experiment and not from the official documentation
-            # To resolve it, try connecting the CS line directly to the ground (current setting)
-            logger.critical("Problem with the SS (Slave Select) line "
-                            "(error code " + str(hex(reading[0])) + "), skipping")
-            cycle += 1
-            logger.debug("Check that SS line is well kept DOWN (0V) during transmission."
-                         " Try again by connecting SS Line of sensor to Ground")
-            print("Waiting SPI Buffer reset", end='\r')
-            time.sleep(wait_reset_SPI_buffer)
-            return False
-
-        else:
-            logger.critical(
-                "Failed to initiate transmission (unexpected code returned: " + str(hex(reading[0])) + ") (" + str(
-                    cycle) + "/3)")
-            print("Waiting SPI Buffer reset", end='\r')
-            time.sleep(wait_reset_SPI_buffer)
-            cycle += 1  # increment of attempts
-
-        if attempts > 60:
-            # it is recommended to use > 20 in the Alphasense documentation
-            # After experiment it seems that 60 is a good value
-            # (does not take too much time, and let some chance to the sensor to answer READY)
-            logger.error("Failed 60 times to initiate control of power state, reset OPC-N3 SPI buffer, trying again")
-            # cs_high()
-            print("Waiting SPI Buffer reset", end='\r')
-            time.sleep(wait_reset_SPI_buffer)  # time for spi buffer to reset
-
-            attempts = 1  # reset the "SPI busy" loop
-            cycle += 1  # increment of the SPI reset loop
-            # cs_low()
-
-        if cycle >= 3:
-            logger.critical("Failed to initiate transmission (reset 3 times SPI, still error)")
-            return False
-
-    logger.critical("Transmission initiation took too much time (> "
-                    + str(time_available_for_initiate_transmission) + " secs)")
-    return False  # function depending on initiate_transmission function will not continue, indicate error
-
-
-def fan_off():
-    """
-    Turn OFF the fan of the OPC-N3
-    :return: FALSE
-    """
-    print("Turning fan OFF", end='\r')
-    logger.debug("Turning fan OFF")
-    attempts = 1
-
-    while attempts < 4:
-        # logger.debug("attempts = " + str(attempts))  # disable to reduce the amount of time between spi.xfer
-        if initiate_transmission(0x03):
-            reading = spi.xfer([0x02])
-            # cs_high()
-            # spi.close()  # close the serial port to let it available for another device
-            # Avoid opening and closing ports too ofter.
-            # Avoid getting "too much files opened" error after long running time
-            if reading == [0x03]:  # official answer of the OPC-N3
-                print("Fan is OFF                ")
-                # time.sleep(0.5)  # avoid too close communication (AND let some time to the OPC-N3 to stop the fan)
-                return False
-            else:
-                time.sleep(1)  # let some time to the OPC-N3 (to try to stop the fan)
-                reading = read_DAC_power_status('fan')
-                if reading == 0:
-                    return False
-                elif reading == 1:
-                    attempts += 1
-                    logger.warning("Failed to stop the fan, trying again...")
-                    print("Waiting SPI Buffer reset", end='\r')
-                    time.sleep(wait_reset_SPI_buffer)
-                else:
-                    attempts += 1
-                    print("Waiting SPI Buffer reset", end='\r')
-                    time.sleep(wait_reset_SPI_buffer)
-            if attempts >= 3:
-                logger.critical("Failed 3 consecutive times to stop the fan")
-                return True
-        else:
-            logger.critical("Failed to stop the fan (transmission problem)")
-            return True
-    return True
-
-
-def fan_on():
+class CommandStatistics:
     """
-    Turn ON the fan of the OPC-N3 ON.
-    :return: TRUE
+    Counters of the transmission initiations of one command byte, to tune the SPI waits from the data
     """
-    print("Turning fan ON", end='\r')
-    logger.debug("Turning fan ON")
-
-    attempts = 1
-
-    while attempts < 4:
-        # logger.debug("attempts = " + str(attempts))  # disable to reduce the amount of time between spi.xfer
-        if initiate_transmission(0x03):
-            logger.debug("attempts = " + str(attempts))
-            reading = spi.xfer([0x03])
-            # cs_high()
-            # spi.close()  # close the serial port to let it available for another device
-            # Avoid opening and closing ports too ofter.
-            # Avoid getting "too much files opened" error after long running time
-            time.sleep(0.6)  # wait > 600 ms to let the fan start
-            if reading == [0x03]:  # official answer of the OPC-N3
-                print("Fan is ON               ")
-                time.sleep(0.5)  # avoid too close communication
-                return True  # indicate that fan has started
-            else:
-                time.sleep(1)  # let time to the OPC-N3 to try to start the fan
-                reading = read_DAC_power_status('fan')
-                if reading == 1:
-                    return True  # indicate that fan has started
-                elif reading == 0:
-                    logger.error("Failed to start the fan...")
-                    attempts += 1
-                    print("Waiting SPI Buffer reset", end='\r')
-                    time.sleep(wait_reset_SPI_buffer)
-                else:
-                    attempts += 1
-                    print("Waiting SPI Buffer reset", end='\r')
-                    time.sleep(wait_reset_SPI_buffer)
-            if attempts >= 3:
-                log = "Failed 3 times to start the fan"
-                logger.critical(log)
-                return False  # indicate that fan is OFF
-        else:
-            logger.critical("Failed to start the fan (transmission problem)")
-            return False
-    return True
 
-
-def laser_on():
-    """
-    Turn ON the laser of the OPC-N3.
-    :return: TRUE
-    """
-    print("Turning laser ON", end='\r')
-    logger.debug("Turning laser ON")
-    attempts = 0
-
-    while attempts < 4:
-        # logger.debug("attempts = " + str(attempts))  # disable to reduce the amount of time between spi.xfer
-        if initiate_transmission(0x03):
-            reading = spi.xfer([0x07])
-            # cs_high()
-            # spi.close()  # close the serial port to let it available for another device
-            # Avoid opening and closing ports too ofter.
-            # Avoid getting "too much files opened" error after long running time
-            if reading == [0x03]:
-                print("Laser is ON           ")
-                time.sleep(.5)  # avoid too close communication
-                return True  # indicate that the laser is ON
-            else:
-                time.sleep(1)  # let time to the OPC-N3 to try to start the laser
-                reading = read_DAC_power_status('laser')
-                if reading == 1:
-                    logger.info("Wrong answer received after SPI writing, but laser is well on")
-                    return True  # indicate that the laser is ON
-                elif reading == 0:
-                    logger.error("Failed to start the laser, trying again...")
-                    attempts += 1
-                    print("Waiting SPI Buffer reset", end='\r')
-                    time.sleep(wait_reset_SPI_buffer)
-                else:
-                    attempts += 1
-                    print("Waiting SPI Buffer reset", end='\r')
-                    time.sleep(wait_reset_SPI_buffer)
-            if attempts >= 3:
-                logger.critical("Failed 3 times to start the laser")
-                return False  # indicate that laser is still off
-        else:
-            logger.critical("Failed to start the laser (transmission problem)")
-            return False
-    return False
-
-
-def laser_off():
-    """
-    Turn the laser of the OPC-N3 OFF.
-    :return: FALSE
-    """
-    print("Turning the laser OFF", end='\r')
-    logger.debug("Turning laser OFF")
-    attempts = 0
-
-    while attempts < 4:
-        # logger.debug("attempts = " + str(attempts))  # disable to reduce the amount of time between spi.xfer
-        if initiate_transmission(0x03):
-            reading = spi.xfer([0x06])
-            # cs_high()
-            # spi.close()  # close the serial port to let it available for another device
-            # Avoid opening and closing ports too ofter.
-            # Avoid getting "too much files opened" error after long running time
-            if reading == [0x03]:
-                print("Laser is OFF                    ")
-                # time.sleep(1)  # avoid too close communication
-                return False
-            else:
-                time.sleep(1)  # let time to the OPC-N3 to try to stop the laser
-                reading = read_DAC_power_status('laser')
-                if reading == 0:
-                    logger.info("Wrong answer received after writing, but laser is well off")
-                    return False
-                elif reading == 1:
-                    logger.error("Failed to stop the laser (code returned is " + str(reading) + "), trying again...")
-                    attempts += 1
-                    print("Waiting SPI Buffer reset", end='\r')
-                    time.sleep(wait_reset_SPI_buffer)
-                else:
-                    attempts += 1
-                    print("Waiting SPI Buffer reset", end='\r')
-                    time.sleep(wait_reset_SPI_buffer)
-            if attempts >= 3:
-                logger.critical("Failed 4 times to stop the laser")
-                return True  # indicate that laser is still on
-        else:
-            logger.critical("Failed to stop the laser (transmission problem)")
-            return True
-    return True
-
-
-def read_DAC_power_status(item='all'):
-    """
-    Read the status of the Digital to Analog Converter as well as the Power Status (TRY TO READ ONLY ONCE)
-    :param item: 'fan', 'laser', fanDAC', 'laserDAC', 'laser_switch', 'gain', 'auto_gain_toggle', 'all'
-    :return:
-    """
-    print("Reading DAC power status", end='\r')
-    if initiate_transmission(0x13):
-        response = spi.xfer([0x13, 0x13, 0x13, 0x13, 0x13, 0x13])
-        # cs_high()
-        # spi.close()  # close the serial port to let it available for another device
-        # Avoid opening and closing ports too ofter.
-        # Avoid getting "too much files opened" error after long running time
-        time.sleep(0.5)  # avoid too close communication
-
-        if item == 'fan':
-            logger.debug("DAC power status for " + str(item) + " is " + str(response[0]))
-            return response[0]
-        elif item == 'laser':
-            logger.debug("DAC power status for " + str(item) + " is " + str(response[1]))
-            return response[1]
-        elif item == 'fanDAC':
-            logger.debug("DAC power status for " + str(item) + " is " + str(response[2]))
-            response = 1 - (response[2] / 255) * 100  # see documentation concerning fan pot
-            logger.info("Fan is running at " + str(response) + "% (0 = slow, 100 = fast)")
-            return response
-        elif item == 'laserDAC':
-            logger.debug("DAC power status for " + str(item) + " is " + str(response[3]))
-            response = response[3] / 255 * 100  # see documentation concerning laser pot
-            logger.debug("Laser is at " + str(response) + "% of its maximal power")
-            return response
-        elif item == 'laser_switch':
-            logger.debug("DAC power status for " + str(item) + " is " + str(response[4]))
-            return response[4]
-        elif item == 'gain':
-            response = response[5] & 0x01
-            logger.debug("DAC power status for " + str(item) + " is " + str(response))
-            return response
-        elif item == 'auto_gain_toggle':
-            response = response[5] & 0x02
-            logger.debug("DAC power status for " + str(item) + " is " + str(response))
-            return response
-        elif item is 'all':
-            logger.debug("Full DAC power status is " + str(list(response)))
-            return response
-        else:
-            raise ValueError("Argument of 'read_ADC_power_status' is unknown, check your code!")
-
-    else:
-        print("Waiting SPI Buffer reset", end='\r')
-        time.sleep(wait_reset_SPI_buffer)
-        return False  # indicate an error
+    def __init__(self):
+        self.initiations = 0
+        self.failures = 0
+        self.busy_polls = 0  # total amount of 'busy' answers
+        self.resets = 0  # SPI buffer resets (wait_reset_SPI_buffer), also the ones after a wrong answer
+        # last initiations only (rolling window)
+        self.times_to_ready = deque(maxlen=statistics_window)  # seconds from the first poll to 'ready'
+        self.busy_times_to_ready = deque(maxlen=statistics_window)  # same, for the initiations answered 'busy'
+
+    def first_poll_delay(self):
+        """
+        Wait after the first 'busy' answer: the usual time the OPC-N3 needs to be ready for this command
+        :return: seconds
+        """
+        if not self.busy_times_to_ready:
+            return wait_10_milli  # nothing measured yet
+        delay = timing.percentile(self.busy_times_to_ready, 50)
+        return min(max(delay, min_poll_delay), max_poll_delay)
+
+    def statistics(self):
+        """
+        :return: Dictionary{"initiations", "failures", "busy polls", "resets", "time to ready p50 (ms)",
+                 "time to ready p95 (ms)", "time to ready max (ms)"}
+        """
+        to_return = {
+            "initiations": self.initiations,
+            "failures": self.failures,
+            "busy polls": self.busy_polls,
+            "resets": self.resets
+        }
+        if self.times_to_ready:
+            to_return["time to ready p50 (ms)"] = round(timing.percentile(self.times_to_ready, 50) * 1000, 2)
+            to_return["time to ready p95 (ms)"] = round(timing.percentile(self.times_to_ready, 95) * 1000, 2)
+            to_return["time to ready max (ms)"] = round(max(self.times_to_ready) * 1000, 2)
+        return to_return
 
 
 def digest(data):
     """
-    Calculate the CRC8 Checksum with the given bytes
+    Calculate the CRC16 (Modbus) Checksum with the given bytes (see 'checksum.py')
     :param data: infinite number of bytes to use to calculate the checksum
     :return: checksum
     """
-    crc = 0xFFFF
-
-    for byteCtr in range(0, len(data)):
-        to_xor = int(data[byteCtr])
-        crc ^= to_xor
-        for bit in range(0, 8):
-            if (crc & 1) == 1:
-                crc >>= 1
-                crc ^= 0xA001
-            else:
-                crc >>= 1
-    # log = "Checksum is " + str(crc)
-    # logger.debug(log)
-    return crc & 0xFFFF
+    return checksum.crc16_modbus(data)
 
 
 def check(checksum, *data):
@@ -495,453 +278,1145 @@ def convert_IEEE754(value):
     return answer
 
 
-def loading_bar(name, delay):
+def check_histogram(frame):
     """
-    Show a loading bar on the screen during sampling for example
-    :param name: Text to be shown on the left of the loading bar
-    :param length: Number of increments necessary for the bar to be full
-    :return: nothing
+    Check that the histogram data are correct by comparing the checksums
+    :param frame: the 86 bytes of the histogram
+    :return: True if the data are correct, False if not
     """
-    bar = IncrementalBar(name, max=(2 * delay), suffix='%(elapsed)s/' + str(delay) + ' seconds')
-    for i in range(2 * delay):
-        time.sleep(0.5)
-        bar.next()
-    bar.finish()
-    return
+    checksum = frame[histogram_length - 2] | frame[histogram_length - 1] << 8
+    if digest(frame[:histogram_length - 2]) == checksum:
+        logger.debug("Checksum is correct")
+        return True
+    else:
+        logger.debug("Checksum is wrong")
+        return False
 
 
-def PM_reading():
+def decode_histogram(frame):
     """
-    (BETTER TO USE OPCN3.read_histogram())
-    Read the PM bytes only from the OPC-N3 sensor
-    Read the data and convert them in readable format, checksum enabled
-    Does neither start the fan nor start the laser
-    :return: List[PM 1, PM2.5, PM10]
+    Convert the bytes of the histogram into readable format
+    :param frame: the 86 bytes of the histogram (bytes, bytearray or memoryview)
+    :return: schema.OPCN3Record(PM1, PM25, PM10, temperature, relative_humidity, sampling_time, sample_flow_rate,
+                  bin0..bin23, bin1_MToF..bin7_MToF, reject counts, fan_revolution_count, laser_status)
     """
-    print("YOU SHOULD BETTER USE OPCN3.read_histogram()")
-    attempts = 1
-    while attempts < 4:
-        if initiate_transmission(0x32):
-            PM_A = spi.xfer([0x32, 0x32, 0x32, 0x32])
-            PM_B = spi.xfer([0x32, 0x32, 0x32, 0x32])
-            PM_C = spi.xfer([0x32, 0x32, 0x32, 0x32])
-            checksum = spi.xfer([0x32, 0x32])
-            # spi.close()
-
-            PM1 = round(struct.unpack('f', bytes(PM_A))[0], 3)
-            PM25 = round(struct.unpack('f', bytes(PM_B))[0], 3)
-            PM10 = round(struct.unpack('f', bytes(PM_C))[0], 3)
-
-            if check(checksum, PM_A, PM_B, PM_C):
-                print("PM 1:", PM1, "mg/m3\t|\tPM 2.5:", PM25, "mg/m3\t|\tPM10:", PM10, "mg/m3")
-                time.sleep(0.5)  # avoid too close SPI communication
-                return [PM1, PM25, PM10]
-            if attempts >= 4:
-                log = "PM data wrong 3 consecutive times, skipping PM measurement"
-                logger.critical(log)
-                return ["error", "error", "error"]
-            else:
-                attempts += 1
-                log = "Checksum for PM data is not correct, reading again (" + str(attempts) + "/3)"
-                logger.error(log)
-                time.sleep(0.5)  # avoid too close SPI communication
+    values = histogram_struct.unpack_from(frame)
+    bins = values[0:24]
+    MToF = values[24:28]
+    (sampling_time, sample_flow_rate, temperature, relative_humidity,
+     PM1, PM25, PM10,
+     reject_count_glitch, reject_count_longTOF, reject_count_ratio, reject_count_Out_Of_Range,
+     fan_rev_count, laser_status) = values[28:41]
+
+    # fields in the order of schema.OPCN3_columns
+    return schema.OPCN3Record(
+        # rounding until 2 decimals, as this is the accuracy of the OPC-N3 for PM values
+        round(PM1, 2),
+        round(PM25, 2),
+        round(PM10, 2),
+        round(-45 + 175 * (temperature / (2 ** 16 - 1)), 2),  # conversion in °C
+        round(100 * (relative_humidity / (2 ** 16 - 1)), 2),
+        sampling_time / 100,
+        sample_flow_rate / 100,
+        # This is the amount of air passing through the laser beam, not the total sampling flow rate!
+        *bins,
+        *MToF,
+        reject_count_glitch,
+        reject_count_longTOF,
+        reject_count_ratio,
+        reject_count_Out_Of_Range,
+        fan_rev_count,
+        laser_status,
+    )
+
+
+def print_histogram(data):
+    """
+    Show the decoded histogram on the screen
+    :param data: schema.OPCN3Record returned by decode_histogram()
+    :return: nothing
+    """
+    print("PM 1:\t", data.PM1, " mg/m3", end="\t\t|\t")
+    print("PM 2.5:\t", data.PM25, " mg/m3", end="\t\t|\t")
+    print("PM 10:\t", data.PM10, " mg/m3")
+    print("Temperature:", data.temperature, " °C (PCB Board)\t| \tRelative Humidity:", data.relative_humidity,
+          " %RH (PCB Board)")
+    print(" Sampling period:", data.sampling_time, "seconds", end="\t\t|\t")
+    sample_flow_rate = data.sample_flow_rate
+    print(" Sampling flow rate:", sample_flow_rate, "ml/s |", round(sample_flow_rate * 60, 2), "mL/min |",
+          round(sample_flow_rate * 60 * 60 / 1000, 2), "L/h")
+    print(" Reject count glitch:", data.reject_count_glitch, end="\t\t|\t")
+    print(" Reject count long TOF:", data.reject_count_long_TOF)
+    print(" Reject count ratio:", data.reject_count_ratio, end="\t\t|\t")
+    print(" Reject count Out Of Range:", data.reject_count_out_of_range)
+    print(" Fan revolutions count:", data.fan_revolution_count, end="\t\t|\t")
+    print(" Laser status:", data.laser_status)
+
+    print(" Bin number:\t", end='')
+    for i in range(0, 24):
+        print(getattr(data, "bin" + str(i)), end=", ")
+    print("")  # go to next line
+    print(" MToF:\t\t", end='')
+    for i in range(0, 4):
+        i = (i * 2) + 1
+        print(getattr(data, "bin" + str(i) + "_MToF"), end=", ")
+    print("")  # go to next line
 
 
-def getPM(flushing, sampling_time):
+def join_bytes(list_of_bytes):
     """
-    (BETTER TO USE OPCN3.read_histogram())
-    Get PM measurement from OPC-N3
-    :param flushing: time (seconds) during which the fan runs alone to flush the sensor with fresh air
-    :param sampling_time: time (seconds) during which the laser reads the particulate matter in the air
-    :return: List[PM1, PM2.5, PM10]
+    Join bytes to an integer, from byte 0 to byte infinite (right to left)
+    :param list_of_bytes: list [bytes coming from the spi.readbytes or spi.xfer function]
+    :return: integer concatenated
     """
-    print("YOU SHOULD BETTER USE OPCN3.read_histogram()")
-    try:
-        fan_on()
-        time.sleep(flushing)
-        laser_on()
-        print("Starting sampling")  # will be printed on the same line as "Laser is ON"
-        time.sleep(sampling_time)
-        PM = PM_reading()
-
-        laser_off()
-        fan_off()
-    except SystemExit or KeyboardInterrupt:  # to stop the laser and the fan in case of error or shutting down the program
-        laser_off()
-        fan_off()
-        raise
-    return PM
-
-
-def read_histogram(sampling_period):
+    val = 0
+    for i in reversed(list_of_bytes):
+        val = val << 8 | i
+    return val
+
+
+class OPCN3:
     """
-    Read all the available data of the OPC-N3
-    It first read the histogram to delete the old data remaining in the OPCN3 buffer
-    Then it let the sensor take sample during the defined sampling period
-    Finally it read a last time the histogram data returned by the sensor
-    It decode the bytes returned into readable format
-    It returns everything in a dictionary
-    :param: sampling_period: amount of time time (seconds) during while the fan is running
-    :return: Dictionary{"PM 1", "PM 2.5", "PM 10", "temperature", "relative humidity", "bin", "MToF", "sampling time",
-                  "sample flow rate", "reject count glitch", "reject count longTOF", "reject count ratio",
-                  "reject count out of range", "fan revolution count", "laser status"}
+    One Alphasense OPC-N3 connected to the SPI bus
+    The SPI port is opened at the first communication (and not when the object is created)
     """
-    logger.debug("Reading histogram...")
-    print("Reading histogram...", end='\r')
-
-    # Create a dictionary containing data to be returned in case of error
-    to_return = {
-        "PM 1": "error",
-        "PM 2.5": "error",
-        "PM 10": "error",
-        "temperature": "error",
-        "relative humidity": "error",
-        "sampling time": "error",
-        "sample flow rate": "error",
-        "reject count glitch": "error",
-        "reject count long TOF": "error",
-        "reject count ratio": "error",
-        "reject count out of range": "error",
-        "fan revolution count": "error",
-        "laser status": "error",
-        "bin 0": "error",
-        "bin 1": "error",
-        "bin 2": "error",
-        "bin 3": "error",
-        "bin 4": "error",
-        "bin 5": "error",
-        "bin 6": "error",
-        "bin 7": "error",
-        "bin 8": "error",
-        "bin 9": "error",
-        "bin 10": "error",
-        "bin 11": "error",
-        "bin 12": "error",
-        "bin 13": "error",
-        "bin 14": "error",
-        "bin 15": "error",
-        "bin 16": "error",
-        "bin 17": "error",
-        "bin 18": "error",
-        "bin 19": "error",
-        "bin 20": "error",
-        "bin 21": "error",
-        "bin 22": "error",
-        "bin 23": "error",
-        "bin 1 MToF": "error",
-        "bin 3 MToF": "error",
-        "bin 5 MToF": "error",
-        "bin 7 MToF": "error"
-    }
-
-    # Delete old histogram data and start a new one
-    if initiate_transmission(0x30):
-        answer = spi.xfer([0x00] * 86)
-        logger.debug("SPI reading is:\r" + str(answer))
-        # spi.close()
-        logger.debug("Old histogram in the OPC-N3 deleted, starting a new one")
-    else:
-        logger.critical("Failed to initiate histogram, skipping this measurement")
-        return to_return  # indicate clearly an error in the data recording
-
-    delay = sampling_period * 2  # you must wait two times the sampling_period in order that
-    # the sampling time given by the OPC-N3 respects your sampling time wishes
-    # first 5 seconds are with low gain, and the next seconds are with high gain (automatically performed by OPC-N3)
-    print("                                             ", end='\r')  # remove last line
-
-    # Reading the histogram delete all the data in the OPCN3's buffer
-    # If the checksum is wrong, seacanairy don't get the data as expected
-    # Nevertheless, OPCN3 clean its buffer and all data are lost
-    # So you must wait another x seconds to get sample
-    if not take_new_sample_if_checksum_is_wrong:
-        loading_bar('Sampling PM', delay)
-
-    attempts = 1  # reset the counter for next measurement
-    while attempts < 4:
-        # If the user want to take a nex sample in case the checksum is wrong (see explanation above), then
-        # the system must wait the required amount of time in the reading loop
-        if take_new_sample_if_checksum_is_wrong:
-            loading_bar('Sampling PM', delay)
-
-        if initiate_transmission(0x30):
-            # read all the bytes and store them in a dedicated variable
-            # see sensor documentation for more info
-            bin = spi.xfer([0x00] * 48)
-            MToF = spi.xfer([0x00] * 4)
-            sampling_time = spi.xfer([0x00] * 2)
-            sample_flow_rate = spi.xfer([0x00] * 2)
-            temperature = spi.xfer([0x00] * 2)
-            relative_humidity = spi.xfer([0x00] * 2)
-            PM_A = spi.xfer([0x00] * 4)
-            PM_B = spi.xfer([0x00] * 4)
-            PM_C = spi.xfer([0x00] * 4)
-            reject_count_glitch = spi.xfer([0x00] * 2)
-            reject_count_longTOF = spi.xfer([0x00] * 2)
-            reject_count_ratio = spi.xfer([0x00] * 2)
-            reject_count_Out_Of_Range = spi.xfer([0x00] * 2)
-            fan_rev_count = spi.xfer([0x00] * 2)
-            laser_status = spi.xfer([0x00] * 2)
-            checksum = spi.xfer([0x00] * 2)
-            # spi.close()
 
-            # check that the data transmitted are correct by comparing the checksums
-            # if the checksum is correct, then proceed...
-            if check(checksum, bin, MToF, sampling_time, sample_flow_rate, temperature, relative_humidity,
-                     PM_A, PM_B,
-                     PM_C, reject_count_glitch, reject_count_longTOF, reject_count_ratio, reject_count_Out_Of_Range,
-                     fan_rev_count, laser_status):
-                logger.debug("SPI reading is:\r" + str(bin) + " " + str(MToF) + " " + str(sampling_time)
-                             + " " + str(sample_flow_rate) + " " + str(temperature) + " " + str(relative_humidity)
-                             + " " + str(PM_A) + " " + str(PM_B) + " " + str(PM_C) + " " + str(reject_count_glitch)
-                             + " " + str(reject_count_longTOF) + " " + str(reject_count_ratio) + " "
-                             + str(reject_count_Out_Of_Range) + " " + str(fan_rev_count)
-                             + " " + str(laser_status))
-                # return TRUE if the data are correct, and execute the below
-
-                # decode the bytes according to the IEEE 754 32 bytes floating point format into decimals
-                # rounding until 2 decimals, as this is the accuracy of the OPC-N3 for PM values
-                PM1 = round(struct.unpack('f', bytes(PM_A))[0], 2)
-                PM25 = round(struct.unpack('f', bytes(PM_B))[0], 2)
-                PM10 = round(struct.unpack('f', bytes(PM_C))[0], 2)
-                print("PM 1:\t", PM1, " mg/m3", end="\t\t|\t")
-                print("PM 2.5:\t", PM25, " mg/m3", end="\t\t|\t")
-                print("PM 10:\t", PM10, " mg/m3")
-
-                relative_humidity = round(100 * (join_bytes(relative_humidity) / (2 ** 16 - 1)), 2)
-                temperature = round(-45 + 175 * (join_bytes(temperature) / (2 ** 16 - 1)), 2)  # conversion in °C
-                print("Temperature:", temperature, " °C (PCB Board)\t| \tRelative Humidity:", relative_humidity,
-                      " %RH (PCB Board)")
-
-                sampling_time = join_bytes(sampling_time) / 100
-                print(" Sampling period:", sampling_time, "seconds", end="\t\t|\t")
-                sample_flow_rate = join_bytes(sample_flow_rate) / 100
-                print(" Sampling flow rate:", sample_flow_rate, "ml/s |", round(sample_flow_rate * 60, 2), "mL/min |",
-                      round(sample_flow_rate * 60 * 60 / 1000, 2), "L/h")
-                # This is the amount of air passing through the laser beam, not the total sampling flow rate!
-
-                reject_count_glitch = join_bytes(reject_count_glitch)
-                print(" Reject count glitch:", reject_count_glitch, end="\t\t|\t")
-                reject_count_longTOF = join_bytes(reject_count_longTOF)
-                print(" Reject count long TOF:", reject_count_longTOF)
-                reject_count_ratio = join_bytes(reject_count_ratio)
-                print(" Reject count ratio:", reject_count_ratio, end="\t\t|\t")
-                reject_count_Out_Of_Range = join_bytes(reject_count_Out_Of_Range)
-                print(" Reject count Out Of Range:", reject_count_Out_Of_Range)
-                fan_rev_count = join_bytes(fan_rev_count)
-                print(" Fan revolutions count:", fan_rev_count, end="\t\t|\t")
-                laser_status = join_bytes(laser_status)
-                print(" Laser status:", laser_status)
-
-                to_return = {
-                    "PM 1": PM1,
-                    "PM 2.5": PM25,
-                    "PM 10": PM10,
-                    "temperature": temperature,
-                    "relative humidity": relative_humidity,
-                    "sampling time": sampling_time,
-                    "sample flow rate": sample_flow_rate,
-                    "reject count glitch": reject_count_glitch,
-                    "reject count long TOF": reject_count_longTOF,
-                    "reject count ratio": reject_count_ratio,
-                    "reject count out of range": reject_count_Out_Of_Range,
-                    "fan revolution count": fan_rev_count,
-                    "laser status": laser_status,
-                    "bin 0": join_bytes(bin[0:1]),
-                    "bin 1": join_bytes(bin[2:3]),
-                    "bin 2": join_bytes(bin[4:5]),
-                    "bin 3": join_bytes(bin[6:7]),
-                    "bin 4": join_bytes(bin[8:9]),
-                    "bin 5": join_bytes(bin[10:11]),
-                    "bin 6": join_bytes(bin[12:13]),
-                    "bin 7": join_bytes(bin[14:15]),
-                    "bin 8": join_bytes(bin[16:17]),
-                    "bin 9": join_bytes(bin[18:19]),
-                    "bin 10": join_bytes(bin[20:21]),
-                    "bin 11": join_bytes(bin[22:23]),
-                    "bin 12": join_bytes(bin[24:25]),
-                    "bin 13": join_bytes(bin[26:27]),
-                    "bin 14": join_bytes(bin[28:29]),
-                    "bin 15": join_bytes(bin[30:31]),
-                    "bin 16": join_bytes(bin[32:33]),
-                    "bin 17": join_bytes(bin[34:35]),
-                    "bin 18": join_bytes(bin[36:37]),
-                    "bin 19": join_bytes(bin[38:39]),
-                    "bin 20": join_bytes(bin[40:41]),
-                    "bin 21": join_bytes(bin[42:43]),
-                    "bin 22": join_bytes(bin[44:45]),
-                    "bin 23": join_bytes(bin[46:47]),
-                    "bin 1 MToF": MToF[0],
-                    "bin 3 MToF": MToF[1],
-                    "bin 5 MToF": MToF[2],
-                    "bin 7 MToF": MToF[3],
-                }
+    def __init__(self, device=chip_select, bus_number=bus, settings_of_the_sensor=None, name='OPC-N3',
+                 archive_frames=False):
+        """
+        :param device: SS (Slave Select) pin of the sensor: 0 = CE0, 1 = CE1
+        :param bus_number: SPI bus (0 on the Raspberry Pi 3B+)
+        :param settings_of_the_sensor: Optional: Dictionary with the keys of 'OPC-N3 sensor' in
+                                       'seacanairy_settings.yaml', the settings of the file if None
+        :param name: name of the sensor in the log messages
+        :param archive_frames: True to keep the raw frames in the archive (see 'frame_archive.py'). The archive does
+                               not tell the sensors apart: only the sensor of the settings ('sensor') keeps them
+        """
+        if settings_of_the_sensor is None:
+            settings_of_the_sensor = sensor_settings
+        self.device = device
+        self.bus_number = bus_number
+        self.name = name
+        self.archive_frames = archive_frames
+        self.logger = logs.get_logger(name, settings_of_the_sensor['Store debug messages (important increase of logs)'])
+
+        self.flushing_time = settings_of_the_sensor['Flushing time']
+        self.take_new_sample_if_checksum_is_wrong = settings_of_the_sensor[
+            'Take a new measurement if checksum is wrong (avoid shorter sampling periods when errors)']
+        self.continuous_sampling = settings_of_the_sensor['Keep the fan and laser on between the measurements']
+        self.power_down_time = \
+            settings_of_the_sensor['Turn them off if the next measurement is in more than (seconds)']
+        self.mode = settings_of_the_sensor['Mode']
+        self.PM_reading_period = settings_of_the_sensor['PM reading period (seconds)']
+        if self.mode not in modes:
+            raise ValueError("Mode of the OPC-N3 must be one of " + str(modes) + ", not " + str(self.mode))
+
+        # SPI
+        self.spi = None  # opened at the first communication (see 'transfer')
+        self.bus_lock = get_bus_lock(bus_number)  # shared with the other sensors of the same bus
+        self.command_statistics = {}  # CommandStatistics of each command byte already sent
+        self.histogram_buffer = bytearray(histogram_length)  # preallocated, receives the bytes of the last reading
+        self.PM_buffer = bytearray(PM_length)  # preallocated, receives the bytes of the last reading
+
+        # continuous sampling
+        self.running = False  # True when the fan and the laser are kept on between the measurements
+        self.sample_start = None  # time.monotonic() of the last reading of the histogram (= start of the sample)
+
+        # 'PM only' mode
+        self.PM_readings = deque(maxlen=10000)  # (PM 1, PM 2.5, PM 10) read since the last measurement
+        self.PM_errors = 0  # wrong readings since the last measurement
+        self.PM_lock = threading.Lock()  # avoid reading the buffer while the reader thread is writing it
+        self.stop_PM_reader = threading.Event()  # set to stop the reader thread
+        self.PM_reader_thread = None
+
+        self.configuration = None  # configuration of the sensor, None until load_configuration()
+
+    def open(self):
+        """
+        Open the SPI port of the sensor (SPI must be enable in the RPi settings beforehand)
+        :return: nothing
+        """
+        spi = spidev.SpiDev()
+        spi.open(self.bus_number, self.device)
+        spi.max_speed_hz = SPI_speed
+        spi.mode = SPI_mode
+        self.spi = spi
+        self.logger.debug("SPI port %s.%s opened", self.bus_number, self.device)
+
+    def close(self):
+        """
+        Close the SPI port, it will be opened again at the next communication
+        :return: nothing
+        """
+        with self.bus_lock:
+            if self.spi is not None:
+                self.spi.close()
+                self.spi = None
+
+    def transfer(self, data):
+        """
+        Write bytes to the sensor AND read the bytes it sends at the same time (spi.xfer), the other sensors of the
+        bus wait until the transfer is finished
+        :param data: List[bytes sent]
+        :return: List[bytes received]
+        """
+        with self.bus_lock:
+            if self.spi is None:
+                self.open()  # kept open: avoid getting "too much files opened" error after long running time
+            return self.spi.xfer(data)
+
+    # ----------------------------------------------
+    # SPI COMMUNICATION
+    # ----------------------------------------------
+
+    def get_command_statistics(self, command_byte):
+        """
+        :param command_byte: command sent to the OPC-N3
+        :return: CommandStatistics of this command, created at the first call
+        """
+        if command_byte not in self.command_statistics:
+            self.command_statistics[command_byte] = CommandStatistics()
+        return self.command_statistics[command_byte]
+
+    def transmission_statistics(self):
+        """
+        Statistics of the transmission initiations since the start, per command byte
+        :return: Dictionary{command byte (hex): Dictionary (see CommandStatistics.statistics())}
+        """
+        return {hex(command_byte): self.command_statistics[command_byte].statistics()
+                for command_byte in sorted(self.command_statistics)}
+
+    def reset_SPI_buffer(self, command_byte):
+        """
+        Wait until the SPI buffer of the OPC-N3 is reset, after a wrong answer of the sensor
+        :param command_byte: command which was sent (for the statistics)
+        :return: nothing
+        """
+        self.get_command_statistics(command_byte).resets += 1
+        print("Waiting SPI Buffer reset", end='\r')
+        time.sleep(wait_reset_SPI_buffer)
 
-                print(" Bin number:\t", end='')
-                for i in range(0, 24):
-                    print(to_return["bin " + str(i)], end=", ")
-                print("")  # go to next line
-                print(" MToF:\t\t", end='')
+    def initiate_transmission(self, command_byte):
+        """
+        Initiate SPI transmission to the OPC-N3
+        First loop of the Flow Chart
+        While the sensor answers 'busy', it is polled again after a short wait, doubled at each 'busy' answer
+        (see 'SPI POLLING')
+        :return: TRUE when power state has been initiated
+        """
+        cycle = 1  # SPI buffer reset loop (going to the right on the flowchart)
+
+        self.logger.debug("Initiate transmission with command byte %s", hex(command_byte))
+
+        statistics = self.get_command_statistics(command_byte)
+        statistics.initiations += 1
+        busy_polls = 0  # 'busy' answers received for this initiation
+
+        start = time.monotonic()
+        stop = start + time_available_for_initiate_transmission
+        # time in seconds at which we consider it took too much time to answer
+        busy_since = start  # the sensor is given busy_time_before_reset seconds to be ready before resetting its buffer
+        delay = statistics.first_poll_delay()
+
+        # cs_low()  # not used anymore
+
+        while time.monotonic() < stop:
+            reading = self.transfer([command_byte])  # initiate control of power state
+            # spi.xfer() means write a byte AND READ AT THE SAME TIME
+
+            if reading == [243]:  # SPI ready = 0xF3 = 243
+                time_to_ready = time.monotonic() - start
+                statistics.times_to_ready.append(time_to_ready)
+                if busy_polls:
+                    statistics.busy_times_to_ready.append(time_to_ready)
+                time.sleep(wait_10_micro)
+                return True  # indicate that the initiation succeeded
+
+            if reading == [49]:  # SPI busy = 0x31 = 49
+                busy_polls += 1
+                statistics.busy_polls += 1
+                time.sleep(delay)
+                delay = min(delay * 2, max_poll_delay)  # exponential backoff
+
+            elif reading == [230] or reading == [99] or reading == [0]:
+                # During developing, I noticed that these were the answers given by the sensor when the CS line was
+                # facing troubles.
+                # This comes from personal experiment and not from the official documentation
+                # To resolve it, try connecting the CS line directly to the ground (current setting)
+                self.logger.critical("Problem with the SS (Slave Select) line (error code %s), skipping",
+                                     hex(reading[0]))
+                cycle += 1
+                self.logger.debug("Check that SS line is well kept DOWN (0V) during transmission."
+                                  " Try again by connecting SS Line of sensor to Ground")
+                self.reset_SPI_buffer(command_byte)
+                statistics.failures += 1
+                return False
 
-                for i in range(0, 4):
-                    i = (i * 2) + 1
-                    print(to_return["bin " + str(i) + " MToF"], end=", ")
-                print("")  # go to next line
+            else:
+                self.logger.critical("Failed to initiate transmission (unexpected code returned: %s) (%s/3)",
+                                     hex(reading[0]), cycle)
+                self.reset_SPI_buffer(command_byte)
+                busy_since = time.monotonic()
+                delay = statistics.first_poll_delay()
+                cycle += 1  # increment of attempts
+
+            if time.monotonic() - busy_since > busy_time_before_reset:
+                # it is recommended to poll > 20 times (10 ms apart) in the Alphasense documentation
+                # After experiment it seems that 60 times (about one second) is a good value
+                # (does not take too much time, and let some chance to the sensor to answer READY)
+                self.logger.error("Sensor still busy after %s polls, reset OPC-N3 SPI buffer, trying again", busy_polls)
+                # cs_high()
+                self.reset_SPI_buffer(command_byte)  # time for spi buffer to reset
+
+                busy_since = time.monotonic()  # reset the "SPI busy" loop
+                delay = statistics.first_poll_delay()
+                cycle += 1  # increment of the SPI reset loop
+                # cs_low()
+
+            if cycle >= 3:
+                self.logger.critical("Failed to initiate transmission (reset 3 times SPI, still error)")
+                statistics.failures += 1
+                return False
 
-                if sampling_time > (sampling_period + 0.5):  # we tolerate a difference of 0.5 seconds
-                    log = "Sampling period of the sensor was " \
-                          + str(round(sampling_time - sampling_period, 2)) + " seconds longer than expected"
-                    logger.warning(log)
+        self.logger.critical("Transmission initiation took too much time (> %s secs)",
+                             time_available_for_initiate_transmission)
+        statistics.failures += 1
+        return False  # function depending on initiate_transmission function will not continue, indicate error
+
+    # ----------------------------------------------
+    # FAN AND LASER
+    # ----------------------------------------------
+
+    def fan_off(self):
+        """
+        Turn OFF the fan of the OPC-N3
+        :return: FALSE
+        """
+        print("Turning fan OFF", end='\r')
+        self.logger.debug("Turning fan OFF")
+        attempts = 1
+
+        while attempts < 4:
+            # logger.debug("attempts = " + str(attempts))  # disable to reduce the amount of time between spi.xfer
+            if self.initiate_transmission(0x03):
+                reading = self.transfer([0x02])
+                # cs_high()
+                # spi.close()  # close the serial port to let it available for another device
+                # Avoid opening and closing ports too ofter.
+                # Avoid getting "too much files opened" error after long running time
+                if reading == [0x03]:  # official answer of the OPC-N3
+                    print("Fan is OFF                ")
+                    # time.sleep(0.5)  # avoid too close communication (AND let some time to the OPC-N3 to stop the fan)
+                    return False
+                else:
+                    time.sleep(1)  # let some time to the OPC-N3 (to try to stop the fan)
+                    reading = self.read_DAC_power_status('fan')
+                    if reading == 0:
+                        return False
+                    elif reading == 1:
+                        attempts += 1
+                        self.logger.warning("Failed to stop the fan, trying again...")
+                        self.reset_SPI_buffer(0x03)
+                    else:
+                        attempts += 1
+                        self.reset_SPI_buffer(0x03)
+                if attempts >= 3:
+                    self.logger.critical("Failed 3 consecutive times to stop the fan")
+                    return True
+            else:
+                self.logger.critical("Failed to stop the fan (transmission problem)")
+                return True
+        return True
 
-                elif sampling_time < (sampling_period - 0.5):
-                    logger.warning("Sampling period of the sensor was "
-                                   + str(round(sampling_period - sampling_time, 2)) + " seconds shorter than expected")
+    def fan_on(self):
+        """
+        Turn ON the fan of the OPC-N3 ON.
+        :return: TRUE
+        """
+        print("Turning fan ON", end='\r')
+        self.logger.debug("Turning fan ON")
+
+        attempts = 1
+
+        while attempts < 4:
+            # logger.debug("attempts = " + str(attempts))  # disable to reduce the amount of time between spi.xfer
+            if self.initiate_transmission(0x03):
+                self.logger.debug("attempts = %s", attempts)
+                reading = self.transfer([0x03])
+                # cs_high()
+                # spi.close()  # close the serial port to let it available for another device
+                # Avoid opening and closing ports too ofter.
+                # Avoid getting "too much files opened" error after long running time
+                time.sleep(0.6)  # wait > 600 ms to let the fan start
+                if reading == [0x03]:  # official answer of the OPC-N3
+                    print("Fan is ON               ")
+                    time.sleep(0.5)  # avoid too close communication
+                    return True  # indicate that fan has started
+                else:
+                    time.sleep(1)  # let time to the OPC-N3 to try to start the fan
+                    reading = self.read_DAC_power_status('fan')
+                    if reading == 1:
+                        return True  # indicate that fan has started
+                    elif reading == 0:
+                        self.logger.error("Failed to start the fan...")
+                        attempts += 1
+                        self.reset_SPI_buffer(0x03)
+                    else:
+                        attempts += 1
+                        self.reset_SPI_buffer(0x03)
+                if attempts >= 3:
+                    log = "Failed 3 times to start the fan"
+                    self.logger.critical(log)
+                    return False  # indicate that fan is OFF
+            else:
+                self.logger.critical("Failed to start the fan (transmission problem)")
+                return False
+        return True
 
-                return to_return
+    def laser_on(self):
+        """
+        Turn ON the laser of the OPC-N3.
+        :return: TRUE
+        """
+        print("Turning laser ON", end='\r')
+        self.logger.debug("Turning laser ON")
+        attempts = 0
+
+        while attempts < 4:
+            # logger.debug("attempts = " + str(attempts))  # disable to reduce the amount of time between spi.xfer
+            if self.initiate_transmission(0x03):
+                reading = self.transfer([0x07])
+                # cs_high()
+                # spi.close()  # close the serial port to let it available for another device
+                # Avoid opening and closing ports too ofter.
+                # Avoid getting "too much files opened" error after long running time
+                if reading == [0x03]:
+                    print("Laser is ON           ")
+                    time.sleep(.5)  # avoid too close communication
+                    return True  # indicate that the laser is ON
+                else:
+                    time.sleep(1)  # let time to the OPC-N3 to try to start the laser
+                    reading = self.read_DAC_power_status('laser')
+                    if reading == 1:
+                        self.logger.info("Wrong answer received after SPI writing, but laser is well on")
+                        return True  # indicate that the laser is ON
+                    elif reading == 0:
+                        self.logger.error("Failed to start the laser, trying again...")
+                        attempts += 1
+                        self.reset_SPI_buffer(0x03)
+                    else:
+                        attempts += 1
+                        self.reset_SPI_buffer(0x03)
+                if attempts >= 3:
+                    self.logger.critical("Failed 3 times to start the laser")
+                    return False  # indicate that laser is still off
+            else:
+                self.logger.critical("Failed to start the laser (transmission problem)")
+                return False
+        return False
 
+    def laser_off(self):
+        """
+        Turn the laser of the OPC-N3 OFF.
+        :return: FALSE
+        """
+        print("Turning the laser OFF", end='\r')
+        self.logger.debug("Turning laser OFF")
+        attempts = 0
+
+        while attempts < 4:
+            # logger.debug("attempts = " + str(attempts))  # disable to reduce the amount of time between spi.xfer
+            if self.initiate_transmission(0x03):
+                reading = self.transfer([0x06])
+                # cs_high()
+                # spi.close()  # close the serial port to let it available for another device
+                # Avoid opening and closing ports too ofter.
+                # Avoid getting "too much files opened" error after long running time
+                if reading == [0x03]:
+                    print("Laser is OFF                    ")
+                    # time.sleep(1)  # avoid too close communication
+                    return False
+                else:
+                    time.sleep(1)  # let time to the OPC-N3 to try to stop the laser
+                    reading = self.read_DAC_power_status('laser')
+                    if reading == 0:
+                        self.logger.info("Wrong answer received after writing, but laser is well off")
+                        return False
+                    elif reading == 1:
+                        self.logger.error("Failed to stop the laser (code returned is %s), trying again...", reading)
+                        attempts += 1
+                        self.reset_SPI_buffer(0x03)
+                    else:
+                        attempts += 1
+                        self.reset_SPI_buffer(0x03)
+                if attempts >= 3:
+                    self.logger.critical("Failed 4 times to stop the laser")
+                    return True  # indicate that laser is still on
             else:
-                # if the function with the checksum return an error (FALSE)
-                logger.warning(
-                    "Error in the data received (wrong checksum), reading histogram again... (" + str(attempts) + "/3)")
-                logger.warning("Data received were:\n" + str(bin) + str(MToF) + str(sampling_time) +
-                               str(sample_flow_rate) + str(temperature) +
-                               str(relative_humidity) + str(PM_A) + str(PM_B) +
-                               str(PM_C) + str(reject_count_glitch) +
-                               str(reject_count_longTOF) + str(reject_count_ratio) +
-                               str(reject_count_Out_Of_Range) + str(fan_rev_count) +
-                               str(laser_status) + str(checksum))
-                print("Waiting SPI Buffer reset", end='\r')
-                time.sleep(wait_reset_SPI_buffer)  # let some times between two SPI communications
-                attempts += 1
-        else:
-            logger.critical("Failed to read histogram (transmission initiation problem)")
-            return to_return
+                self.logger.critical("Failed to stop the laser (transmission problem)")
+                return True
+        return True
 
-        if attempts >= 3:
-            logger.error("Data were wrong 3 times (wrong checksum), skipping this histogram reading")
-            logger.warning("Data received were:\n" + str(bin) + str(MToF) + str(sampling_time) +
-                           str(sample_flow_rate) + str(temperature) +
-                           str(relative_humidity) + str(PM_A) + str(PM_B) +
-                           str(PM_C) + str(reject_count_glitch) +
-                           str(reject_count_longTOF) + str(reject_count_ratio) +
-                           str(reject_count_Out_Of_Range) + str(fan_rev_count) +
-                           str(laser_status) + str(checksum))
-            print("Waiting SPI Buffer reset", end='\r')
-            time.sleep(wait_reset_SPI_buffer)
-            return to_return
+    def read_DAC_power_status(self, item='all'):
+        """
+        Read the status of the Digital to Analog Converter as well as the Power Status (TRY TO READ ONLY ONCE)
+        :param item: 'fan', 'laser', fanDAC', 'laserDAC', 'laser_switch', 'gain', 'auto_gain_toggle', 'all'
+        :return:
+        """
+        print("Reading DAC power status", end='\r')
+        if self.initiate_transmission(0x13):
+            response = self.transfer([0x13, 0x13, 0x13, 0x13, 0x13, 0x13])
+            # cs_high()
+            # spi.close()  # close the serial port to let it available for another device
+            # Avoid opening and closing ports too ofter.
+            # Avoid getting "too much files opened" error after long running time
+            time.sleep(0.5)  # avoid too close communication
+
+            if item == 'fan':
+                self.logger.debug("DAC power status for %s is %s", item, response[0])
+                return response[0]
+            elif item == 'laser':
+                self.logger.debug("DAC power status for %s is %s", item, response[1])
+                return response[1]
+            elif item == 'fanDAC':
+                self.logger.debug("DAC power status for %s is %s", item, response[2])
+                response = 1 - (response[2] / 255) * 100  # see documentation concerning fan pot
+                self.logger.info("Fan is running at %s%% (0 = slow, 100 = fast)", response)
+                return response
+            elif item == 'laserDAC':
+                self.logger.debug("DAC power status for %s is %s", item, response[3])
+                response = response[3] / 255 * 100  # see documentation concerning laser pot
+                self.logger.debug("Laser is at %s%% of its maximal power", response)
+                return response
+            elif item == 'laser_switch':
+                self.logger.debug("DAC power status for %s is %s", item, response[4])
+                return response[4]
+            elif item == 'gain':
+                response = response[5] & 0x01
+                self.logger.debug("DAC power status for %s is %s", item, response)
+                return response
+            elif item == 'auto_gain_toggle':
+                response = response[5] & 0x02
+                self.logger.debug("DAC power status for %s is %s", item, response)
+                return response
+            elif item is 'all':
+                self.logger.debug("Full DAC power status is %s", list(response))
+                return response
+            else:
+                raise ValueError("Argument of 'read_ADC_power_status' is unknown, check your code!")
 
+        else:
+            self.reset_SPI_buffer(0x13)
+            return False  # indicate an error
+
+    def set_fan_speed(self, speed):
+        """
+        Define the speed of the builtin sensor fan
+        Define yourself the fan speed to reduce as much as possible dust deposition in the casing
+        Argument in percent, calibrated from the slowest as possible to the fastest
+        :param speed: number between 0 and 100 (0 = slowest, 100 = fastest)
+        :return: nothing
+        """
+        if speed < 0 or speed > 100:
+            raise ValueError("Fan speed of OPC-N3 sensor must be a number between 0 and 100 "
+                             "(0 = slowest, 100 = fastest")
+        value = int((45 + speed / 100 * 55) / 100 * 255)
+        # Personal investigations shows that the fan don't work below 45%
+        # Formula makes a calculation to convert 0% as 45% --> easier for user input
+        if self.initiate_transmission(0x42):
+            reading = self.transfer([0, value])
+            self.logger.info("Fan speed is set on %s (0 = the slowest, 100 = the fastest)", speed)
+        else:
+            self.logger.error("Failed to set the fan speed")
+
+    # ----------------------------------------------
+    # HISTOGRAM
+    # ----------------------------------------------
+
+    def PM_reading(self):
+        """
+        (BETTER TO USE OPCN3.read_histogram())
+        Read the PM bytes only from the OPC-N3 sensor
+        Read the data and convert them in readable format, checksum enabled
+        Does neither start the fan nor start the laser
+        :return: List[PM 1, PM2.5, PM10]
+        """
+        print("YOU SHOULD BETTER USE OPCN3.read_histogram()")
+        attempts = 1
+        while attempts < 4:
+            if self.initiate_transmission(0x32):
+                PM_A = self.transfer([0x32, 0x32, 0x32, 0x32])
+                PM_B = self.transfer([0x32, 0x32, 0x32, 0x32])
+                PM_C = self.transfer([0x32, 0x32, 0x32, 0x32])
+                checksum = self.transfer([0x32, 0x32])
+                # spi.close()
+
+                PM1 = round(struct.unpack('f', bytes(PM_A))[0], 3)
+                PM25 = round(struct.unpack('f', bytes(PM_B))[0], 3)
+                PM10 = round(struct.unpack('f', bytes(PM_C))[0], 3)
+
+                if check(checksum, PM_A, PM_B, PM_C):
+                    print("PM 1:", PM1, "mg/m3\t|\tPM 2.5:", PM25, "mg/m3\t|\tPM10:", PM10, "mg/m3")
+                    time.sleep(0.5)  # avoid too close SPI communication
+                    return [PM1, PM25, PM10]
+                if attempts >= 4:
+                    log = "PM data wrong 3 consecutive times, skipping PM measurement"
+                    self.logger.critical(log)
+                    return ["error", "error", "error"]
+                else:
+                    attempts += 1
+                    log = "Checksum for PM data is not correct, reading again (" + str(attempts) + "/3)"
+                    self.logger.error(log)
+                    time.sleep(0.5)  # avoid too close SPI communication
+
+    def getPM(self, flushing, sampling_time):
+        """
+        (BETTER TO USE OPCN3.read_histogram())
+        Get PM measurement from OPC-N3
+        :param flushing: time (seconds) during which the fan runs alone to flush the sensor with fresh air
+        :param sampling_time: time (seconds) during which the laser reads the particulate matter in the air
+        :return: List[PM1, PM2.5, PM10]
+        """
+        print("YOU SHOULD BETTER USE OPCN3.read_histogram()")
+        try:
+            self.fan_on()
+            time.sleep(flushing)
+            self.laser_on()
+            print("Starting sampling")  # will be printed on the same line as "Laser is ON"
+            time.sleep(sampling_time)
+            PM = self.PM_reading()
+
+            self.laser_off()
+            self.fan_off()
+        except SystemExit or KeyboardInterrupt:
+            # to stop the laser and the fan in case of error or shutting down the program
+            self.laser_off()
+            self.fan_off()
+            raise
+        return PM
+
+    def read_histogram_frame(self):
+        """
+        Read the 86 bytes of the histogram in one single SPI transaction
+        The transmission must be initiated before (initiate_transmission(0x30))
+        :return: memoryview of the bytes read (valid until the next reading)
+        """
+        self.histogram_buffer[:] = self.transfer(histogram_request)
+        self.sample_start = time.monotonic()  # the OPC-N3 starts a new sample as soon as the histogram is read
+        if self.archive_frames:
+            frame_archive.record(frame_archive.OPC_HISTOGRAM, self.histogram_buffer)
+        return memoryview(self.histogram_buffer)
+
+    def read_histogram(self, sampling_period):
+        """
+        Read all the available data of the OPC-N3
+        It first read the histogram to delete the old data remaining in the OPCN3 buffer
+        Then it let the sensor take sample during the defined sampling period
+        Finally it read a last time the histogram data returned by the sensor
+        It decode the bytes returned into readable format
+        It returns everything in a record
+        :param: sampling_period: amount of time time (seconds) during while the fan is running
+        :return: schema.OPCN3Record (see 'schema.py'), all the fields are None in case of error
+        """
+        self.logger.debug("Reading histogram...")
+        print("Reading histogram...", end='\r')
+
+        to_return = schema.OPCN3Record()  # all the fields are None (= "error") in case of error
+
+        # Delete old histogram data and start a new one
+        with timing.phase("OPC histogram read"):
+            initiated = self.initiate_transmission(0x30)
+            if initiated:
+                answer = self.read_histogram_frame()
+        if initiated:
+            if self.logger.isEnabledFor(logging.DEBUG):  # the list of the 86 bytes is only created if it is logged
+                self.logger.debug("SPI reading is:\r%s", list(answer))
+            # spi.close()
+            self.logger.debug("Old histogram in the OPC-N3 deleted, starting a new one")
+        else:
+            self.logger.critical("Failed to initiate histogram, skipping this measurement")
+            return to_return  # indicate clearly an error in the data recording
+
+        delay = sampling_period * 2  # you must wait two times the sampling_period in order that
+        # the sampling time given by the OPC-N3 respects your sampling time wishes
+        # first 5 seconds are with low gain, and the next seconds are with high gain (automatically performed by OPC-N3)
+        print("                                             ", end='\r')  # remove last line
+
+        # Reading the histogram delete all the data in the OPCN3's buffer
+        # If the checksum is wrong, seacanairy don't get the data as expected
+        # Nevertheless, OPCN3 clean its buffer and all data are lost
+        # So you must wait another x seconds to get sample
+        if not self.take_new_sample_if_checksum_is_wrong:
+            with timing.phase("OPC histogram wait"):
+                loading_bar('Sampling PM', delay)
+
+        attempts = 1  # reset the counter for next measurement
+        while attempts < 4:
+            # If the user want to take a nex sample in case the checksum is wrong (see explanation above), then
+            # the system must wait the required amount of time in the reading loop
+            if self.take_new_sample_if_checksum_is_wrong:
+                with timing.phase("OPC histogram wait"):
+                    loading_bar('Sampling PM', delay)
+
+            with timing.phase("OPC histogram read"):
+                initiated = self.initiate_transmission(0x30)
+                if initiated:
+                    # read all the bytes in one single transaction (see sensor documentation for more info)
+                    frame = self.read_histogram_frame()
+
+            if initiated:
+                # check that the data transmitted are correct by comparing the checksums
+                # if the checksum is correct, then proceed...
+                if check_histogram(frame):
+                    if self.logger.isEnabledFor(logging.DEBUG):
+                        self.logger.debug("SPI reading is:\r%s", list(frame))
+                    # return TRUE if the data are correct, and execute the below
+
+                    # decode the bytes (IEEE 754 floats for the PM, integers for the others) into readable format
+                    to_return = decode_histogram(frame)
+                    print_histogram(to_return)
+
+                    sampling_time = to_return.sampling_time
+                    if sampling_time > (sampling_period + 0.5):  # we tolerate a difference of 0.5 seconds
+                        log = "Sampling period of the sensor was " \
+                              + str(round(sampling_time - sampling_period, 2)) + " seconds longer than expected"
+                        self.logger.warning(log)
+
+                    elif sampling_time < (sampling_period - 0.5):
+                        self.logger.warning("Sampling period of the sensor was %s seconds shorter than expected",
+                                            round(sampling_period - sampling_time, 2))
+
+                    return to_return
 
-def getdata(flushing_time, sampling_time):
-    """
-    Get all the possible data from the OPC-N3 sensor
-    Start the fan, start the laser, get the data, turn off the laser and the fan
-    :param flushing_time: time during which the ventilator is running without sampling
-                            to refresh the air inside the casing
-    :param sampling_time: time during which the sensor is sampling
-    :return: Dictionary{"PM 1", "PM 2.5", "PM 10", "temperature", "relative humidity", "bin", "MToF", "sampling time",
-                  "sample flow rate", "reject count glitch", "reject count longTOF", "reject count ratio",
-                  "reject count out of range", "fan revolution count", "laser status"}
-    """
-    # return "error" everywhere in case of error during the measurement (fan_on/laser_on/read_histogram...)
-    # seacanairy.py need to find the items in the dictionary, if not if crash
-    to_return = {
-        "PM 1": "error",
-        "PM 2.5": "error",
-        "PM 10": "error",
-        "temperature": "error",
-        "relative humidity": "error",
-        "sampling time": "error",
-        "sample flow rate": "error",
-        "reject count glitch": "error",
-        "reject count long TOF": "error",
-        "reject count ratio": "error",
-        "reject count out of range": "error",
-        "fan revolution count": "error",
-        "laser status": "error",
-        "bin 0": "error",
-        "bin 1": "error",
-        "bin 2": "error",
-        "bin 3": "error",
-        "bin 4": "error",
-        "bin 5": "error",
-        "bin 6": "error",
-        "bin 7": "error",
-        "bin 8": "error",
-        "bin 9": "error",
-        "bin 10": "error",
-        "bin 11": "error",
-        "bin 12": "error",
-        "bin 13": "error",
-        "bin 14": "error",
-        "bin 15": "error",
-        "bin 16": "error",
-        "bin 17": "error",
-        "bin 18": "error",
-        "bin 19": "error",
-        "bin 20": "error",
-        "bin 21": "error",
-        "bin 22": "error",
-        "bin 23": "error",
-        "bin 1 MToF": "error",
-        "bin 3 MToF": "error",
-        "bin 5 MToF": "error",
-        "bin 7 MToF": "error"
-    }
-    try:  # necessary to put an except condition (see below)
-        if fan_on():
-            print("Flushing fresh air", end='\r')
-            time.sleep(flushing_time / 2)
-            if laser_on():
-                print("Flushing fresh air", end='\r')
-                time.sleep(flushing_time / 2)
-                to_return = read_histogram(sampling_time)
+                else:
+                    # if the function with the checksum return an error (FALSE)
+                    self.logger.warning("Error in the data received (wrong checksum), reading histogram again... "
+                                        "(%s/3)", attempts)
+                    self.logger.warning("Data received were:\n%s", list(frame))
+                    self.reset_SPI_buffer(0x30)  # let some times between two SPI communications
+                    attempts += 1
             else:
-                logger.critical("Skipping histogram reading")
-            laser_off()
-        else:
-            logger.critical("Skipping histogram reading")
-        fan_off()
-        # spi.close()
+                self.logger.critical("Failed to read histogram (transmission initiation problem)")
+                return to_return
+
+            if attempts >= 3:
+                self.logger.error("Data were wrong 3 times (wrong checksum), skipping this histogram reading")
+                self.logger.warning("Data received were:\n%s", list(self.histogram_buffer))
+                self.reset_SPI_buffer(0x30)
+                return to_return
+
+    def read_next_histogram(self):
+        """
+        Continuous sampling: read the histogram sampled since the previous reading
+        The same reading ends this sample and starts the next one
+        :return: schema.OPCN3Record (see 'schema.py'), all the fields are None in case of error
+        """
+        self.logger.debug("Reading histogram...")
+        print("Reading histogram...", end='\r')
+
+        sampled = time.monotonic() - self.sample_start  # time since the previous reading
+
+        with timing.phase("OPC histogram read"):
+            initiated = self.initiate_transmission(0x30)
+            if initiated:
+                frame = self.read_histogram_frame()
+
+        if not initiated:
+            self.logger.critical("Failed to read histogram (transmission initiation problem), "
+                                 "restarting the fan and the laser")
+            self.stop()  # started again at the next measurement
+            return schema.OPCN3Record()
+
+        if not check_histogram(frame):
+            # the OPC-N3 has emptied its buffer anyway: the sample is lost, but the next one is already started
+            self.logger.warning("Error in the data received (wrong checksum), sample of %s seconds lost",
+                                round(sampled, 1))
+            self.logger.warning("Data received were:\n%s", list(frame))
+            return schema.OPCN3Record()
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("SPI reading is:\r%s", list(frame))
+        to_return = decode_histogram(frame)
+        print_histogram(to_return)
+        self.logger.debug("Sampling period of the sensor was %s seconds (%s seconds since the previous reading)",
+                          to_return.sampling_time, round(sampled, 1))
         return to_return
 
-    except(KeyboardInterrupt, SystemExit):  # in case of error AND if user stop the software during sampling
-        # Avoid that the laser and the fan keep running indefinitely if system crash
-        print("  ")  # go to the next line
-        logger.info("Python instance has been stopped, shutting laser and fan OFF...")
-        laser_off()
-        fan_off()
-        raise
+    def stop(self):
+        """
+        Turn the laser and the fan off if they are kept on between the measurements (continuous sampling or 'PM only'
+        mode), after stopping the PM reader thread
+        :return: nothing
+        """
+        self.stop_PM_reader.set()
+        if self.PM_reader_thread is not None:
+            self.PM_reader_thread.join(timeout=time_available_for_initiate_transmission + wait_reset_SPI_buffer)
+        if self.running:
+            self.running = False
+            with timing.phase("OPC fan/laser stop"):
+                self.laser_off()
+                self.fan_off()
+
+    def idle(self, time_before_next_measurement):
+        """
+        Called once the measurement is finished: with continuous sampling, turn the fan and the laser off if the next
+        measurement is far enough (see 'Turn them off if the next measurement is in more than' in the settings), or
+        if the sample would be too long for the sampling time of the histogram (see 'max_continuous_sample')
+        :param time_before_next_measurement: seconds
+        :return: nothing
+        """
+        if self.mode == PM_ONLY or not self.running:
+            return  # the PM are read between the measurements, or the fan and the laser are already off
+        if self.power_down_time and time_before_next_measurement > self.power_down_time:
+            self.logger.info("Next measurement in %s seconds, turning the fan and the laser off until then",
+                             int(time_before_next_measurement))
+            self.stop()
+        elif time.monotonic() - self.sample_start + time_before_next_measurement > max_continuous_sample:
+            self.logger.info("Next measurement in %s seconds, the sample would be longer than the %s seconds of the "
+                             "histogram: turning the fan and the laser off until then",
+                             int(time_before_next_measurement), max_continuous_sample)
+            self.stop()
+
+    def getdata(self, flushing_time, sampling_time):
+        """
+        Get all the possible data from the OPC-N3 sensor
+        Start the fan, start the laser, get the data, turn off the laser and the fan
+        With continuous sampling, the fan and the laser are kept on after the first measurement, and the next
+        measurements only read the histogram sampled since the previous one (see 'read_next_histogram')
+        In 'PM only' mode, give the mean and the maximum of the PM read in the background (see 'get_PM_statistics')
+        :param flushing_time: time during which the ventilator is running without sampling
+                                to refresh the air inside the casing
+        :param sampling_time: time during which the sensor is sampling
+        :return: schema.OPCN3Record (see 'schema.py'), all the fields are None in case of error
+                 schema.OPCN3PMRecord in 'PM only' mode
+        """
+        if self.mode == PM_ONLY:
+            return self.get_PM_statistics()
+        # all the fields are None ("error" in the data file) in case of error during the measurement
+        to_return = schema.OPCN3Record()
+        try:  # necessary to put an except condition (see below)
+            if self.running:
+                return self.read_next_histogram()
+
+            with timing.phase("OPC fan/laser warm-up"):
+                fan_started = self.fan_on()
+                laser_started = False
+                if fan_started:
+                    print("Flushing fresh air", end='\r')
+                    time.sleep(flushing_time / 2)
+                    laser_started = self.laser_on()
+                    if laser_started:
+                        print("Flushing fresh air", end='\r')
+                        time.sleep(flushing_time / 2)
+            if laser_started:
+                to_return = self.read_histogram(sampling_time)
+            else:
+                self.logger.critical("Skipping histogram reading")
+            if self.continuous_sampling and laser_started and self.sample_start is not None:
+                self.running = True  # the last reading of the histogram has started the next sample
+                return to_return
+            with timing.phase("OPC fan/laser stop"):
+                if fan_started:
+                    self.laser_off()
+                self.fan_off()
+            # spi.close()
+            return to_return
 
+        except(KeyboardInterrupt, SystemExit):  # in case of error AND if user stop the software during sampling
+            # Avoid that the laser and the fan keep running indefinitely if system crash
+            print("  ")  # go to the next line
+            self.logger.info("Python instance has been stopped, shutting laser and fan OFF...")
+            self.running = False
+            self.laser_off()
+            self.fan_off()
+            raise
+
+    # ----------------------------------------------
+    # PM ONLY
+    # ----------------------------------------------
+
+    def read_PM_frame(self):
+        """
+        Read the 14 bytes of the PM in one single SPI transaction
+        The transmission must be initiated before (initiate_transmission(0x32))
+        :return: memoryview of the bytes read (valid until the next reading)
+        """
+        self.PM_buffer[:] = self.transfer(PM_request)
+        if self.archive_frames:
+            frame_archive.record(frame_archive.OPC_PM, self.PM_buffer)
+        return memoryview(self.PM_buffer)
+
+    def read_PM(self):
+        """
+        Read the PM once (the fan and the laser must be on)
+        :return: (PM 1, PM 2.5, PM 10) in μg/m³, None in case of error
+        """
+        if not self.initiate_transmission(0x32):
+            return None
+        frame = self.read_PM_frame()
+        if digest(frame[:PM_length - 2]) != frame[PM_length - 2] | frame[PM_length - 1] << 8:
+            self.logger.debug("Checksum of the PM is wrong: %s", list(frame))
+            return None
+        PM1, PM25, PM10 = PM_struct.unpack(frame)[:3]
+        return round(PM1, 2), round(PM25, 2), round(PM10, 2)
+
+    def start_PM_reader(self):
+        """
+        Start the thread reading the PM in the background (nothing happens if it is already running)
+        :return: nothing
+        """
+        if self.PM_reader_thread is not None and self.PM_reader_thread.is_alive():
+            return
+        self.stop_PM_reader.clear()
+        self.PM_reader_thread = threading.Thread(target=self.read_PM_continuously, name=self.name + ' PM reader',
+                                                 daemon=True)
+        self.PM_reader_thread.start()
+        self.logger.debug("PM reader thread started, one reading every %s seconds", self.PM_reading_period)
+
+    def read_PM_continuously(self):
+        """
+        Loop of the PM reader thread
+        Start the fan and the laser (and again after an error), then read the PM every PM_reading_period seconds
+        :return: nothing
+        """
+        next_reading = time.monotonic()
+        while not self.stop_PM_reader.is_set():
+            if not self.running:
+                fan_started = self.fan_on()
+                if fan_started:
+                    self.stop_PM_reader.wait(self.flushing_time / 2)  # flush fresh air
+                    if self.laser_on():
+                        self.running = True
+                        self.stop_PM_reader.wait(self.flushing_time / 2)
+                        next_reading = time.monotonic()
+                        continue
+                self.fan_off()
+                self.logger.critical("Failed to start the fan and the laser, trying again in %s seconds",
+                                     PM_restart_delay)
+                self.stop_PM_reader.wait(PM_restart_delay)
+                continue
+
+            try:
+                PM = self.read_PM()
+            except:
+                self.logger.critical("Failed to read the PM (%s)", sys.exc_info())
+                PM = None
+            with self.PM_lock:
+                if PM is None:
+                    self.PM_errors += 1
+                else:
+                    self.PM_readings.append(PM)
+
+            # readings on a fixed grid, without drift (a late reading does not delay the next ones)
+            next_reading += self.PM_reading_period
+            now = time.monotonic()
+            if next_reading < now:
+                next_reading = now
+            self.stop_PM_reader.wait(next_reading - now)
+
+    def get_PM_statistics(self):
+        """
+        'PM only' mode: mean and maximum of the PM read since the previous measurement
+        :return: schema.OPCN3PMRecord (see 'schema.py'), all the fields are None if no PM was read
+        """
+        if self.PM_reader_thread is None or not self.PM_reader_thread.is_alive():
+            self.start_PM_reader()  # the first values will be given at the next measurement
+
+        with self.PM_lock:
+            readings = list(self.PM_readings)
+            self.PM_readings.clear()
+            errors = self.PM_errors
+            self.PM_errors = 0
+
+        if errors:
+            self.logger.warning("%s PM readings failed since the previous measurement (%s correct)", errors,
+                                len(readings))
+        if not readings:
+            self.logger.error("No PM read since the previous measurement")
+            return schema.OPCN3PMRecord(readings=0)
+
+        PM1, PM25, PM10 = zip(*readings)
+        to_return = schema.OPCN3PMRecord(
+            PM1_mean=round(sum(PM1) / len(PM1), 2),
+            PM25_mean=round(sum(PM25) / len(PM25), 2),
+            PM10_mean=round(sum(PM10) / len(PM10), 2),
+            PM1_max=max(PM1),
+            PM25_max=max(PM25),
+            PM10_max=max(PM10),
+            readings=len(readings)
+        )
+        print("PM 1:", to_return.PM1_mean, "(max", to_return.PM1_max, ") μg/m³\t|\tPM 2.5:", to_return.PM25_mean,
+              "(max", to_return.PM25_max, ") μg/m³\t|\tPM 10:", to_return.PM10_mean, "(max", to_return.PM10_max,
+              ") μg/m³\t|\t", len(readings), "readings")
+        return to_return
 
-def join_bytes(list_of_bytes):
-    """
-    Join bytes to an integer, from byte 0 to byte infinite (right to left)
-    :param list_of_bytes: list [bytes coming from the spi.readbytes or spi.xfer function]
-    :return: integer concatenated
-    """
-    val = 0
-    for i in reversed(list_of_bytes):
-        val = val << 8 | i
-    return val
+    # ----------------------------------------------
+    # CONFIGURATION
+    # ----------------------------------------------
+
+    def read_string(self, command_byte, length=60):
+        """
+        Read a text from the OPC-N3 (serial number, information string)
+        :param command_byte: 0x10 (serial number) or 0x3F (information string)
+        :param length: number of characters sent by the sensor
+        :return: str without the padding, None in case of error
+        """
+        if not self.initiate_transmission(command_byte):
+            return None
+        reading = self.transfer([command_byte] * length)
+        time.sleep(wait_10_milli)  # avoid too close communication
+        return bytes(reading).decode('ascii', errors='replace').strip(' \x00')
+
+    def read_firmware_version(self):
+        """
+        :return: str "major.minor", None in case of error
+        """
+        if not self.initiate_transmission(0x12):
+            return None
+        reading = self.transfer([0x12, 0x12])
+        time.sleep(wait_10_milli)
+        return str(reading[0]) + "." + str(reading[1])
+
+    def read_configuration_variables(self):
+        """
+        Read the configuration variables of the OPC-N3 (command 0x3C)
+        :return: Dictionary (see 'load_configuration'), None in case of error
+        """
+        attempts = 1
+        while attempts < 4:
+            if not self.initiate_transmission(0x3C):
+                return None
+            reading = self.transfer([0x3C] * configuration_length)
+            time.sleep(wait_10_milli)
+            values = configuration_struct.unpack(bytes(reading))
+
+            boundaries = [value / 100 for value in values[25:50]]
+            # no checksum for the configuration: the bin boundaries must at least be increasing
+            if all(boundaries[i] < boundaries[i + 1] for i in range(24)):
+                return {
+                    "bin boundaries (ADC)": list(values[0:25]),
+                    "bin boundaries (µm)": boundaries,
+                    "bin weightings": [value / 100 for value in values[50:74]],
+                    "PM diameters (µm)": [value / 100 for value in values[74:77]],  # PM A, PM B, PM C
+                    "max time of flight": values[77],
+                    "AM sampling interval count": values[78],
+                    "AM idle interval count": values[79],
+                    "AM max data arrays in file": values[80],
+                    "AM only save PM data": values[81],
+                    "AM fan on in idle": values[82],
+                    "AM laser on in idle": values[83],
+                    "TOF to SFR factor": values[84],
+                    "particle validation period": values[85],
+                    "bin weighting index": values[86]
+                }
+            self.logger.warning("Configuration variables received are not valid, reading again (%s/3)", attempts)
+            self.logger.debug("Configuration variables received were:\n%s", list(reading))
+            self.reset_SPI_buffer(0x3C)
+            attempts += 1
+        self.logger.error("Configuration variables were wrong 3 times")
+        return None
+
+    def load_configuration(self, cache_file=configuration_cache_file):
+        """
+        Read the serial number and the firmware version of the OPC-N3, then its configuration variables (only if they
+        are not already in the cache file for this serial number and this firmware)
+        :param cache_file: json file with the configurations already read, one per serial number
+        :return: Dictionary{"serial number", "information", "firmware version", "bin boundaries (ADC)",
+                 "bin boundaries (µm)", "bin weightings", "PM diameters (µm)", "max time of flight", ...},
+                 None if the sensor could not be read
+        """
+        serial_number = self.read_string(0x10)
+        firmware_version = self.read_firmware_version()
+        if not serial_number or firmware_version is None:
+            self.logger.error("Failed to read the serial number and the firmware version of the OPC-N3")
+            return None
+
+        try:
+            with open(cache_file, encoding='utf-8') as file:
+                cache = json.load(file)
+                file.close()
+        except FileNotFoundError:
+            cache = {}
+        except (OSError, ValueError):
+            self.logger.warning("'%s' cannot be read, reading the configuration of the OPC-N3 again", cache_file)
+            cache = {}
+
+        cached = cache.get(serial_number)
+        if cached is not None and cached.get("firmware version") == firmware_version:
+            self.logger.info("Sensor %s (firmware %s), configuration taken from '%s'", serial_number, firmware_version,
+                             cache_file)
+            self.configuration = cached
+            return self.configuration
+
+        variables = self.read_configuration_variables()
+        if variables is None:
+            self.logger.error("Failed to read the configuration variables of the OPC-N3")
+            return None
+        self.configuration = {"serial number": serial_number, "information": self.read_string(0x3F),
+                              "firmware version": firmware_version, **variables}
+        self.logger.info("Sensor %s (firmware %s), configuration read from the sensor", serial_number, firmware_version)
+
+        cache[serial_number] = self.configuration
+        temporary_file = cache_file + ".tmp"
+        lines = [json.dumps(serial) + ": " + json.dumps(values, ensure_ascii=False) for serial, values in cache.items()]
+        try:
+            with open(temporary_file, 'w', encoding='utf-8') as file:
+                file.write("{\n" + ",\n".join(lines) + "\n}\n")  # one line per sensor
+                file.close()
+            os.replace(temporary_file, cache_file)  # the file is never half written
+        except OSError:
+            self.logger.error("Failed to write the configuration of the OPC-N3 in '%s'", cache_file)
+        return self.configuration
+
+    def get_configuration(self):
+        """
+        Configuration of the sensor, read only once (see 'load_configuration')
+        :return: Dictionary, None if the sensor could not be read
+        """
+        if self.configuration is None:
+            self.load_configuration()
+        return self.configuration
+
+    def bin_boundaries(self):
+        """
+        Diameters of the limits of the 24 bins of the histogram
+        :return: List[25 diameters (µm)], None if the configuration could not be read
+        """
+        if self.get_configuration() is None:
+            return None
+        return self.configuration["bin boundaries (µm)"]
 
 
-def set_fan_speed(speed):
-    """
-    Define the speed of the builtin sensor fan
-    Define yourself the fan speed to reduce as much as possible dust deposition in the casing
-    Argument in percent, calibrated from the slowest as possible to the fastest
-    :param speed: number between 0 and 100 (0 = slowest, 100 = fastest)
-    :return: nothing
-    """
-    if speed < 0 or speed > 100:
-        raise ValueError("Fan speed of OPC-N3 sensor must be a number between 0 and 100 (0 = slowest, 100 = fastest")
-    value = int((45 + speed / 100 * 55) / 100 * 255)
-    # Personal investigations shows that the fan don't work below 45%
-    # Formula makes a calculation to convert 0% as 45% --> easier for user input
-    if initiate_transmission(0x42):
-        reading = spi.xfer([0, value])
-        logger.info("Fan speed is set on " + str(speed) + " (0 = the slowest, 100 = the fastest)")
-    else:
-        logger.error("Failed to set the fan speed")
+# ----------------------------------------------
+# SENSOR OF THE SETTINGS
+# ----------------------------------------------
+# The functions of the module are the ones of this sensor: OPCN3.getdata() = OPCN3.sensor.getdata()
+
+sensor = OPCN3(archive_frames=True)  # the only sensor whose frames are archived
+
+transfer = sensor.transfer
+get_command_statistics = sensor.get_command_statistics
+transmission_statistics = sensor.transmission_statistics
+reset_SPI_buffer = sensor.reset_SPI_buffer
+initiate_transmission = sensor.initiate_transmission
+fan_off = sensor.fan_off
+fan_on = sensor.fan_on
+laser_on = sensor.laser_on
+laser_off = sensor.laser_off
+read_DAC_power_status = sensor.read_DAC_power_status
+set_fan_speed = sensor.set_fan_speed
+PM_reading = sensor.PM_reading
+getPM = sensor.getPM
+read_histogram = sensor.read_histogram
+stop = sensor.stop
+idle = sensor.idle
+getdata = sensor.getdata
+read_PM = sensor.read_PM
+start_PM_reader = sensor.start_PM_reader
+get_PM_statistics = sensor.get_PM_statistics
+load_configuration = sensor.load_configuration
+get_configuration = sensor.get_configuration
+bin_boundaries = sensor.bin_boundaries
 
 
 if __name__ == '__main__':
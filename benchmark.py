@@ -0,0 +1,188 @@
+"""
+Benchmarks of the decoding functions of the Seacanairy (the code executed at each sampling cycle)
+The sensors are simulated (see 'simulation.py'), so only the Python code is measured, not the buses.
+
+Run it from the folder containing 'seacanairy_settings.yaml' (as seacanairy.py):
+    $ python3 benchmark.py                  compare with the stored baseline, fail if something became slower
+    $ python3 benchmark.py --save           store the results as the new baseline
+    $ python3 benchmark.py --threshold 0.5  accept up to 50% slower than the baseline (default is 25%)
+
+The baseline depends on the computer: store it on the Raspberry Pi used on board (Pi 3B+) and compare on the
+same Raspberry Pi. The exit code is 1 if one of the functions is slower than the baseline + threshold.
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import timeit
+import logging
+import platform
+import argparse
+import tempfile
+import contextlib
+
+# The logging is not set up (see 'logs.py'): the messages of the sensor files are not written during the benchmark
+logging.basicConfig(level=logging.CRITICAL, handlers=[logging.NullHandler()])
+
+# Simulated buses BEFORE importing the sensor files (see 'simulation.py')
+import simulation
+
+simulation.install()
+
+import OPCN3
+import CO2
+import AFE
+import GPS
+import storage
+
+baseline_file = os.path.join(str(os.getcwd()), "benchmark_baseline.json")
+
+default_threshold = 0.25  # 25% slower than the baseline = regression
+
+repeat = 5  # timeit repetitions, the best one is kept (the others are slowed down by the other processes)
+
+min_duration = 0.2  # seconds, minimum duration of one repetition (number of calls chosen automatically)
+
+
+# --------------------------------------------------------
+# DATA USED BY THE BENCHMARKS
+# --------------------------------------------------------
+
+histogram_frame = memoryview(bytearray(simulation.SimulatedOPCN3().histogram()))
+
+NMEA_data = "".join(line.decode() for line in simulation.SimulatedGPS().lines(time.time()))
+
+AFE.sleep = 0  # no waiting between the channels, only the code is measured
+
+csv_file = os.path.join(tempfile.mkdtemp(), "benchmark-data.csv")
+
+csv_writer = storage.CSVWriter(os.path.join(os.path.dirname(csv_file), "benchmark-writer.csv"))
+
+csv_row = ["17-10-2026 12:00:00", 55.0, 21.5, 1013.2, 412, 415,
+           3.02, 6.11, 12.3, 21.5, 55.0, 1.2, 5.5, 52, 2, "0.000123", "0.000456", "0.000789", "0.000321",
+           "51°13.80000' N", "4°24.00000' E", "10.000", "270.00", "1.01", "12.3 m"]
+
+
+def decode_histogram():
+    """
+    Decoding part of OPCN3.read_histogram(), without the SPI transaction
+    :return: Dictionary returned by OPCN3.decode_histogram()
+    """
+    if OPCN3.check_histogram(histogram_frame):
+        return OPCN3.decode_histogram(histogram_frame)
+
+
+# name: function called without argument
+benchmarks = {
+    "OPCN3.read_histogram decoding (check + decode)": decode_histogram,
+    "OPCN3.join_bytes (4 bytes)": lambda: OPCN3.join_bytes([0x12, 0x34, 0x56, 0x78]),
+    "CO2.getCO2P": CO2.getCO2P,
+    "CO2.getRHT": CO2.getRHT,
+    "AFE.getADCreading": lambda: AFE.getADCreading(AFE.address, AFE.channel0),
+    "GPS.decode_NMEA": lambda: GPS.decode_NMEA(NMEA_data),
+    "GPS.lat_long_decode": lambda: GPS.lat_long_decode("5113.80000", "N"),
+    "storage.append_data_to_csv": lambda: storage.append_data_to_csv(csv_file, *csv_row),
+    "storage.CSVWriter.writerow (flush every line)": lambda: csv_writer.writerow(csv_row),
+}
+
+
+# --------------------------------------------------------
+# MEASUREMENTS
+# --------------------------------------------------------
+
+
+def measure(function):
+    """
+    Measure the time taken by one call of the function
+    :param function: function without argument
+    :return: seconds per call (best of the repetitions)
+    """
+    with contextlib.redirect_stdout(io.StringIO()):  # the sensor files print their data on the screen
+        timer = timeit.Timer(function)
+        number, duration = timer.autorange()
+        while duration < min_duration:
+            number *= 2
+            duration = timer.timeit(number)
+        best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number
+
+
+def load_baseline():
+    """
+    Read the stored baseline
+    :return: Dictionary{"machine", "python", "date", "results"}, None if there is no baseline yet
+    """
+    if not os.path.isfile(baseline_file):
+        return None
+    with open(baseline_file) as file:
+        baseline = json.load(file)
+        file.close()
+    return baseline
+
+
+def save_baseline(results):
+    """
+    Store the results as the new baseline
+    :param results: Dictionary{benchmark name: seconds per call}
+    :return: nothing
+    """
+    baseline = {
+        "machine": platform.node() + " (" + platform.machine() + ")",
+        "python": platform.python_version(),
+        "date": time.strftime("%d-%m-%Y %H:%M:%S"),
+        "results": results
+    }
+    with open(baseline_file, 'w') as file:
+        json.dump(baseline, file, indent=4)
+        file.close()
+    print("Baseline stored in '" + baseline_file + "'")
+
+
+def run(threshold=default_threshold, save=False):
+    """
+    Run all the benchmarks and compare them with the baseline
+    :param threshold: maximum slowdown accepted (0.25 = 25% slower than the baseline)
+    :param save: True to store the results as the new baseline
+    :return: List[names of the benchmarks slower than the baseline + threshold]
+    """
+    baseline = load_baseline()
+    if baseline is not None and not save:
+        print("Baseline of", baseline["date"], "on", baseline["machine"], "with Python", baseline["python"])
+        if baseline["machine"] != platform.node() + " (" + platform.machine() + ")":
+            print("WARNING: the baseline has been measured on another computer, the comparison is not relevant")
+
+    results = {}
+    regressions = []
+    for name, function in benchmarks.items():
+        seconds = measure(function)
+        results[name] = seconds
+        line = name.ljust(50) + ("%.2f" % (seconds * 1e6)).rjust(10) + " µs"
+        if baseline is not None and not save and name in baseline["results"]:
+            ratio = seconds / baseline["results"][name]
+            line += "\t(x" + "%.2f" % ratio + " baseline)"
+            if ratio > 1 + threshold:
+                line += "\tSLOWER"
+                regressions.append(name)
+        print(line)
+
+    if save:
+        save_baseline(results)
+    elif baseline is None:
+        print("No baseline yet, store one with: $ python3 benchmark.py --save")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks of the Seacanairy decoding functions")
+    parser.add_argument('--save', action='store_true', help="store the results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=default_threshold,
+                        help="maximum slowdown accepted before failing (default: 0.25 = 25%%)")
+    arguments = parser.parse_args()
+
+    slower = run(arguments.threshold, arguments.save)
+    if slower:
+        print(str(len(slower)) + " benchmark(s) slower than the baseline by more than " +
+              str(round(arguments.threshold * 100)) + "%: " + ", ".join(slower))
+        sys.exit(1)
@@ -0,0 +1,224 @@
+"""
+Binary storage of the data measured by the Seacanairy (same data as the -data.csv file)
+Each sampling cycle is one record of fixed size, described by a numpy structured dtype:
+- numbers are stored as float64, NaN when the sensor returned nothing valid ("error", "-", "no fix"...)
+- texts (f-e the GPS position) are stored on a fixed number of bytes
+- one bit per column in the field 'valid' says if the value is valid (1) or not (0)
+The file starts with a small header containing the dtype, then the records are appended one after the other.
+It is read with numpy.memmap(): the columns are given as arrays without reading/parsing the whole file.
+
+    records = binary_storage.load("session-data.bin")
+    PM1 = records["PM 1 (μg/m³)"]  # numpy array, NaN where the value was not valid
+    PM1_valid = binary_storage.valid(records, "PM 1 (μg/m³)")
+
+Run this file directly ($ python3 binary_storage.py session-data.bin) to see a summary of a file.
+"""
+
+import os
+import sys
+import json
+import struct
+import logging
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger('STORAGE')
+
+magic = b"SEACANAIRY-BIN1\n"  # first bytes of the file
+header_alignment = 8  # the records start on a multiple of 8 bytes
+
+
+def make_dtype(columns):
+    """
+    Create the dtype of the records
+    :param columns: List[(column name, numpy type)], type is 'f8' for numbers or 'S<n>' for texts of n bytes
+    :return: numpy.dtype
+    """
+    fields = list(columns)
+    fields.append(("valid", 'u1', ((len(columns) + 7) // 8,)))  # validity bitmask, one bit per column
+    return np.dtype(fields)
+
+
+def encode_header(dtype):
+    """
+    Create the header of the file: magic, size of the description, json description of the dtype, padding
+    :param dtype: numpy.dtype of the records
+    :return: bytes
+    """
+    description = json.dumps({
+        "columns": [[name, dtype.fields[name][0].str] for name in dtype.names if name != "valid"],
+        "record size": dtype.itemsize
+    }).encode('utf-8')
+    header = magic + struct.pack('<I', len(description)) + description
+    return header + b' ' * (-len(header) % header_alignment)
+
+
+def decode_header(file):
+    """
+    Read the header of a file
+    :param file: file opened in binary mode, at position 0
+    :return: (numpy.dtype of the records, size of the header in bytes)
+    """
+    if file.read(len(magic)) != magic:
+        raise ValueError("Not a Seacanairy binary data file")
+    length, = struct.unpack('<I', file.read(4))
+    description = json.loads(file.read(length).decode('utf-8'))
+    dtype = make_dtype([(name, type) for name, type in description["columns"]])
+    header_size = len(magic) + 4 + length
+    header_size += -header_size % header_alignment
+    return dtype, header_size
+
+
+class BinaryWriter:
+    """
+    Append the records of the sampling cycles to a binary file
+    """
+
+    def __init__(self, file_path, columns, fsync=False):
+        """
+        :param file_path: path of the binary file, created if it doesn't exist
+        :param columns: List[(column name, numpy type)], see make_dtype()
+        :param fsync: True to wait until each record is physically written on the SD card
+        """
+        self.file_path = file_path
+        self.dtype = make_dtype(columns)
+        self.names = [name for name, type in columns]
+        self.text_columns = [type.startswith('S') for name, type in columns]
+        self.fsync = fsync
+
+        if os.path.isfile(file_path) and os.path.getsize(file_path) > 0:
+            with open(file_path, 'rb') as file:
+                try:
+                    existing_dtype, header_size = decode_header(file)
+                except ValueError:
+                    existing_dtype, header_size = None, 0
+                file.close()
+            if existing_dtype != self.dtype:
+                # the columns have changed: keep the old file and start a new one
+                old_file = file_path + ".old-" + datetime.now().strftime("%Y%m%d-%H%M%S")
+                os.rename(file_path, old_file)
+                logger.warning("Columns of '%s' are different, previous file renamed '%s'", file_path, old_file)
+
+        if not os.path.isfile(file_path) or os.path.getsize(file_path) == 0:
+            with open(file_path, 'wb') as file:
+                file.write(encode_header(self.dtype))
+                file.close()
+
+        self.file = open(file_path, 'r+b')
+        dtype, self.header_size = decode_header(self.file)
+
+        # remove the record partially written at a power loss (the size of the file must be a whole number
+        # of records after the header)
+        size = self.file.seek(0, os.SEEK_END)
+        incomplete = (size - self.header_size) % self.dtype.itemsize
+        if incomplete:
+            logger.warning("Last record of '%s' was incomplete (power loss?), removed %s bytes", file_path, incomplete)
+            self.file.truncate(size - incomplete)
+            self.file.seek(0, os.SEEK_END)
+
+    def to_record(self, values):
+        """
+        Convert the values of one cycle into one record
+        :param values: List[values, in the order of the columns], missing values at the end are not valid
+        :return: numpy.ndarray of one record
+        """
+        record = np.zeros(1, dtype=self.dtype)
+        validity = np.zeros(len(self.names), dtype=bool)
+        for i, name in enumerate(self.names):
+            value = values[i] if i < len(values) else None
+            if self.text_columns[i]:
+                if value is None or value in ("error", "no fix", "-", ""):
+                    continue
+                text = str(value).encode('utf-8')
+                width = self.dtype.fields[name][0].itemsize
+                if len(text) > width:
+                    logger.warning("Text of '%s' is longer than its %s bytes, cut in the binary file: %s", name, width,
+                                   value)
+                record[name] = text[:width]
+                validity[i] = True
+            else:
+                try:
+                    number = float(value)  # f-e "0.123" for the SOG given by the GPS
+                except (TypeError, ValueError):
+                    number = float('nan')  # "error", "-", "no fix", None...
+                record[name] = number
+                validity[i] = value is not False and number == number  # NaN is not equal to itself
+        record["valid"] = np.packbits(validity, bitorder='little')
+        return record
+
+    def append(self, values):
+        """
+        Add the record of one cycle at the end of the file
+        :param values: List[values, in the order of the columns]
+        :return: nothing
+        """
+        if len(values) != len(self.names):
+            logger.error("Binary storage received %s values for %s columns", len(values), len(self.names))
+        self.file.write(self.to_record(values).tobytes())
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        """
+        Close the file
+        :return: nothing
+        """
+        if not self.file.closed:
+            self.file.close()
+
+
+# --------------------------------------------------------
+# READING
+# --------------------------------------------------------
+
+
+def load(file_path):
+    """
+    Give access to all the records of a file, without reading it (memory-mapped)
+    :param file_path: path of the binary file
+    :return: numpy.memmap of the records, records["column name"] gives the column as an array
+    """
+    with open(file_path, 'rb') as file:
+        dtype, header_size = decode_header(file)
+        file.close()
+    count = (os.path.getsize(file_path) - header_size) // dtype.itemsize  # an incomplete record is ignored
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(file_path, dtype=dtype, mode='r', offset=header_size, shape=(count,))
+
+
+def columns(records):
+    """
+    Names of the columns of the records
+    :param records: array returned by load()
+    :return: List[column names]
+    """
+    return [name for name in records.dtype.names if name != "valid"]
+
+
+def valid(records, name):
+    """
+    Validity of the values of a column
+    :param records: array returned by load()
+    :param name: name of the column
+    :return: numpy array of booleans, True where the value is valid
+    """
+    index = columns(records).index(name)
+    return (records["valid"][:, index // 8] >> (index % 8)) & 1 == 1
+
+
+if __name__ == '__main__':  # if you run this code directly ($ python3 binary_storage.py file.bin)
+    if len(sys.argv) != 2:
+        print("Usage: python3 binary_storage.py <file.bin>")
+        sys.exit(1)
+    data = load(sys.argv[1])
+    print(len(data), "records of", data.dtype.itemsize, "bytes")
+    for column in columns(data):
+        validity = valid(data, column)
+        print(column.ljust(40), str(int(validity.sum())).rjust(8), "valid", end='')
+        if data.dtype.fields[column][0].kind == 'f' and validity.any():
+            print("\tmin:", np.nanmin(data[column]), "\tmax:", np.nanmax(data[column]))
+        else:
+            print()
@@ -0,0 +1,175 @@
+"""
+Checksums used by the sensors of the Seacanairy, computed with precomputed tables (one step per byte)
+- CRC16/Modbus for the OPC-N3 (SPI)
+- CRC8 (polynomial 0x31) for the E+E Elektronik EE894 CO2 sensor (I²C)
+- XOR checksum of the NMEA lines for the GPS (UART)
+Run this file directly ($ python3 checksum.py) to compare the speed with the previous bit by bit calculations
+"""
+
+import timeit
+import random
+
+
+# --------------------------------------------------------
+# LOOKUP TABLES
+# --------------------------------------------------------
+# The result of the 8 bit loop is the same for each value of the byte, it is calculated once for the 256 values
+
+
+def make_crc16_modbus_table():
+    """
+    Create the table of the CRC16/Modbus (reflected polynomial 0xA001)
+    :return: List[256 integers]
+    """
+    table = []
+    for byte in range(256):
+        crc = byte
+        for bit in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+        table.append(crc)
+    return table
+
+
+def make_crc8_table(polynomial=0x31):
+    """
+    Create the table of a CRC8 (MSB first)
+    :param polynomial: polynomial of the CRC (0x31 for the EE894)
+    :return: List[256 integers]
+    """
+    table = []
+    for byte in range(256):
+        crc = byte
+        for bit in range(8):
+            if crc & 0x80:
+                crc = ((crc << 1) ^ polynomial) & 0xFF
+            else:
+                crc = (crc << 1) & 0xFF
+        table.append(crc)
+    return table
+
+
+crc16_modbus_table = make_crc16_modbus_table()
+crc8_table = make_crc8_table(0x31)
+
+
+# --------------------------------------------------------
+# CHECKSUMS
+# --------------------------------------------------------
+
+
+def crc16_modbus(data, crc=0xFFFF):
+    """
+    CRC16/Modbus used by the OPC-N3
+    :param data: bytes, bytearray, memoryview or List[integers between 0 and 255]
+    :param crc: initial value (to continue the calculation of a previous block)
+    :return: checksum (integer on 16 bits)
+    """
+    table = crc16_modbus_table  # local variable, faster inside the loop
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def crc8(data, crc=0xFF):
+    """
+    CRC8 (polynomial 0x31, initial value 0xFF) used by the EE894 CO2 sensor
+    :param data: bytes, bytearray, memoryview or List[integers between 0 and 255]
+    :param crc: initial value (to continue the calculation of a previous block)
+    :return: checksum (integer on 8 bits)
+    """
+    table = crc8_table
+    for byte in data:
+        crc = table[crc ^ byte]
+    return crc
+
+
+def nmea_checksum(sentence):
+    """
+    XOR of all the characters between '$' and '*' of a NMEA line
+    :param sentence: str or bytes, whole NMEA line ('$GPRMC,...*7A') or only the part between '$' and '*'
+    :return: checksum (integer on 8 bits)
+    """
+    if isinstance(sentence, str):
+        sentence = sentence.encode('ascii', errors='replace')
+    start = 1 if sentence[:1] == b'$' else 0
+    end = sentence.find(b'*')
+    if end == -1:
+        end = len(sentence)
+    calc_cksum = 0
+    for byte in sentence[start:end]:
+        calc_cksum ^= byte
+    return calc_cksum
+
+
+# --------------------------------------------------------
+# BENCHMARK
+# --------------------------------------------------------
+# Previous bit by bit calculations (copied from OPCN3.py, CO2.py and GPS.py), only used to compare the speed
+
+
+def bitwise_crc16_modbus(data):
+    crc = 0xFFFF
+    for byteCtr in range(0, len(data)):
+        to_xor = int(data[byteCtr])
+        crc ^= to_xor
+        for bit in range(0, 8):
+            if (crc & 1) == 1:
+                crc >>= 1
+                crc ^= 0xA001
+            else:
+                crc >>= 1
+    return crc & 0xFFFF
+
+
+def bitwise_crc8(buf):
+    crcVal = 0xff
+    for i in range(0, len(buf)):
+        curVal = buf[i]
+        for j in range(0, 8):
+            if ((crcVal ^ curVal) & 0x80) != 0:
+                crcVal = (crcVal << 1) ^ 0x31
+            else:
+                crcVal = (crcVal << 1)
+            curVal = (curVal << 1)
+    return crcVal & 0xff
+
+
+def string_nmea_checksum(string_line):
+    calc_cksum = 0
+    for s in string_line[1:-3]:
+        calc_cksum ^= ord(s)
+    return str(hex(calc_cksum))[2:].upper()
+
+
+def benchmark(repeat=2000):
+    """
+    Compare the speed of the table calculations with the previous bit by bit calculations on real frame sizes
+    :param repeat: number of calculations for each checksum
+    :return: nothing, results are printed on the screen
+    """
+    histogram = bytes(random.getrandbits(8) for _ in range(84))  # OPC-N3 histogram without its checksum
+    CO2_frame = [random.getrandbits(8) for _ in range(2)]  # EE894: one checksum for each pair of bytes
+    NMEA_line = "$GPRMC,120000.00,A,5012.34567,N,00412.12345,E,0.123,,170526,,,A*6C"
+
+    assert crc16_modbus(histogram) == bitwise_crc16_modbus(histogram)
+    assert crc8(CO2_frame) == bitwise_crc8(CO2_frame)
+    assert "%X" % nmea_checksum(NMEA_line) == string_nmea_checksum(NMEA_line)
+
+    comparisons = [
+        ("OPC-N3 histogram (84 bytes)", lambda: bitwise_crc16_modbus(histogram), lambda: crc16_modbus(histogram)),
+        ("EE894 CRC8 (2 bytes)", lambda: bitwise_crc8(CO2_frame), lambda: crc8(CO2_frame)),
+        ("NMEA line (" + str(len(NMEA_line)) + " characters)", lambda: string_nmea_checksum(NMEA_line),
+         lambda: nmea_checksum(NMEA_line)),
+    ]
+    for name, previous, table in comparisons:
+        previous_time = min(timeit.repeat(previous, number=repeat, repeat=5)) / repeat
+        table_time = min(timeit.repeat(table, number=repeat, repeat=5)) / repeat
+        print(name + ":\t", round(previous_time * 1e6, 2), "µs ->", round(table_time * 1e6, 2), "µs\t(x" +
+              str(round(previous_time / table_time, 1)) + ")")
+
+
+if __name__ == '__main__':
+    benchmark()
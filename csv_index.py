@@ -0,0 +1,269 @@
+"""
+Time index of the -data.csv files of the Seacanairy, to read a period of a session without parsing the whole file
+The index is stored next to the csv file ('session-data.csv.idx'), one entry per line of the file:
+(date and time of the line in seconds since 1970, position of the line in the file in bytes).
+- the first call reads the whole csv file once and creates the index
+- the next calls only read the lines added since (the index is updated before each reading)
+- if the csv file has been replaced (f-e new file after a rotation), the index is created again
+The lines of a period are then read directly at their position, through mmap (no reading of the rest of the file).
+
+    rows = csv_index.read_range("session/session-data.csv", start, end)  # start/end: datetime or seconds
+
+From the command line:
+    $ python3 csv_index.py <session folder or -data.csv file> ["dd-mm-YYYY HH:MM:SS" ["dd-mm-YYYY HH:MM:SS"]]
+"""
+
+import os
+import csv
+import sys
+import mmap
+import zlib
+import bisect
+import struct
+import logging
+from datetime import datetime
+
+import storage  # find_data_end(): end of the last complete line of the csv file
+import rotation  # segments of the csv file
+
+logger = logging.getLogger('STORAGE')
+
+magic = b"SEACANAIRY-IDX1\n"  # first bytes of the index file
+# number of entries, end of the part of the csv file already indexed, crc32 of the last line indexed
+index_header = struct.Struct('<QQI')
+entry = struct.Struct('<dQ')  # date and time (seconds since 1970), position of the line (bytes)
+
+date_format = "%d-%m-%Y %H:%M:%S"  # format of the 'Date/Time' column of the csv file (local time)
+
+
+def index_path(csv_file):
+    """
+    :param csv_file: path of the csv file
+    :return: path of its index
+    """
+    return csv_file + ".idx"
+
+
+def parse_date(line):
+    """
+    Date and time of a line of the csv file (first column)
+    :param line: bytes of the line
+    :return: seconds since 1970, None if the line has no valid date (f-e the header)
+    """
+    try:
+        return datetime.strptime(line.split(b',', 1)[0].decode('utf-8'), date_format).timestamp()
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def to_seconds(moment):
+    """
+    :param moment: datetime, seconds since 1970 or None
+    :return: seconds since 1970 (or None)
+    """
+    if isinstance(moment, datetime):
+        return moment.timestamp()
+    return moment
+
+
+class Index:
+    """
+    Entries of the index of one csv file, in the order of the lines of the file
+    """
+
+    def __init__(self, times=None, positions=None, indexed_end=0, last_line_crc=0):
+        """
+        :param times: List[date and time of each line (seconds since 1970)]
+        :param positions: List[position of each line (bytes)]
+        :param indexed_end: position (bytes) up to which the csv file has been indexed
+        :param last_line_crc: crc32 of the last line indexed, to see if the csv file has been replaced
+        """
+        self.times = times if times is not None else []
+        self.positions = positions if positions is not None else []
+        self.indexed_end = indexed_end
+        self.last_line_crc = last_line_crc
+        # the lines are usually in the order of time, except if the clock of the Raspberry has been changed
+        self.sorted = all(self.times[i] <= self.times[i + 1] for i in range(len(self.times) - 1))
+
+    def add(self, time, position):
+        """
+        Add the entry of a line at the end of the index
+        :param time: date and time of the line (seconds since 1970)
+        :param position: position of the line (bytes)
+        :return: nothing
+        """
+        if self.times and time < self.times[-1]:
+            self.sorted = False
+        self.times.append(time)
+        self.positions.append(position)
+
+    def find(self, start=None, end=None):
+        """
+        Numbers of the lines written between start and end (included)
+        :param start: Optional: seconds since 1970, from the beginning if None
+        :param end: Optional: seconds since 1970, up to the end if None
+        :return: List[numbers of the entries], in the order of the file
+        """
+        if self.sorted:
+            first = 0 if start is None else bisect.bisect_left(self.times, start)
+            last = len(self.times) if end is None else bisect.bisect_right(self.times, end)
+            return list(range(first, last))
+        # clock changed during the session: look at all the entries (still without reading the csv file)
+        return [i for i, time in enumerate(self.times)
+                if (start is None or time >= start) and (end is None or time <= end)]
+
+
+def load(csv_file):
+    """
+    Read the index of a csv file
+    :param csv_file: path of the csv file
+    :return: Index, empty if there is no valid index
+    """
+    try:
+        with open(index_path(csv_file), 'rb') as file:
+            if file.read(len(magic)) != magic:
+                raise ValueError("not an index file")
+            count, indexed_end, last_line_crc = index_header.unpack(file.read(index_header.size))
+            data = file.read(count * entry.size)
+            file.close()
+    except (OSError, ValueError, struct.error):
+        return Index()
+    if len(data) != count * entry.size:
+        return Index()  # index partially written
+    times = []
+    positions = []
+    for time, position in entry.iter_unpack(data):
+        times.append(time)
+        positions.append(position)
+    return Index(times, positions, indexed_end, last_line_crc)
+
+
+def save(csv_file, index, first_new=0):
+    """
+    Write the index of a csv file
+    The new entries are written first, then the header giving their number: if the software stops between both,
+    the new entries are simply ignored
+    :param csv_file: path of the csv file
+    :param index: Index
+    :param first_new: number of the first entry not written in the index file yet (0 = write everything)
+    :return: nothing
+    """
+    path = index_path(csv_file)
+    if first_new == 0 or not os.path.isfile(path):
+        first_new = 0
+        file = open(path + ".new", 'wb')
+        file.write(magic + index_header.pack(0, 0, 0))
+    else:
+        file = open(path, 'r+b')
+    file.seek(len(magic) + index_header.size + first_new * entry.size)
+    file.write(b''.join(entry.pack(index.times[i], index.positions[i])
+                        for i in range(first_new, len(index.times))))
+    file.truncate()
+    file.seek(len(magic))
+    file.write(index_header.pack(len(index.times), index.indexed_end, index.last_line_crc))
+    file.close()
+    if first_new == 0:
+        os.replace(path + ".new", path)
+
+
+def update(csv_file):
+    """
+    Index the lines added to the csv file since the last update (the whole file the first time)
+    :param csv_file: path of the csv file
+    :return: Index, up to date
+    """
+    index = load(csv_file)
+    with open(csv_file, 'rb') as file:
+        data_end = storage.find_data_end(file)  # the zeros preallocated and an incomplete last line are ignored
+
+        if index.positions:
+            # same file as when it was indexed? (f-e not a new file started after a rotation)
+            file.seek(index.positions[-1])
+            last_line = file.read(index.indexed_end - index.positions[-1])
+            if data_end < index.indexed_end or zlib.crc32(last_line) != index.last_line_crc:
+                logger.info("'%s' has changed since it was indexed, creating the index again", csv_file)
+                index = Index()
+        elif data_end < index.indexed_end:
+            index = Index()
+
+        first_new = len(index.times)
+        if data_end > index.indexed_end:
+            file.seek(index.indexed_end)
+            position = index.indexed_end
+            while position < data_end:  # data_end is just after an end of line
+                line = file.readline()
+                time = parse_date(line)
+                if time is not None:
+                    index.add(time, position)
+                    index.last_line_crc = zlib.crc32(line)
+                position += len(line)
+            if index.positions:
+                # the header and the invalid lines after the last dated line are read again next time, not a problem
+                file.seek(index.positions[-1])
+                index.indexed_end = index.positions[-1] + len(file.readline())
+            else:
+                index.indexed_end = 0
+        file.close()
+
+    if len(index.times) != first_new or first_new == 0:
+        save(csv_file, index, first_new)
+    return index
+
+
+def read_lines(csv_file, start=None, end=None):
+    """
+    Lines of a csv file written between start and end, read at their position through mmap
+    :param csv_file: path of the csv file (not compressed)
+    :param start: Optional: datetime or seconds since 1970, from the beginning if None
+    :param end: Optional: datetime or seconds since 1970, up to the end if None
+    :return: List[lines (bytes, with the end of line)]
+    """
+    index = update(csv_file)
+    selected = index.find(to_seconds(start), to_seconds(end))
+    if not selected:
+        return []
+    # end of each line = position of the next entry (or end of the part indexed for the last one)
+    ends = index.positions[1:] + [index.indexed_end]
+    lines = []
+    with open(csv_file, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for i in selected:
+                # a line followed by an invalid one (f-e header) ends at its first end of line
+                line_end = mapped.find(b'\n', index.positions[i], ends[i]) + 1 or ends[i]
+                lines.append(mapped[index.positions[i]:line_end])
+        file.close()
+    return lines
+
+
+def read_range(csv_file, start=None, end=None):
+    """
+    Rows of a session written between start and end, in the order of the files (rotated files included, except
+    the compressed ones which cannot be read at a position, see rotation.read_csv_rows() for those)
+    :param csv_file: path of the current -data.csv file of the session
+    :param start: Optional: datetime or seconds since 1970, from the beginning if None
+    :param end: Optional: datetime or seconds since 1970, up to the end if None
+    :return: List[rows (List[str])], without header
+    """
+    rows = []
+    for path in rotation.segments(csv_file) + ([csv_file] if os.path.isfile(csv_file) else []):
+        if not path.endswith(".csv"):
+            logger.debug("'%s' is compressed, not read", path)
+            continue
+        lines = read_lines(path, start, end)
+        rows += csv.reader(line.decode('utf-8') for line in lines)
+    return rows
+
+
+if __name__ == '__main__':  # if you run this code directly ($ python3 csv_index.py session [start [end]])
+    if len(sys.argv) not in (2, 3, 4):
+        print("Usage: python3 csv_index.py <session folder or -data.csv file> "
+              "[\"dd-mm-YYYY HH:MM:SS\" [\"dd-mm-YYYY HH:MM:SS\"]]")
+        sys.exit(1)
+    source = sys.argv[1].rstrip('/')
+    if os.path.isdir(source):
+        source = os.path.join(source, os.path.basename(source) + "-data.csv")
+    first = datetime.strptime(sys.argv[2], date_format) if len(sys.argv) > 2 else None
+    last = datetime.strptime(sys.argv[3], date_format) if len(sys.argv) > 3 else None
+    writer = csv.writer(sys.stdout)
+    for row in read_range(source, first, last):
+        writer.writerow(row)
@@ -0,0 +1,237 @@
+"""
+Archive of the raw frames received from the sensors, before any decoding
+Each frame is appended to '<session name>-frames.bin' with the sensor which sent it and the moment it was received:
+- OPC-N3: the 86 bytes of the histogram (checksum included, also when it is wrong), or the 14 bytes of the PM
+- CO2 sensor: the 6 bytes of temperature/RH and the 9 bytes of CO2/pressure (CRC8 included)
+- AFE board: the channel read, followed by the bytes returned by the ADC
+- GPS: each NMEA line, as received on the UART port
+The values can then be decoded again later (f-e when a decoding is fixed or improved) from the bytes really
+received, and not from the rounded values of the csv file.
+
+Format of the file, all in little endian:
+    magic, then frames one after the other: tag (uint8), monotonic clock (uint64, ns), length (uint16), payload
+An ANCHOR frame is written each time the file is opened: its payload is the date and time (float64, seconds since
+1970) at the moment of its monotonic clock, to find the date and time of the next frames (the monotonic clock
+starts again at each start of the Raspberry).
+
+    for frame in frame_archive.read_frames("session-frames.bin", [frame_archive.CO2_RHT]):
+        print(frame.time, frame.payload)
+
+Run this file directly ($ python3 frame_archive.py session-frames.bin) to see a summary of a file.
+"""
+
+import os
+import sys
+import time
+import struct
+import logging
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger('STORAGE')
+
+magic = b"SEACANAIRY-FRM1\n"  # first bytes of the file
+frame_header = struct.Struct('<BQH')  # tag, monotonic clock (ns), length of the payload
+anchor_payload = struct.Struct('<d')  # date and time (seconds since 1970)
+
+# tags of the frames
+ANCHOR = 0  # date and time of the monotonic clock, written when the file is opened
+OPC_HISTOGRAM = 1  # 86 bytes answered to the command 0x30
+CO2_RHT = 2  # 6 bytes answered to the command 0xE0 0x00
+CO2_CO2P = 3  # 9 bytes answered to the command 0xE0 0x27
+ADC = 4  # channel (1 byte) + bytes read from the LTC2497
+NMEA = 5  # one NMEA line (with its end of line)
+OPC_PM = 6  # 14 bytes answered to the command 0x32 ('PM only' mode)
+
+tag_names = {ANCHOR: "anchor", OPC_HISTOGRAM: "OPC-N3 histogram", CO2_RHT: "CO2 RH/temperature",
+             CO2_CO2P: "CO2 CO2/pressure", ADC: "AFE ADC", NMEA: "GPS NMEA", OPC_PM: "OPC-N3 PM"}
+
+# frame read from the file, 'time' is the date and time (seconds since 1970) found with the last anchor
+Frame = namedtuple('Frame', ['tag', 'monotonic_ns', 'time', 'payload'])
+
+archive = None  # FrameWriter of the session, nothing is archived if None (see start())
+
+
+class FrameWriter:
+    """
+    Append the frames to the archive file
+    The frames are written in the buffer of the file, and given to the system by flush() (once per cycle): the
+    sensors never wait for the SD card. Frames can be added from several threads (one per bus).
+    """
+
+    def __init__(self, file_path, fsync=False):
+        """
+        :param file_path: path of the archive, created if it doesn't exist
+        :param fsync: True to wait until the frames are physically written on the SD card at each flush()
+        """
+        self.file_path = file_path
+        self.fsync = fsync
+        self.lock = threading.Lock()
+
+        if not os.path.isfile(file_path) or os.path.getsize(file_path) == 0:
+            with open(file_path, 'wb') as file:
+                file.write(magic)
+                file.close()
+
+        # remove the frame partially written at a power loss
+        end = frames_end(file_path)
+        size = os.path.getsize(file_path)
+        if end != size:
+            logger.warning("Last frame of '%s' was incomplete (power loss?), removed %s bytes", file_path, size - end)
+            os.truncate(file_path, end)
+
+        self.file = open(file_path, 'ab', buffering=64 * 1024)
+        self.append(ANCHOR, anchor_payload.pack(time.time()))
+
+    def append(self, tag, payload):
+        """
+        Add a frame at the end of the file
+        :param tag: sensor which sent the frame (OPC_HISTOGRAM, CO2_RHT...)
+        :param payload: bytes received (bytes, bytearray, memoryview or list of integers)
+        :return: nothing
+        """
+        if not isinstance(payload, (bytes, bytearray, memoryview)):
+            payload = bytes(payload)
+        header = frame_header.pack(tag, time.monotonic_ns(), len(payload))
+        with self.lock:
+            self.file.write(header)
+            self.file.write(payload)
+
+    def flush(self):
+        """
+        Give the frames waiting in the buffer to the system
+        :return: nothing
+        """
+        with self.lock:
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+
+    def close(self):
+        """
+        Write the frames waiting and close the file
+        :return: nothing
+        """
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+def start(file_path, fsync=False):
+    """
+    Start archiving the frames of the sensors
+    :param file_path: path of the archive
+    :param fsync: True to wait until the frames are physically written on the SD card at each flush()
+    :return: nothing
+    """
+    global archive
+    archive = FrameWriter(file_path, fsync)
+
+
+def record(tag, payload):
+    """
+    Archive a frame received by a sensor (nothing is done if the archive is not started)
+    :param tag: sensor which sent the frame (OPC_HISTOGRAM, CO2_RHT...)
+    :param payload: bytes received
+    :return: nothing
+    """
+    if archive is not None:
+        archive.append(tag, payload)
+
+
+def flush():
+    """
+    Give the frames archived to the system (called once per cycle)
+    :return: nothing
+    """
+    if archive is not None:
+        archive.flush()
+
+
+def close():
+    """
+    Write the frames waiting and close the archive
+    :return: nothing
+    """
+    global archive
+    if archive is not None:
+        archive.close()
+        archive = None
+
+
+# --------------------------------------------------------
+# READING
+# --------------------------------------------------------
+
+
+def iterate(file):
+    """
+    Go through the frames of a file
+    :param file: file opened in binary mode, just after the magic
+    :return: generator of (tag, monotonic clock, payload, position of the end of the frame)
+    """
+    while True:
+        header = file.read(frame_header.size)
+        if len(header) < frame_header.size:
+            return
+        tag, monotonic_ns, length = frame_header.unpack(header)
+        payload = file.read(length)
+        if len(payload) < length:
+            return  # frame partially written
+        yield tag, monotonic_ns, payload, file.tell()
+
+
+def frames_end(file_path):
+    """
+    Find the end of the last complete frame of a file
+    :param file_path: path of the archive
+    :return: position (bytes)
+    """
+    with open(file_path, 'rb') as file:
+        if file.read(len(magic)) != magic:
+            raise ValueError("'" + file_path + "' is not a Seacanairy frame archive")
+        end = len(magic)
+        for tag, monotonic_ns, payload, end in iterate(file):
+            pass
+        file.close()
+    return end
+
+
+def read_frames(file_path, tags=None):
+    """
+    Frames of an archive, in the order they were received
+    :param file_path: path of the archive
+    :param tags: Optional: List[tags of the frames wanted], all the frames if None
+    :return: generator of Frame(tag, monotonic_ns, time, payload), time is None before the first anchor
+    """
+    with open(file_path, 'rb', buffering=1024 * 1024) as file:
+        if file.read(len(magic)) != magic:
+            raise ValueError("'" + file_path + "' is not a Seacanairy frame archive")
+        anchor = None  # (monotonic clock, date and time) of the last anchor
+        for tag, monotonic_ns, payload, end in iterate(file):
+            if tag == ANCHOR:
+                anchor = (monotonic_ns, anchor_payload.unpack(payload)[0])
+            if tags is not None and tag not in tags:
+                continue
+            moment = None if anchor is None else anchor[1] + (monotonic_ns - anchor[0]) / 1e9
+            yield Frame(tag, monotonic_ns, moment, payload)
+        file.close()
+
+
+if __name__ == '__main__':  # if you run this code directly ($ python3 frame_archive.py file.bin)
+    if len(sys.argv) != 2:
+        print("Usage: python3 frame_archive.py <session-frames.bin>")
+        sys.exit(1)
+    counts = {}
+    first = None
+    last = None
+    for frame in read_frames(sys.argv[1]):
+        counts[frame.tag] = counts.get(frame.tag, 0) + 1
+        if frame.time is not None:
+            first = frame.time if first is None else first
+            last = frame.time
+    for tag, count in sorted(counts.items()):
+        print(tag_names.get(tag, "tag " + str(tag)).ljust(25), str(count).rjust(10), "frames")
+    if first is not None:
+        print("From", time.strftime("%d-%m-%Y %H:%M:%S", time.localtime(first)),
+              "to", time.strftime("%d-%m-%Y %H:%M:%S", time.localtime(last)))
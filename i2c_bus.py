@@ -0,0 +1,150 @@
+"""
+Shared access to the I²C buses of the Raspberry Pi
+Used by CO2.py and AFE.py: the bus is opened once and kept open, and the transactions of the different sensors
+are done one after the other, never at the same time
+"""
+
+import os
+import time
+import threading
+import fcntl  # lock the bus between several Python processes
+import logging
+
+# smbus2 is the new smbus, allow more than 32 bits writing/reading
+from smbus2 import SMBus
+
+# yaml settings
+import yaml
+
+# --------------------------------------------------------
+# YAML SETTINGS
+# --------------------------------------------------------
+
+# Get current directory
+current_working_directory = str(os.getcwd())
+
+with open(current_working_directory + '/seacanairy_settings.yaml') as file:
+    settings = yaml.safe_load(file)
+    file.close()
+
+# Also lock the bus for the other programs using it (f-e a test script running at the same time)
+lock_between_processes = settings['Seacanairy settings']['Lock the I2C bus between processes']
+
+logger = logging.getLogger('I2C bus')
+
+
+class SharedBus:
+    """
+    One I²C bus, kept open and protected by a lock
+    Use it with 'with':
+        with bus as smbus:
+            smbus.i2c_rdwr(write, read)
+    """
+
+    def __init__(self, bus_number, lock_file=None):
+        """
+        :param bus_number: number of the I²C bus (1 on the Raspberry Pi 3B+)
+        :param lock_file: Optional: file locked with flock() during each transaction, to share the bus with
+                          other processes
+        """
+        self.bus_number = bus_number
+        self.lock = threading.Lock()  # one transaction at a time inside this Python process
+        self.lock_file = lock_file
+        self.lock_file_descriptor = None
+        self.smbus = None  # opened at the first transaction
+        self.transaction_start = 0
+
+        # statistics
+        self.transactions = 0
+        self.errors = 0
+        self.total_time = 0  # seconds
+        self.max_time = 0  # seconds
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            if self.lock_file is not None:
+                if self.lock_file_descriptor is None:
+                    self.lock_file_descriptor = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o666)
+                fcntl.flock(self.lock_file_descriptor, fcntl.LOCK_EX)
+            if self.smbus is None:
+                self.smbus = SMBus(self.bus_number)
+                logger.debug("I2C bus %s opened", self.bus_number)
+        except:
+            self.release()
+            raise
+        self.transaction_start = time.monotonic()
+        return self.smbus
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.monotonic() - self.transaction_start
+        self.transactions += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+
+        if exc_type is not None:
+            # SMBUS stop working in case of error, it will be opened again at the next transaction
+            self.errors += 1
+            self.close_bus()
+
+        self.release()
+        return False  # the error (if any) is given to the sensor code, which knows how to handle it
+
+    def release(self):
+        """
+        Let the bus available for the next transaction
+        :return: nothing
+        """
+        try:
+            if self.lock_file_descriptor is not None:
+                fcntl.flock(self.lock_file_descriptor, fcntl.LOCK_UN)
+        finally:
+            self.lock.release()  # even if the unlock failed, otherwise the next transactions would wait forever
+
+    def close_bus(self):
+        """
+        Close the bus, it will be opened again at the next transaction
+        :return: nothing
+        """
+        if self.smbus is not None:
+            try:
+                self.smbus.close()
+            except:
+                pass  # nothing to do, the bus is already in error
+            self.smbus = None
+
+    def statistics(self):
+        """
+        Statistics of the transactions made on this bus since the start
+        :return: Dictionary{"transactions", "errors", "average time (ms)", "max time (ms)"}
+        """
+        if self.transactions == 0:
+            average = 0
+        else:
+            average = self.total_time / self.transactions
+        return {
+            "transactions": self.transactions,
+            "errors": self.errors,
+            "average time (ms)": round(average * 1000, 2),
+            "max time (ms)": round(self.max_time * 1000, 2)
+        }
+
+
+buses = {}  # all the buses already in use, by bus number
+buses_lock = threading.Lock()
+
+
+def get_bus(bus_number=1):
+    """
+    Give the shared bus, create it at the first call
+    :param bus_number: number of the I²C bus (1 on the Raspberry Pi 3B+)
+    :return: SharedBus
+    """
+    with buses_lock:
+        if bus_number not in buses:
+            if lock_between_processes:
+                lock_file = "/tmp/seacanairy-i2c-" + str(bus_number) + ".lock"
+            else:
+                lock_file = None
+            buses[bus_number] = SharedBus(bus_number, lock_file)
+        return buses[bus_number]
@@ -0,0 +1,93 @@
+"""
+Logging of the Seacanairy, configured once for all the files
+The sensor files (and the other files) only get their logger with get_logger(), and seacanairy.py (or a sensor file
+executed directly) calls setup() once, at the start.
+The messages are put in a queue by the thread which logs them (QueueHandler), and a background thread
+(QueueListener) writes them in the log file and on the console: the reading of the sensors never waits for the
+SD card.
+
+Give the values as arguments (%-style), the message is then only created if it is really logged:
+    logger.debug("SPI reading is: %s", reading)  # and not "SPI reading is: " + str(reading)
+"""
+
+import os
+import queue
+import atexit
+import logging
+import logging.handlers
+
+import rotation  # log file started again when too big/old, the previous ones compressed
+
+file_format = logging.Formatter('%(asctime)s %(name)-12s %(levelname)-8s %(message)s', datefmt='%d-%m %H:%M:%S')
+console_format = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
+
+listener = None  # background thread writing the messages, None until setup()
+
+
+def setup(log_file, console_level=logging.INFO, max_bytes=0, interval=0, compression=rotation.NONE):
+    """
+    Send the messages of all the loggers to the log file and to the console, through a queue
+    Nothing is done if the logging is already set up
+    :param log_file: path of the log file (created with its folder if it doesn't exist)
+    :param console_level: minimum level of the messages shown on the console
+    :param max_bytes: size (bytes) above which a new log file is started, 0 = no limit
+    :param interval: time (seconds) after which a new log file is started, 0 = no limit
+    :param compression: compression of the previous log files: 'gzip', 'zstd' or 'none'
+    :return: nothing
+    """
+    global listener
+    if listener is not None:
+        return
+
+    folder = os.path.dirname(log_file)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    if max_bytes or interval:
+        file_handler = rotation.CompressingFileHandler(log_file, max_bytes, interval, compression)
+    else:
+        file_handler = logging.FileHandler(log_file, 'a', encoding='utf-8')
+    file_handler.setFormatter(file_format)
+
+    console = logging.StreamHandler()
+    console.setLevel(console_level)
+    console.setFormatter(console_format)
+
+    messages = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(messages, file_handler, console, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(logging.handlers.QueueHandler(messages))
+    # INFO for all the loggers, except the ones asking for DEBUG (see get_logger())
+    root.setLevel(logging.INFO)
+
+
+def get_logger(name, debug=False):
+    """
+    Logger of a file of the Seacanairy
+    :param name: name shown in the log messages
+    :param debug: True to also log the DEBUG messages of this logger
+    :return: logging.Logger
+    """
+    logger = logging.getLogger(name)
+    if debug:
+        logger.setLevel(logging.DEBUG)
+    return logger
+
+
+def stop():
+    """
+    Write the messages still in the queue and close the log file
+    :return: nothing
+    """
+    global listener
+    if listener is None:
+        return
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    listener = None
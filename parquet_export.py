@@ -0,0 +1,305 @@
+"""
+Export of the data measured by the Seacanairy in Parquet files (Apache Arrow), for the analysis on shore
+The files are partitioned by session and by date (UTC), readable directly as one dataset:
+    <folder>/session=<session name>/date=<YYYY-MM-DD>/<file>.parquet
+- the date and time of the cycle is the column 'timestamp' (UTC)
+- the column names are simplified (f-e "PM 2.5 (μg/m³)" -> "pm_2_5_ug_m3"), see normalize_name()
+- numbers are float64 (null when the sensor returned "error", "-", "no fix"...)
+- the status columns (few different texts, f-e "fix type") are dictionary encoded
+
+Two ways to use it:
+- ParquetSink: live export during the sampling (see 'Data storage' in 'seacanairy_settings.yaml')
+- convert_csv(): conversion of the -data.csv file of a session, also from the command line:
+    $ python3 parquet_export.py <session folder or -data.csv file> [output folder] [UTC offset (hours)]
+
+    import pyarrow.dataset
+    data = pyarrow.dataset.dataset("parquet", partitioning="hive").to_table().to_pandas()
+"""
+
+import os
+import re
+import csv
+import sys
+import logging
+from datetime import datetime, timedelta, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger('STORAGE')
+
+# values of the sensors meaning that there is no data
+no_data = ("error", "-", "no fix", "", "None", "False")
+
+# a text column with less different values than this is dictionary encoded by convert_csv()
+max_status_values = 16
+
+date_format = "%d-%m-%Y %H:%M:%S"  # format of the 'Date/Time' column of the csv file (local time)
+
+NUMBER = 'number'
+TEXT = 'text'
+STATUS = 'status'  # text with few different values (dictionary encoded)
+
+
+def normalize_name(name):
+    """
+    Simplify a column name of the csv file to use it easily in the analysis software
+    f-e "PM 2.5 (μg/m³)" -> "pm_2_5_ug_m3", "Temperature (°C)" -> "temperature_c"
+    :param name: column name of the csv file
+    :return: lowercase ascii name, words separated by '_'
+    """
+    name = name.replace('μ', 'u').replace('³', '3').replace('°', '').replace('%', 'percent_')
+    name = re.sub(r'[^0-9a-zA-Z]+', '_', name)
+    return name.strip('_').lower()
+
+
+def unique_names(names):
+    """
+    Normalize the column names and add a number to the names already used
+    :param names: List[column names of the csv file]
+    :return: List[normalized names, all different]
+    """
+    used = set()
+    to_return = []
+    for name in names:
+        name = normalize_name(name)
+        unique = name
+        number = 2
+        while unique in used:
+            unique = name + "_" + str(number)
+            number += 1
+        used.add(unique)
+        to_return.append(unique)
+    return to_return
+
+
+def to_number(value):
+    """
+    :param value: value given by a sensor (number, numeric text or "error", "-"...)
+    :return: float, None if there is no data
+    """
+    if value is None or value is False:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_text(value):
+    """
+    :param value: value given by a sensor
+    :return: string, None if there is no data
+    """
+    if value is None or str(value) in no_data:
+        return None
+    return str(value)
+
+
+def make_table(timestamps, rows, columns):
+    """
+    Create an Arrow table
+    :param timestamps: List[date and time of each row (seconds since 1970)]
+    :param rows: List[List[values, in the order of the columns]]
+    :param columns: List[(normalized column name, NUMBER, TEXT or STATUS)]
+    :return: pyarrow.Table
+    """
+    arrays = [pa.array([datetime.fromtimestamp(timestamp, timezone.utc) for timestamp in timestamps],
+                       type=pa.timestamp('s', tz='UTC'))]
+    names = ["timestamp"]
+    for i, (name, kind) in enumerate(columns):
+        values = [row[i] if i < len(row) else None for row in rows]
+        if kind == NUMBER:
+            array = pa.array([to_number(value) for value in values], type=pa.float64())
+        else:
+            array = pa.array([to_text(value) for value in values], type=pa.string())
+            if kind == STATUS:
+                array = array.dictionary_encode()
+        arrays.append(array)
+        names.append(name)
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def new_file_path(partition, first_timestamp, suffix):
+    """
+    Path of a new file of a partition, never the path of an existing file
+    The name is the date and time (UTC) of the first row of the file, so the files are sorted in the folder, f-e
+    '20261017T235900Z-0001.parquet'. A number is added if the name is already used (f-e session restarted).
+    :param partition: folder of the partition
+    :param first_timestamp: date and time of the first row of the file (seconds since 1970)
+    :param suffix: end of the name (sequence number of the file, 'converted'...)
+    :return: path of the file
+    """
+    name = datetime.fromtimestamp(first_timestamp, timezone.utc).strftime("%Y%m%dT%H%M%SZ") + "-" + suffix
+    path = os.path.join(partition, name + ".parquet")
+    number = 2
+    while os.path.exists(path):
+        path = os.path.join(partition, name + "-" + str(number) + ".parquet")
+        number += 1
+    return path
+
+
+def write_partitions(folder, session_name, suffix, timestamps, rows, columns):
+    """
+    Write the rows in one new file per date (UTC), the existing files are never overwritten
+    :param folder: root folder of the dataset
+    :param session_name: name of the sampling session
+    :param suffix: end of the names of the files (see new_file_path())
+    :param timestamps: List[date and time of each row (seconds since 1970)]
+    :param rows: List[List[values]]
+    :param columns: List[(normalized column name, NUMBER, TEXT or STATUS)]
+    :return: List[paths of the files written]
+    """
+    by_date = {}  # date: List[indexes of the rows]
+    for i, timestamp in enumerate(timestamps):
+        date = datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+        by_date.setdefault(date, []).append(i)
+
+    written = []
+    for date, indexes in by_date.items():
+        partition = os.path.join(folder, "session=" + session_name, "date=" + date)
+        os.makedirs(partition, exist_ok=True)
+        table = make_table([timestamps[i] for i in indexes], [rows[i] for i in indexes], columns)
+        path = new_file_path(partition, timestamps[indexes[0]], suffix)
+        pq.write_table(table, path + ".tmp")
+        os.replace(path + ".tmp", path)  # a file is never seen half written
+        written.append(path)
+    return written
+
+
+class ParquetSink:
+    """
+    Live export of the data during the sampling
+    Parquet files cannot be appended: the rows are kept in memory and written in a new file every 'rows_per_file'
+    rows (and when the software stops). The rows not written yet are lost at a power loss, but they are still in
+    the -data.csv file.
+    """
+
+    def __init__(self, folder, session_name, columns, rows_per_file=60):
+        """
+        :param folder: root folder of the dataset
+        :param session_name: name of the sampling session
+        :param columns: List[(column name of the csv file, NUMBER, TEXT or STATUS)]
+        :param rows_per_file: number of rows in each file
+        """
+        self.folder = folder
+        self.session_name = session_name
+        self.columns = list(zip(unique_names([name for name, kind in columns]), [kind for name, kind in columns]))
+        self.rows_per_file = max(1, rows_per_file)
+        self.file_number = 1  # sequence number of the next file written
+        self.timestamps = []
+        self.rows = []
+
+    def append(self, timestamp, values):
+        """
+        Add the data of one cycle
+        :param timestamp: date and time of the cycle (seconds since 1970)
+        :param values: List[values, in the order of the columns]
+        :return: nothing
+        """
+        self.timestamps.append(timestamp)
+        self.rows.append(list(values))
+        if len(self.rows) >= self.rows_per_file:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the rows kept in memory in new files
+        :return: nothing
+        """
+        if not self.rows:
+            return
+        try:
+            write_partitions(self.folder, self.session_name, str(self.file_number).zfill(4), self.timestamps,
+                             self.rows, self.columns)
+            self.file_number += 1
+            self.timestamps = []
+            self.rows = []
+        except (OSError, pa.ArrowException):
+            # the rows are kept and written with the next ones
+            logger.error("Failed to write the Parquet file of %s rows", len(self.rows), exc_info=True)
+
+    def close(self):
+        """
+        Write the rows kept in memory
+        :return: nothing
+        """
+        self.flush()
+
+
+# --------------------------------------------------------
+# CONVERSION OF THE CSV FILES
+# --------------------------------------------------------
+
+
+def column_kind(values):
+    """
+    Find the type of a column of the csv file
+    :param values: List[texts of the column]
+    :return: NUMBER, TEXT or STATUS
+    """
+    texts = set()
+    for value in values:
+        if value in no_data:
+            continue
+        if to_number(value) is None:
+            texts.add(value)
+    if not texts:
+        return NUMBER
+    if len(texts) < max_status_values:
+        return STATUS
+    return TEXT
+
+
+def convert_csv(csv_file, folder, session_name=None, utc_offset=0):
+    """
+    Convert the -data.csv file of a session into Parquet files (one per date, named '<first row>-converted.parquet')
+    :param csv_file: path of the -data.csv file
+    :param folder: root folder of the dataset
+    :param session_name: name of the session, taken from the name of the file if None
+    :param utc_offset: hours between the local time of the Raspberry which wrote the file and UTC (f-e 2 for
+                       UTC+2), 0 if the Raspberry is in UTC. The time zone of the computer converting the file is
+                       not used.
+    :return: List[paths of the files written]
+    """
+    if session_name is None:
+        session_name = os.path.basename(csv_file)
+        if session_name.endswith("-data.csv"):
+            session_name = session_name[:-len("-data.csv")]
+
+    with open(csv_file, newline='') as file:
+        lines = list(csv.reader(file))
+        file.close()
+    header = lines[0]
+
+    time_zone = timezone(timedelta(hours=utc_offset))
+    timestamps = []
+    rows = []
+    for line in lines[1:]:
+        try:
+            # the date and time is written in the local time of the Raspberry, day first
+            timestamps.append(datetime.strptime(line[0], date_format).replace(tzinfo=time_zone).timestamp())
+        except (ValueError, IndexError):
+            logger.warning("Line skipped, the date and time is not valid: %s", line[:1])
+            continue
+        rows.append(line[1:])
+
+    names = header[1:]
+    kinds = [column_kind([row[i] for row in rows if i < len(row)]) for i in range(len(names))]
+    columns = list(zip(unique_names(names), kinds))
+    return write_partitions(folder, session_name, "converted", timestamps, rows, columns)
+
+
+if __name__ == '__main__':  # if you run this code directly ($ python3 parquet_export.py session [output [offset]])
+    if len(sys.argv) not in (2, 3, 4):
+        print("Usage: python3 parquet_export.py <session folder or -data.csv file> [output folder] "
+              "[UTC offset of the Raspberry (hours), 0 by default]")
+        sys.exit(1)
+    source = sys.argv[1].rstrip('/')
+    if os.path.isdir(source):
+        source = os.path.join(source, os.path.basename(source) + "-data.csv")
+    output = sys.argv[2] if len(sys.argv) >= 3 else os.path.join(os.path.dirname(os.path.abspath(source)),
+                                                                 "parquet")
+    offset = float(sys.argv[3]) if len(sys.argv) == 4 else 0
+    for path in convert_csv(source, output, utc_offset=offset):
+        print("Written", path)
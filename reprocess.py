@@ -0,0 +1,356 @@
+"""
+Decoding again of the raw frames archived during the sampling (see 'frame_archive.py'), all at once with numpy
+The frames of a same type are put in one 2D array (one line per frame), then:
+- the checksums of all the frames are calculated together, one byte position after the other
+- the values are read with numpy.frombuffer() and little/big endian dtypes, and converted as the sensor files do
+  (OPCN3.decode_histogram()/read_PM(), CO2.getRHT()/getCO2P(), AFE.getADCreading())
+so months of data are decoded in a few seconds/minutes instead of decoding the frames one by one.
+
+The result is written in '<archive name>.npz' (numpy.savez), one structured array per type of frame, each with
+the date and time of the frames ('time', seconds since 1970) and 'valid' (checksum correct):
+
+    data = numpy.load("session-frames.npz")
+    PM1 = data["OPC-N3"]["PM1"][data["OPC-N3"]["valid"]]
+
+From the command line (a session folder is replaced by its -frames.bin file):
+    $ python3 reprocess.py <session folder or -frames.bin file> [<...>]
+"""
+
+import os
+import sys
+import time
+import logging
+
+import numpy as np
+
+import checksum  # tables of the CRC16/Modbus (OPC-N3) and of the CRC8 (EE894)
+import frame_archive  # format of the archive and tags of the frames
+
+logger = logging.getLogger('STORAGE')
+
+# --------------------------------------------------------
+# TYPES OF THE FRAMES
+# --------------------------------------------------------
+
+# OPC-N3 histogram (86 bytes, little endian), same fields as OPCN3.histogram_struct ('<24H4B4H3f6HH')
+histogram_dtype = np.dtype([
+    ('bins', '<u2', (24,)),
+    ('MToF', 'u1', (4,)),
+    ('sampling_time', '<u2'),
+    ('sample_flow_rate', '<u2'),
+    ('temperature', '<u2'),
+    ('relative_humidity', '<u2'),
+    ('PM', '<f4', (3,)),  # PM 1, PM 2.5, PM 10 (IEEE 754)
+    ('reject_count_glitch', '<u2'),
+    ('reject_count_long_TOF', '<u2'),
+    ('reject_count_ratio', '<u2'),
+    ('reject_count_out_of_range', '<u2'),
+    ('fan_revolution_count', '<u2'),
+    ('laser_status', '<u2'),
+    ('checksum', '<u2'),
+])
+
+# OPC-N3 PM only (14 bytes, little endian), same fields as OPCN3.PM_struct ('<3fH')
+PM_dtype = np.dtype([('PM', '<f4', (3,)), ('checksum', '<u2')])
+
+# EE894 frames (big endian): each value of 2 bytes is followed by its CRC8
+RHT_dtype = np.dtype([('temperature', '>u2'), ('temperature_crc', 'u1'),
+                      ('relative_humidity', '>u2'), ('relative_humidity_crc', 'u1')])
+CO2P_dtype = np.dtype([('CO2_average', '>u2'), ('CO2_average_crc', 'u1'),
+                       ('CO2_instant', '>u2'), ('CO2_instant_crc', 'u1'),
+                       ('pressure', '>u2'), ('pressure_crc', 'u1')])
+
+# LTC2497 of the AFE board (same values as 'AFE.py')
+vref = 5  # volts
+max_reading = 8388608.0
+ch0_mult = 1000  # volts -> mV
+adc_channels = {0xB0: "temperature_raw", 0xB8: "NO2_main", 0xB1: "NO2_aux", 0xB9: "OX_main", 0xB2: "OX_aux",
+                0xBA: "SO2_main", 0xB3: "SO2_aux", 0xBB: "CO_main", 0xB4: "CO_aux"}
+
+crc16_table = np.array(checksum.crc16_modbus_table, dtype=np.uint16)
+crc8_table = np.array(checksum.crc8_table, dtype=np.uint8)
+
+# --------------------------------------------------------
+# READING OF THE ARCHIVE
+# --------------------------------------------------------
+
+
+def index_frames(data):
+    """
+    Find the position of all the frames of an archive (the frames have different lengths, so they must be gone
+    through one after the other, but only their header is read)
+    :param data: content of the archive (bytes or numpy.memmap)
+    :return: (tags, monotonic clocks (ns), positions of the payloads, lengths), numpy arrays
+    """
+    if bytes(data[:len(frame_archive.magic)]) != frame_archive.magic:
+        raise ValueError("Not a Seacanairy frame archive")
+    buffer = memoryview(data).cast('B') if not isinstance(data, bytes) else data
+    unpack_from = frame_archive.frame_header.unpack_from
+    header_size = frame_archive.frame_header.size
+    size = len(buffer)
+
+    tags = []
+    clocks = []
+    positions = []
+    lengths = []
+    position = len(frame_archive.magic)
+    while position + header_size <= size:
+        tag, monotonic_ns, length = unpack_from(buffer, position)
+        position += header_size
+        if position + length > size:
+            break  # frame partially written
+        tags.append(tag)
+        clocks.append(monotonic_ns)
+        positions.append(position)
+        lengths.append(length)
+        position += length
+    return (np.array(tags, dtype=np.uint8), np.array(clocks, dtype=np.uint64),
+            np.array(positions, dtype=np.int64), np.array(lengths, dtype=np.int64))
+
+
+def frame_times(data, tags, clocks, positions):
+    """
+    Date and time of all the frames, from the anchor written before them
+    :param data: content of the archive, as numpy array of uint8
+    :param tags: numpy array of the tags
+    :param clocks: numpy array of the monotonic clocks (ns)
+    :param positions: numpy array of the positions of the payloads
+    :return: numpy array of float64 (seconds since 1970), NaN before the first anchor
+    """
+    anchors = np.flatnonzero(tags == frame_archive.ANCHOR)
+    anchor_times = data[positions[anchors][:, None] + np.arange(8)].copy().view('<f8')[:, 0]
+    # number of the last anchor before each frame
+    last_anchor = np.searchsorted(anchors, np.arange(len(tags)), side='right') - 1
+    times = np.full(len(tags), np.nan)
+    has_anchor = last_anchor >= 0
+    anchor_number = last_anchor[has_anchor]
+    elapsed = (clocks[has_anchor].astype(np.int64) - clocks[anchors][anchor_number].astype(np.int64)) / 1e9
+    times[has_anchor] = anchor_times[anchor_number] + elapsed
+    return times
+
+
+def gather(data, positions, length):
+    """
+    Put the payloads of the same length in one 2D array
+    :param data: content of the archive, as numpy array of uint8
+    :param positions: numpy array of the positions of the payloads
+    :param length: length of the payloads
+    :return: numpy array of uint8, shape (number of frames, length)
+    """
+    return data[positions[:, None] + np.arange(length)]
+
+
+# --------------------------------------------------------
+# CHECKSUMS
+# --------------------------------------------------------
+
+
+def crc16_modbus(frames):
+    """
+    CRC16/Modbus of many frames at once (same calculation as checksum.crc16_modbus())
+    :param frames: numpy array of uint8, shape (number of frames, number of bytes)
+    :return: numpy array of uint16, one checksum per frame
+    """
+    crc = np.full(len(frames), 0xFFFF, dtype=np.uint16)
+    for column in range(frames.shape[1]):
+        crc = (crc >> 8) ^ crc16_table[(crc ^ frames[:, column]) & 0xFF]
+    return crc
+
+
+def crc8(frames):
+    """
+    CRC8 (polynomial 0x31) of many frames at once (same calculation as checksum.crc8())
+    :param frames: numpy array of uint8, shape (number of frames, number of bytes)
+    :return: numpy array of uint8, one checksum per frame
+    """
+    crc = np.full(len(frames), 0xFF, dtype=np.uint8)
+    for column in range(frames.shape[1]):
+        crc = crc8_table[crc ^ frames[:, column]]
+    return crc
+
+
+def check_crc8_pairs(frames):
+    """
+    Check the EE894 frames: each pair of bytes is followed by its CRC8
+    :param frames: numpy array of uint8, shape (number of frames, 3 * number of values)
+    :return: numpy array of booleans, True if all the CRC8 of the frame are correct
+    """
+    valid = np.ones(len(frames), dtype=bool)
+    for start in range(0, frames.shape[1] - 2, 3):
+        valid &= crc8(frames[:, start:start + 2]) == frames[:, start + 2]
+    return valid
+
+
+# --------------------------------------------------------
+# DECODING
+# --------------------------------------------------------
+
+
+def decode_histograms(frames):
+    """
+    Decode the OPC-N3 histograms, with the conversions of OPCN3.decode_histogram()
+    :param frames: numpy array of uint8, shape (number of frames, 86)
+    :return: Dictionary{field name: numpy array}, fields of schema.OPCN3Record + 'valid'
+    """
+    raw = np.frombuffer(np.ascontiguousarray(frames).tobytes(), dtype=histogram_dtype)
+    with np.errstate(invalid='ignore'):  # frames with a wrong checksum can contain NaN
+        PM = raw['PM'].astype(np.float64)
+    decoded = {
+        'PM1': np.round(PM[:, 0], 2),
+        'PM25': np.round(PM[:, 1], 2),
+        'PM10': np.round(PM[:, 2], 2),
+        'temperature': np.round(-45 + 175 * (raw['temperature'] / (2 ** 16 - 1)), 2),  # °C
+        'relative_humidity': np.round(100 * (raw['relative_humidity'] / (2 ** 16 - 1)), 2),  # %RH
+        'sampling_time': raw['sampling_time'] / 100,
+        'sample_flow_rate': raw['sample_flow_rate'] / 100,
+    }
+    for i in range(24):
+        decoded['bin' + str(i)] = raw['bins'][:, i]
+    for i, bin_number in enumerate((1, 3, 5, 7)):
+        decoded['bin' + str(bin_number) + '_MToF'] = raw['MToF'][:, i]
+    for name in ('reject_count_glitch', 'reject_count_long_TOF', 'reject_count_ratio', 'reject_count_out_of_range',
+                 'fan_revolution_count', 'laser_status'):
+        decoded[name] = raw[name]
+    decoded['valid'] = crc16_modbus(frames[:, :-2]) == raw['checksum']
+    return decoded
+
+
+def decode_PM(frames):
+    """
+    Decode the PM only frames of the OPC-N3, as OPCN3.read_PM()
+    :param frames: numpy array of uint8, shape (number of frames, 14)
+    :return: Dictionary{field name: numpy array}
+    """
+    raw = np.frombuffer(np.ascontiguousarray(frames).tobytes(), dtype=PM_dtype)
+    with np.errstate(invalid='ignore'):  # frames with a wrong checksum can contain NaN
+        PM = raw['PM'].astype(np.float64)
+    return {
+        'PM1': np.round(PM[:, 0], 2),
+        'PM25': np.round(PM[:, 1], 2),
+        'PM10': np.round(PM[:, 2], 2),
+        'valid': crc16_modbus(frames[:, :-2]) == raw['checksum'],
+    }
+
+
+def decode_RHT(frames):
+    """
+    Decode the temperature and relative humidity frames of the EE894, as CO2.getRHT()
+    :param frames: numpy array of uint8, shape (number of frames, 6)
+    :return: Dictionary{field name: numpy array}
+    """
+    raw = np.frombuffer(np.ascontiguousarray(frames).tobytes(), dtype=RHT_dtype)
+    return {
+        'temperature': np.round(raw['temperature'] / 100 - 273.15, 2),  # °C
+        'relative_humidity': raw['relative_humidity'] / 100,  # %RH
+        'valid': check_crc8_pairs(frames),
+    }
+
+
+def decode_CO2P(frames):
+    """
+    Decode the CO2 and pressure frames of the EE894, as CO2.getCO2P()
+    :param frames: numpy array of uint8, shape (number of frames, 9)
+    :return: Dictionary{field name: numpy array}
+    """
+    raw = np.frombuffer(np.ascontiguousarray(frames).tobytes(), dtype=CO2P_dtype)
+    return {
+        'CO2_average': raw['CO2_average'].astype(np.float64),  # ppm
+        'CO2_instant': raw['CO2_instant'].astype(np.float64),  # ppm
+        'pressure': raw['pressure'] / 10,  # hPa
+        'valid': check_crc8_pairs(frames),
+    }
+
+
+def decode_ADC(frames):
+    """
+    Decode the readings of the LTC2497, as AFE.getADCreading()
+    :param frames: numpy array of uint8, shape (number of frames, 1 + bytes read), the first byte is the channel
+    :return: Dictionary{field name: numpy array}, 'over_range' is True when the input was open or above vref
+             (see adc_channels for the AFE column of each channel)
+    """
+    channel = frames[:, 0]
+    reading = frames[:, 1:4].astype(np.int64)
+    value = ((reading[:, 0] & 0x3F) << 16) + (reading[:, 1] << 8) + (reading[:, 2] & 0xE0)
+    return {
+        'channel': channel,
+        'millivolts': ch0_mult * value * vref / max_reading,
+        'over_range': (reading[:, 0] & 0b11000000) == 0b11000000,
+        'valid': np.ones(len(frames), dtype=bool),  # no checksum on the ADC readings
+    }
+
+
+def to_structured(columns):
+    """
+    Put the arrays of the same length in one structured array (one line per frame)
+    :param columns: Dictionary{field name: numpy array}
+    :return: numpy structured array
+    """
+    names = list(columns)
+    count = len(columns[names[0]]) if names else 0
+    array = np.zeros(count, dtype=[(name, columns[name].dtype) for name in names])
+    for name in names:
+        array[name] = columns[name]
+    return array
+
+
+# type of the frames: (tag, name in the output, length of the payload, decoding function)
+decoders = [
+    (frame_archive.OPC_HISTOGRAM, "OPC-N3", histogram_dtype.itemsize, decode_histograms),
+    (frame_archive.OPC_PM, "OPC-N3 PM", PM_dtype.itemsize, decode_PM),
+    (frame_archive.CO2_RHT, "CO2 RH and temperature", RHT_dtype.itemsize, decode_RHT),
+    (frame_archive.CO2_CO2P, "CO2 and pressure", CO2P_dtype.itemsize, decode_CO2P),
+    (frame_archive.ADC, "AFE ADC", None, decode_ADC),  # length depends on the number of bytes read
+]
+
+
+def reprocess(file_path):
+    """
+    Decode all the frames of an archive
+    :param file_path: path of the -frames.bin file
+    :return: Dictionary{type of frame: numpy structured array}, with the fields 'time', 'monotonic_ns' and 'valid'
+    """
+    data = np.memmap(file_path, dtype=np.uint8, mode='r')
+    tags, clocks, positions, lengths = index_frames(data)
+    times = frame_times(data, tags, clocks, positions)
+
+    results = {}
+    for tag, name, length, decode in decoders:
+        selected = tags == tag
+        if length is None:
+            # the most frequent length (the frames with another length are not valid)
+            found = lengths[selected]
+            length = int(np.bincount(found).argmax()) if len(found) else 4
+        wrong_length = selected & (lengths != length)
+        if wrong_length.any():
+            logger.warning("%s '%s' frames of '%s' don't have %s bytes, skipped", int(wrong_length.sum()), name,
+                           file_path, length)
+        selected &= lengths == length
+        columns = {'time': times[selected], 'monotonic_ns': clocks[selected]}
+        columns.update(decode(gather(data, positions[selected], length)))
+        results[name] = to_structured(columns)
+    return results
+
+
+def output_path(file_path):
+    """
+    :param file_path: path of the -frames.bin file
+    :return: path of the decoded file ('.npz' instead of '.bin')
+    """
+    return os.path.splitext(file_path)[0] + ".npz"
+
+
+if __name__ == '__main__':  # if you run this code directly ($ python3 reprocess.py session [session...])
+    if len(sys.argv) < 2:
+        print("Usage: python3 reprocess.py <session folder or -frames.bin file> [<...>]")
+        sys.exit(1)
+    for source in sys.argv[1:]:
+        source = source.rstrip('/')
+        if os.path.isdir(source):
+            source = os.path.join(source, os.path.basename(source) + "-frames.bin")
+        started = time.monotonic()
+        decoded = reprocess(source)
+        np.savez(output_path(source), **decoded)
+        print(source, "->", output_path(source), "in", round(time.monotonic() - started, 2), "s")
+        for frame_type, values in decoded.items():
+            print("\t" + frame_type.ljust(25), str(len(values)).rjust(10), "frames,",
+                  str(int(values['valid'].sum())).rjust(10), "valid")
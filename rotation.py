@@ -0,0 +1,257 @@
+"""
+Rotation of the data and log files of the Seacanairy
+When a file is too big (or too old), it is closed and renamed with the date and time of the rotation
+(f-e 'session-data.csv' -> 'session-data.20261017-120000.csv'), and a new file is started.
+The closed files (segments) are compressed (gzip or zstd) one by one in a background thread, so the sampling
+never waits for the compression. read_lines()/read_csv_rows() give the lines of all the segments and of the
+current file, as if it was one single file.
+"""
+
+import os
+import io
+import csv
+import glob
+import gzip
+import queue
+import shutil
+import logging
+import logging.handlers
+import threading
+from datetime import datetime
+
+try:
+    import zstandard  # optional, better and faster compression than gzip (pip3 install zstandard)
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger('ROTATION')
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+NONE = 'none'
+
+extensions = {GZIP: ".gz", ZSTD: ".zst"}
+
+
+def check_compression(compression):
+    """
+    Check that the compression method can be used
+    :param compression: 'gzip', 'zstd' or 'none'
+    :return: compression method to use ('gzip' if zstd is asked but not installed)
+    """
+    if compression == ZSTD and zstandard is None:
+        logger.warning("zstd compression needs the 'zstandard' library (pip3 install zstandard), using gzip")
+        return GZIP
+    if compression not in (GZIP, ZSTD, NONE):
+        raise ValueError("Compression must be 'gzip', 'zstd' or 'none', not " + str(compression))
+    return compression
+
+
+def segment_path(path, when=None):
+    """
+    Name of a closed segment: date and time of the rotation added before the extension
+    :param path: path of the file (f-e 'session-data.csv')
+    :param when: Optional: datetime of the rotation, now if None
+    :return: path of the segment (f-e 'session-data.20261017-120000.csv')
+    """
+    if when is None:
+        when = datetime.now()
+    base, extension = os.path.splitext(path)
+    segment = base + "." + when.strftime("%Y%m%d-%H%M%S") + extension
+    number = 2
+    while os.path.exists(segment) or any(os.path.exists(segment + suffix) for suffix in extensions.values()):
+        segment = base + "." + when.strftime("%Y%m%d-%H%M%S") + "-" + str(number) + extension
+        number += 1
+    return segment
+
+
+def segments(path):
+    """
+    All the closed segments of a file, from the oldest to the newest (compressed or not)
+    :param path: path of the current file
+    :return: List[paths of the segments]
+    """
+    base, extension = os.path.splitext(path)
+    found = []
+    for candidate in glob.glob(glob.escape(base) + ".*" + extension + "*"):
+        name = candidate
+        for suffix in extensions.values():
+            if name.endswith(suffix):
+                name = name[:-len(suffix)]
+        if name.endswith(extension) and name != path and not candidate.endswith(".tmp"):
+            found.append(candidate)
+    # the names contain the date and time: sorting the names sorts the segments
+    return sorted(found, key=lambda name: os.path.basename(name))
+
+
+# --------------------------------------------------------
+# BACKGROUND COMPRESSION
+# --------------------------------------------------------
+
+to_compress = queue.Queue()  # (path of the segment, compression method)
+compression_thread = None
+compression_thread_lock = threading.Lock()
+
+
+def compress_file(path, compression):
+    """
+    Compress a file and remove it (the compressed file is written with .tmp, then renamed, so that it is never
+    seen half written)
+    :param path: path of the file
+    :param compression: 'gzip' or 'zstd'
+    :return: path of the compressed file
+    """
+    compressed = path + extensions[compression]
+    with open(path, 'rb') as source, open(compressed + ".tmp", 'wb') as destination:
+        if compression == ZSTD:
+            with zstandard.ZstdCompressor().stream_writer(destination, closefd=False) as writer:
+                shutil.copyfileobj(source, writer)
+        else:
+            with gzip.GzipFile(fileobj=destination, mode='wb', mtime=0) as writer:
+                shutil.copyfileobj(source, writer)
+    os.replace(compressed + ".tmp", compressed)
+    os.remove(path)
+    return compressed
+
+
+def compression_worker():
+    """
+    Compress the segments one after the other (background thread)
+    :return: nothing
+    """
+    while True:
+        path, compression = to_compress.get()
+        try:
+            compressed = compress_file(path, compression)
+            logger.debug("'%s' compressed in '%s'", path, compressed)
+        except OSError:
+            logger.error("Failed to compress '%s'", path, exc_info=True)
+        to_compress.task_done()
+
+
+def compress_later(path, compression):
+    """
+    Ask the background thread to compress a segment
+    :param path: path of the segment
+    :param compression: 'gzip', 'zstd' or 'none' (nothing is done)
+    :return: nothing
+    """
+    global compression_thread
+    if compression == NONE:
+        return
+    with compression_thread_lock:
+        if compression_thread is None:
+            compression_thread = threading.Thread(target=compression_worker, name='compression', daemon=True)
+            compression_thread.start()
+    to_compress.put((path, compression))
+
+
+def compress_old_segments(path, compression):
+    """
+    Compress the segments left uncompressed (f-e the software stopped during the compression)
+    :param path: path of the current file
+    :param compression: 'gzip', 'zstd' or 'none'
+    :return: nothing
+    """
+    if compression == NONE:
+        return
+    base, extension = os.path.splitext(path)
+    for temporary in glob.glob(glob.escape(base) + ".*" + extension + ".*.tmp"):
+        os.remove(temporary)  # compression not finished, started again below
+    for segment in segments(path):
+        if segment.endswith(extension):
+            compress_later(segment, compression)
+
+
+# --------------------------------------------------------
+# ROTATION OF THE LOG FILES
+# --------------------------------------------------------
+
+
+class CompressingFileHandler(logging.handlers.BaseRotatingHandler):
+    """
+    Logging handler writing in a file, started again when it is bigger than 'max_bytes' or older than 'interval'
+    seconds. The previous files are compressed in the background.
+    """
+
+    def __init__(self, filename, max_bytes=0, interval=0, compression=GZIP, encoding='utf-8'):
+        """
+        :param filename: path of the log file
+        :param max_bytes: maximum size of the file (bytes), 0 = no limit
+        :param interval: maximum age of the file (seconds), 0 = no limit
+        :param compression: 'gzip', 'zstd' or 'none'
+        """
+        super().__init__(filename, 'a', encoding=encoding)
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.compression = check_compression(compression)
+        self.opened = datetime.now()
+        compress_old_segments(self.baseFilename, self.compression)
+
+    def shouldRollover(self, record):
+        if self.max_bytes > 0 and self.stream is not None and self.stream.tell() >= self.max_bytes:
+            return True
+        if self.interval > 0 and (datetime.now() - self.opened).total_seconds() >= self.interval:
+            return True
+        return False
+
+    def doRollover(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            segment = segment_path(self.baseFilename)
+            os.rename(self.baseFilename, segment)
+            compress_later(segment, self.compression)
+        self.stream = self._open()
+        self.opened = datetime.now()
+
+
+# --------------------------------------------------------
+# READING
+# --------------------------------------------------------
+
+
+def open_text(path):
+    """
+    Open a file (compressed or not) as text
+    :param path: path of the file
+    :return: text file object
+    """
+    if path.endswith(extensions[GZIP]):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    if path.endswith(extensions[ZSTD]):
+        if zstandard is None:
+            raise ImportError("Reading '" + path + "' needs the 'zstandard' library (pip3 install zstandard)")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True),
+                                encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def read_lines(path):
+    """
+    Lines of all the segments and of the current file, from the oldest to the newest
+    :param path: path of the current file (f-e 'session-log.log')
+    :return: generator of lines (str, with the end of line)
+    """
+    for segment in segments(path) + ([path] if os.path.exists(path) else []):
+        with open_text(segment) as file:
+            for line in file:
+                yield line
+
+
+def read_csv_rows(path):
+    """
+    Rows of all the segments of a csv file and of the current file, the header is given only once
+    :param path: path of the current csv file (f-e 'session-data.csv')
+    :return: generator of rows (List[str])
+    """
+    header = None
+    for segment in segments(path) + ([path] if os.path.exists(path) else []):
+        with open_text(segment) as file:
+            for row in csv.reader(file):
+                if row == header:
+                    continue  # header repeated at the beginning of each segment
+                if header is None:
+                    header = row
+                yield row
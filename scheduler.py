@@ -0,0 +1,134 @@
+"""
+Timing functions shared by the Seacanairy files
+Start the sampling cycles on fixed clock boundaries (f-e every full minute) and wait without polling the clock
+"""
+
+import time
+import sys
+import logging
+from datetime import datetime
+from progress.bar import IncrementalBar  # beautiful progress bar during sampling
+
+logger = logging.getLogger('SCHEDULER')
+
+# What to do when a sampling cycle took more time than the sampling period
+SKIP = 'skip'  # forget the missed cycles and start at the next boundary in the future
+CATCH_UP = 'catch up'  # start the missed cycles immediately, one after the other, until back on time
+
+overrun_policies = [SKIP, CATCH_UP]
+
+max_catch_up = 10  # number of missed cycles above which 'catch up' gives up and starts again from now
+
+
+def sleep_until(deadline):
+    """
+    Sleep once until the given deadline, expressed with the monotonic clock
+    The monotonic clock does not jump when the system time is changed (f-e by NTP)
+    :param deadline: time.monotonic() value at which the function must return
+    :return: nothing
+    """
+    remaining = deadline - time.monotonic()
+    if remaining > 0:
+        time.sleep(remaining)
+    return
+
+
+def loading_bar(name, delay):
+    """
+    Show a loading bar on the screen during a certain amount of time
+    Make the user understand the software is doing/waiting for something
+    The bar is updated once per second, each step waits until an absolute deadline so that the total
+    waiting time does not drift. If nobody looks at the screen (no terminal), it sleeps only once.
+    :param name: Text to be shown on the left of the loading bar
+    :param delay: Amount of time the system is waiting in seconds
+    :return: nothing
+    """
+    start = time.monotonic()
+
+    if not sys.stdout.isatty():  # f-e when running as a service, the bar would not be seen anyway
+        sleep_until(start + delay)
+        return
+
+    steps = int(delay)
+    bar = IncrementalBar(name, max=max(steps, 1), suffix='%(elapsed)s/' + str(delay) + ' seconds')
+    for i in range(1, steps + 1):
+        sleep_until(start + i)
+        bar.next()
+    sleep_until(start + delay)  # remaining fraction of second, if any
+    bar.finish()
+    return
+
+
+class CycleScheduler:
+    """
+    Give the starting time of each sampling cycle
+    Cycles start on absolute boundaries (multiple of the sampling period since 1970 when aligned on the clock,
+    multiple of the sampling period since the first cycle if not), so the error does not add up from one cycle
+    to the next and the timestamps of different Seacanairy units can be compared
+    """
+
+    def __init__(self, period, align_on_clock=True, overrun_policy=SKIP):
+        """
+        :param period: sampling period in seconds
+        :param align_on_clock: True to start the cycles on multiples of the period (f-e every full minute)
+        :param overrun_policy: 'skip' or 'catch up', what to do when a cycle took longer than the period
+        """
+        if period <= 0:
+            raise ValueError("Sampling period must be a positive number of seconds")
+        if overrun_policy not in overrun_policies:
+            raise ValueError("Overrun policy must be one of " + str(overrun_policies) + ", not " + str(overrun_policy))
+        self.period = period
+        self.align_on_clock = align_on_clock
+        self.overrun_policy = overrun_policy
+        self.next_start = None  # wall clock time (time.time()) of the next cycle
+        self.skipped_cycles = 0  # total amount of cycles skipped because of overruns
+
+    def first_boundary(self, now):
+        """
+        Compute the starting time of the very first cycle
+        :param now: current wall clock time (time.time())
+        :return: wall clock time of the first cycle
+        """
+        if not self.align_on_clock:
+            return now
+        return (now // self.period + 1) * self.period
+
+    def wait_next_cycle(self):
+        """
+        Sleep (only once) until the next cycle must start
+        :return: wall clock time (time.time()) at which the cycle is scheduled
+        """
+        now = time.time()
+
+        if self.next_start is None:
+            self.next_start = self.first_boundary(now)
+
+        elif now > self.next_start:
+            # the previous cycle took more time than the sampling period
+            late = now - self.next_start
+            if self.overrun_policy == SKIP:
+                missed = int(late // self.period) + 1  # the boundary just missed and the following ones
+                self.skipped_cycles += missed
+                self.next_start += missed * self.period
+                logger.error("Sampling cycle took %s seconds more than expected (%s seconds), skipping %s cycle(s)",
+                             round(late, 1), round(self.period, 0), missed)
+            elif late > max_catch_up * self.period:
+                # f-e the system time has jumped, running all the missed cycles makes no sense
+                self.next_start = self.first_boundary(now)
+                logger.error("Sampling cycle started %s seconds too late, resynchronizing on the clock", round(late, 1))
+            else:
+                logger.error("Sampling cycle took %s seconds more than expected (%s seconds), catching up",
+                             round(late, 1), round(self.period, 0))
+
+        to_wait = self.next_start - now
+        if to_wait > 0:
+            print("Waiting before next measurement:", int(round(to_wait, 0)), "seconds (sampling time is set on",
+                  self.period, "seconds)")
+            # convert the wall clock deadline into a monotonic one and sleep only once
+            sleep_until(time.monotonic() + to_wait)
+
+        print("Starting new sample at", datetime.fromtimestamp(self.next_start).strftime("%H:%M:%S"))
+
+        cycle_start = self.next_start
+        self.next_start += self.period
+        return cycle_start
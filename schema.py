@@ -0,0 +1,178 @@
+"""
+Description of the data measured by each sensor of the Seacanairy
+Each sensor gives one record per sampling cycle (a namedtuple: light, no dictionary to build), with its fields in
+the order of the data file. The header of the data file, the lines written in it and the columns of the other
+storages (binary, SQLite, Parquet) are all created from the columns below, so they always match.
+
+A field is None when the sensor did not give a valid value: it is written "error" in the csv file.
+
+    record = schema.CO2Record(relative_humidity=55.2, temperature=21.4)
+    record.temperature  # 21.4
+    schema.to_row([record])  # [55.2, 21.4, 'error', 'error', 'error']
+"""
+
+from collections import namedtuple
+
+# type of the columns
+NUMBER = 'number'
+TEXT = 'text'
+STATUS = 'status'  # text with only a few different values (f-e "OK"/"NOK")
+
+# name: field of the record | title: column of the csv file | type: NUMBER, TEXT or STATUS | unit: unit of the value
+# width: maximum number of characters of the texts (for the storages with fixed size, see 'binary_storage.py')
+Column = namedtuple('Column', ['name', 'title', 'type', 'unit', 'width'], defaults=[None])
+
+error = "error"  # written in the csv file when there is no valid value
+
+
+def make_record(name, columns):
+    """
+    Create the record type of a sensor: a namedtuple with one field per column, None by default
+    :param name: name of the record type
+    :param columns: List[Column]
+    :return: namedtuple class, with the attribute 'columns'
+    """
+    record = namedtuple(name, [column.name for column in columns], defaults=[None] * len(columns))
+    record.columns = tuple(columns)
+    return record
+
+
+# --------------------------------------------------------
+# E+E ELEKTRONIK EE894 CO2 SENSOR (see 'CO2.py')
+# --------------------------------------------------------
+
+CO2_columns = [
+    Column('relative_humidity', "Relative Humidity (%RH)", NUMBER, "%RH"),
+    Column('temperature', "Temperature (°C)", NUMBER, "°C"),
+    Column('pressure', "Pressure (hPa)", NUMBER, "hPa"),
+    Column('CO2_average', "CO2 average (ppm)", NUMBER, "ppm"),
+    Column('CO2_instant', "CO2 instant (ppm)", NUMBER, "ppm"),
+]
+
+CO2Record = make_record('CO2Record', CO2_columns)
+
+# --------------------------------------------------------
+# ALPHASENSE OPC-N3 (see 'OPCN3.py')
+# --------------------------------------------------------
+# The fields are in the order of the histogram sent by the sensor
+
+OPCN3_columns = [
+    Column('PM1', "PM 1 (μg/m³)", NUMBER, "μg/m³"),
+    Column('PM25', "PM 2.5 (μg/m³)", NUMBER, "μg/m³"),
+    Column('PM10', "PM 10 (μg/m³)", NUMBER, "μg/m³"),
+    Column('temperature', "Temperature OPC (°C)", NUMBER, "°C"),
+    Column('relative_humidity', "Relative Humidity OPC (%RH)", NUMBER, "%RH"),
+    Column('sampling_time', "sampling time OPC (sec)", NUMBER, "s"),
+    Column('sample_flow_rate', "sample flow rate OPC (ml/s)", NUMBER, "ml/s"),
+] + [
+    Column('bin' + str(i), "bin " + str(i), NUMBER, "count") for i in range(24)
+] + [
+    Column('bin' + str(i) + '_MToF', "bin " + str(i) + " MToF", NUMBER, "1/3 µs") for i in (1, 3, 5, 7)
+] + [
+    Column('reject_count_glitch', "reject count glitch", NUMBER, "count"),
+    Column('reject_count_long_TOF', "reject count long TOF", NUMBER, "count"),
+    Column('reject_count_ratio', "reject count ratio", NUMBER, "count"),
+    Column('reject_count_out_of_range', "reject count out of range", NUMBER, "count"),
+    Column('fan_revolution_count', "fan revolution count", NUMBER, "count"),
+    Column('laser_status', "laser status", NUMBER, ""),
+]
+
+OPCN3Record = make_record('OPCN3Record', OPCN3_columns)
+
+# 'PM only' mode: the PM are read several times per cycle, their mean and maximum are stored instead of the histogram
+OPCN3_PM_columns = [
+    Column('PM1_mean', "PM 1 mean (μg/m³)", NUMBER, "μg/m³"),
+    Column('PM25_mean', "PM 2.5 mean (μg/m³)", NUMBER, "μg/m³"),
+    Column('PM10_mean', "PM 10 mean (μg/m³)", NUMBER, "μg/m³"),
+    Column('PM1_max', "PM 1 max (μg/m³)", NUMBER, "μg/m³"),
+    Column('PM25_max', "PM 2.5 max (μg/m³)", NUMBER, "μg/m³"),
+    Column('PM10_max', "PM 10 max (μg/m³)", NUMBER, "μg/m³"),
+    Column('readings', "PM readings OPC", NUMBER, "count"),
+]
+
+OPCN3PMRecord = make_record('OPCN3PMRecord', OPCN3_PM_columns)
+
+# --------------------------------------------------------
+# ALPHASENSE 4-AFE BOARD (see 'AFE.py')
+# --------------------------------------------------------
+# The gas concentrations are not calculated yet: "-" is written instead
+
+AFE_columns = [
+    Column('temperature', "temperature (°C)", NUMBER, "°C"),
+    Column('temperature_raw', "temperature (mV)", NUMBER, "mV"),
+    Column('NO2', "NO2 (ppm)", NUMBER, "ppm"),
+    Column('NO2_main', "NO2 main (mV)", NUMBER, "mV"),
+    Column('NO2_aux', "NO2 aux (mV)", NUMBER, "mV"),
+    Column('OX', "OX (ppm)", NUMBER, "ppm"),
+    Column('OX_main', "OX main (mV)", NUMBER, "mV"),
+    Column('OX_aux', "OX aux (mV)", NUMBER, "mV"),
+    Column('SO2', "SO2 (ppm)", NUMBER, "ppm"),
+    Column('SO2_main', "SO2 main (mV)", NUMBER, "mV"),
+    Column('SO2_aux', "SO2 aux (mV)", NUMBER, "mV"),
+    Column('CO', "CO (ppm)", NUMBER, "ppm"),
+    Column('CO_main', "CO main (mV)", NUMBER, "mV"),
+    Column('CO_aux', "CO aux (mV)", NUMBER, "mV"),
+]
+
+AFERecord = make_record('AFERecord', AFE_columns)
+
+# --------------------------------------------------------
+# GPS (see 'GPS.py')
+# --------------------------------------------------------
+
+GPS_columns = [
+    Column('current_time', "Date and time (UTC)", TEXT, "UTC", 21),  # f-e "17-10-26 01:23:53 UTC"
+    Column('fix_date_and_time', "GPS fix date and time (UTC)", TEXT, "UTC", 17),
+    Column('latitude', "latitude", TEXT, "°'", 16),
+    Column('longitude', "longitude", TEXT, "°'", 16),
+    Column('SOG', "SOG (kts)", NUMBER, "kts"),
+    Column('COG', "COG", NUMBER, "°"),
+    Column('horizontal_precision', "horizontal dilution of precision", NUMBER, ""),
+    Column('accuracy', "accuracy", STATUS, "", 9),
+    Column('altitude', "altitude (m)", TEXT, "m", 10),
+    Column('WGS84_correction', "WGS84 correction (m)", TEXT, "m", 10),
+    Column('fix_status', "fix type", STATUS, "", 20),
+    Column('status', "sensor status", STATUS, "", 5),
+]
+
+GPSRecord = make_record('GPSRecord', GPS_columns)
+
+# --------------------------------------------------------
+# DATA FILE
+# --------------------------------------------------------
+
+# Records of one sampling cycle, in the order of the data file
+records = [CO2Record, OPCN3Record, AFERecord, GPSRecord]
+PM_only_records = [CO2Record, OPCN3PMRecord, AFERecord, GPSRecord]  # OPC-N3 in 'PM only' mode
+
+
+def columns(record_types=None):
+    """
+    All the columns of the records, in the order of the data file
+    :param record_types: Optional: List[record types], all the sensors if None
+    :return: List[Column]
+    """
+    if record_types is None:
+        record_types = records
+    return [column for record_type in record_types for column in record_type.columns]
+
+
+def header(record_types=None):
+    """
+    Column titles of the data file
+    :param record_types: Optional: List[record types], all the sensors if None
+    :return: List[titles]
+    """
+    return [column.title for column in columns(record_types)]
+
+
+def to_row(cycle_records):
+    """
+    Values of the records of one cycle, in the order of the columns (None is written "error")
+    :param cycle_records: List[records], in the order of the header
+    :return: List[values]
+    """
+    row = []
+    for record in cycle_records:
+        row += [error if value is None else value for value in record]
+    return row
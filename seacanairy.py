@@ -7,12 +7,17 @@ the OPC-N3, the AFE board, the GPS, stop the pump, and store the whole in a file
 # import all libraries
 import time
 from datetime import date, datetime, timedelta
-import csv  # for storing data in file
-from progress.bar import IncrementalBar  # to show beautiful loading bar on the screen during sampling
+import storage  # for storing data in file (see 'storage.py')
+from scheduler import loading_bar, CycleScheduler  # loading bar and start of the cycles on the clock boundaries
+import timing  # duration of each phase of the sampling cycle
+import schema  # columns of the data file and records returned by the sensors
+import frame_archive  # raw frames of the sensors, to decode them again later
 import os  # to be able to create new files/folders and see the current path
+import atexit  # to write the last lines of the data file when the software stops
 import yaml  # to read the settings stored in the 'seacanairy_settings.yaml' file
 import logging  # to store the errors messages in a separate log file
-import RPi.GPIO as GPIO  # to put GPIO high/low to switch the air pump relay on and off
+import logs  # logging set up once for all the files, written by a background thread
+from concurrent.futures import ThreadPoolExecutor  # to read the different communication buses at the same time
 
 # ---------------------------------------
 # SETTINGS
@@ -48,6 +53,9 @@ OPC_sampling_time = settings['OPC-N3 sensor']['Sampling time']
 # OPCN3 Fan speed (0-100)
 OPC_fan_speed = settings['OPC-N3 sensor']['Fan speed']
 
+# 'histogram' or 'PM only' (mean and maximum of the PM read several times per cycle, see 'OPCN3.py')
+OPC_PM_only = settings['OPC-N3 sensor']['Mode'] == 'PM only'
+
 # Let the user choose if he want to activate the following sensor or not
 # Seen the problems encountered with GPS and OPCN3, could be good to disable the unnecessary sensors (GPS f-e)
 # This does not shut down the sensor alimentation
@@ -59,6 +67,58 @@ AFE_activation = settings['AFE Board']['Activate this sensor']
 # Air pump settings
 fresh_air_piping_flushing_time = settings['Seacanairy settings']['Flushing time before measurement']
 
+# Read each communication bus (SPI, I2C, UART) in its own thread
+# The sampling cycle then takes as long as the slowest sensor instead of the sum of all the sensors
+parallel_acquisition = settings['Seacanairy settings']['Read the sensors in parallel (one thread per bus)']
+
+# Start the cycles on multiples of the sampling period (f-e every full minute) to compare the data of several units
+align_on_clock = settings['Seacanairy settings']['Align the sampling cycles on the clock']
+
+# 'skip' or 'catch up' when a sampling cycle takes longer than the sampling period
+overrun_policy = settings['Seacanairy settings']['If a cycle takes longer than the sampling period']
+
+# How the lines are written in the data file (see 'storage.py')
+CSV_flush_rows = settings['Data storage']['Write the data file every (number of lines)']
+CSV_flush_interval = settings['Data storage']['Write the data file at least every (seconds)']
+CSV_fsync = settings['Data storage']['Force the writing on the SD card (fsync)']
+CSV_preallocate = settings['Data storage']['Preallocated space in the data file (kilobytes)'] * 1024
+
+# Start a new data/log file when it is too big or too old, and compress the previous ones (see 'rotation.py')
+rotation_size = int(settings['Data storage']['Start a new data/log file when bigger than (megabytes)'] * 1024 * 1024)
+rotation_interval = settings['Data storage']['Start a new data/log file every (hours)'] * 3600
+compression = settings['Data storage']['Compression of the previous data/log files']
+
+# Also store the data in a binary file, faster to load for the analysis (needs numpy, see 'binary_storage.py')
+binary_storage_activation = settings['Data storage']['Also store the data in a binary file (numpy)']
+
+# Also store the data in a SQLite database, to select the data by date and position (see 'sqlite_storage.py')
+SQLite_storage_activation = settings['Data storage']['Also store the data in a SQLite database']
+SQLite_batch_size = settings['Data storage']['Number of lines per SQLite transaction']
+
+# Also export the data in Parquet files, partitioned by session and date (see 'parquet_export.py')
+parquet_export_activation = settings['Data storage']['Also export the data in Parquet files (pyarrow)']
+parquet_rows_per_file = settings['Data storage']['Number of lines per Parquet file']
+
+# Also store the raw bytes received from the sensors, before decoding (see 'frame_archive.py')
+frame_archive_activation = settings['Data storage']['Also store the raw frames of the sensors']
+
+# Store the duration of each phase of the sampling cycle (see 'timing.py')
+store_timing = settings['Seacanairy settings']['Store the duration of each phase']
+timing_window = settings['Seacanairy settings']['Number of cycles for the timing statistics']
+
+# -----------------------------------------
+# SIMULATION
+# -----------------------------------------
+# Replace the sensors by simulated ones (see 'simulation.py') to run the Seacanairy on a computer
+# Must be done before importing the hardware libraries and the sensor files
+
+if settings['Simulation']['Simulate the sensors']:
+    import simulation
+    simulation.install(settings['Simulation'])
+    print("The sensors are SIMULATED (see 'Simulation' in 'seacanairy_settings.yaml')")
+
+import RPi.GPIO as GPIO  # to put GPIO high/low to switch the air pump relay on and off
+
 # -----------------------------------------
 # CREATE FILES
 # -----------------------------------------
@@ -69,12 +129,16 @@ if not os.path.exists(directory_path):
     os.mkdir(directory_path)  # create the directory
     print("Created directory", directory_path)
 
-# Create a file to store the log if it doesn't exist
-log_file = directory_path + "-log.log"
-if not os.path.isfile(log_file):
-    os.mknod(log_file)  # create the file
-    print("Created log file", log_file)
-# You can't go further in the program without creating the folder and the logger file
+# -----------------------------------------
+# LOGGING
+# -----------------------------------------
+# Save the messages shown on the console in a dedicated file to understand the possible issues afterwards
+# Set up once for all the files, before importing the sensors (see 'logs.py'): the messages are written by a
+# background thread, the file is started again when too big/old if asked in the settings (see 'rotation.py')
+log_file = directory_path + "/" + project_name + "-log.log"
+logs.setup(log_file, logging.INFO, rotation_size, rotation_interval, compression)
+logger = logging.getLogger('SEACANAIRY')
+# Following logging messages must be called by logger.debug (...)
 
 # -----------------------------------------
 # IMPORT NECESSARY SENSORS
@@ -94,32 +158,17 @@ if GPS_activation:
 if AFE_activation:
     import AFE
 
-# -----------------------------------------
-# LOGGING
-# -----------------------------------------
-# Save the messages shown on the console in a dedicated file to understand the possible issues afterwards
+if CO2_activation or AFE_activation:
+    import i2c_bus  # I2C bus shared by the CO2 sensor and the AFE board
 
-message_level = logging.INFO
-
-# set up logging to file
-logging.basicConfig(level=message_level,
-                    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
-                    datefmt='%d-%m %H:%M:%S',
-                    filename=log_file,
-                    filemode='a')
-# define a Handler which writes INFO messages or higher to the sys.stderr/display
-console = logging.StreamHandler()
-console.setLevel(message_level)
-# set a format which is simpler for console use
-formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
-# tell the handler to use this format
-console.setFormatter(formatter)
-# add the handler to the root logger
-logging.getLogger().addHandler(console)
+if binary_storage_activation:
+    import binary_storage  # binary copy of the data file, needs numpy
 
-logger = logging.getLogger('SEACANAIRY')
+if SQLite_storage_activation:
+    import sqlite_storage  # copy of the data file in a database
 
-# Following logging messages must be called by logger.debug (...)
+if parquet_export_activation:
+    import parquet_export  # copy of the data file in Parquet files, needs pyarrow
 
 # -----------------------------------------
 # FUNCTIONS
@@ -129,6 +178,7 @@ logger = logging.getLogger('SEACANAIRY')
 GPIO.setmode(GPIO.BCM)  # use the GPIO names (GPIO1...) instead of the processor pin name (BCM...)
 pump_gpio = 27
 GPIO.setup(pump_gpio, GPIO.OUT, initial=GPIO.LOW)
+atexit.register(GPIO.output, pump_gpio, GPIO.LOW)  # the pump can be kept on between the cycles, stop it at the end
 
 
 # -----------------------------------------
@@ -136,22 +186,6 @@ GPIO.setup(pump_gpio, GPIO.OUT, initial=GPIO.LOW)
 # -----------------------------------------
 
 
-def loading_bar(name, delay):
-    """
-    Show a loading bar on the screen during a a certain amount of time
-    Make the user understand the software is doing/waiting for something
-    :param name: Text to be shown on the left of the loading bar
-    :param delay: Amount of time the system is waiting in seconds
-    :return: nothing
-    """
-    bar = IncrementalBar(name, max=(2 * delay), suffix='%(elapsed)s/' + str(delay) + ' seconds')
-    for i in range(2 * delay):
-        time.sleep(0.5)
-        bar.next()
-    bar.finish()
-    return
-
-
 def pump_start():
     """
     It put tension on the GPIO number 27 to turn on the air pump relay
@@ -170,53 +204,67 @@ def pump_stop():
     print("Air pump is off")
 
 
-def append_data_to_csv(*data_to_write):
+def OPC_keeps_sampling():
     """
-    Store all the arguments given in the -data.csv file
-    All arguments will be separated by a coma in the csv file
-    :param data_to_write: unlimited amount of arguments
-    :return: nothing
+    Tell if the OPC-N3 keeps sampling after the measurement (continuous sampling or 'PM only' mode, see 'OPCN3.py'):
+    the pump must then stay on, otherwise the next sample would be mostly air not renewed
+    :return: True if the pump must stay on
     """
-    to_write = [*data_to_write]  # Concatenate all the arguments in one list
+    return OPCN3_activation and (OPC_PM_only or OPCN3.sensor.running)
 
-    with open(csv_file, mode='a', newline='') as data_file:
-        writer = csv.writer(data_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-        writer.writerow(to_write)
-    data_file.close()  # close file after use(general safety practice)
 
+def read_SPI_bus():
+    """
+    Read the sensors connected to the SPI bus (OPC-N3)
+    :return: schema.OPCN3Record, or schema.OPCN3PMRecord in 'PM only' mode (all the fields None if the sensor is
+             disabled)
+    """
+    if not OPCN3_activation:
+        return record_types[1]()
+
+    # Get OPC-N3 sensor data (see 'OPCN3.py')
+    print("********************* OPC-N3 *********************")
+    return OPCN3.getdata(OPC_flushing_time, OPC_sampling_time)
 
-def wait_timestamp(starting_time):
+
+def read_I2C_bus():
     """
-    Wait that the sampling period is passed out to start the next measurement
-    :param starting_time: time at which the measurement has started ('time.time()' required)
-    :return: Nothing, function will stop when the next measurement can start
+    Read the sensors connected to the I2C bus 1 (CO2 sensor and AFE board)
+    Both sensors are on the same bus, they are read one after the other
+    :return: (schema.CO2Record, schema.AFERecord), all the fields None if the sensor is disabled
     """
-    finishing_time = time.time()
-    next_launching = starting_time + sampling_period  # time at which the next sample should start
-
-    # if the sampling process took more time than the expected sampling period
-    if finishing_time >= next_launching:
-        logger.error("Sampling cycle took " + str(round((finishing_time - next_launching), 1)) +
-                     "seconds more than expected (" + str(round(sampling_period, 0)) + " seconds)")
-        print("Starting new sample...")
-        return  # function stop and new sample start
-
-    while True:
-        now = time.time()
-        if now < next_launching:
-            to_wait = round(next_launching - now, 0)  # amount of time system will wait
-            print("Waiting before next measurement:", int(to_wait), "seconds (sampling time is set on",
-                  sampling_period,
-                  "seconds)", end="\r")
-            time.sleep(.2)
-        else:
-            break
-
-    # Delete the waiting countdown and skip a line
-    # Print a whole blank to remove completely the previous line ("Waiting before next measurement...")
-    print("                                                                                    ")
-    print("Starting new sample...")
-    return  # function stop and new sample start
+    CO2_record = schema.CO2Record()
+    AFE_record = schema.AFERecord()
+
+    if CO2_activation:
+        with timing.phase("CO2 trigger"):
+            CO2.trigger_measurement()
+
+        # Get CO2 sensor data (see 'CO2.py')
+        print("******************* CO2 SENSOR *******************")
+        CO2_record = CO2.get_data()
+
+    if AFE_activation:
+        # Get AFE board data (see 'AFE.py')
+        print("****************** AFE BOARD ********************")
+        AFE_record = AFE.getdata()
+
+    return CO2_record, AFE_record
+
+
+def read_UART_bus(timestamp=None):
+    """
+    Read the sensors connected to the UART port (GPS)
+    :param timestamp: moment (seconds since 1970) at which the position is wanted, last position if None
+    :return: schema.GPSRecord (all the fields None if the GPS is disabled)
+    """
+    if not GPS_activation:
+        return schema.GPSRecord()
+
+    # Get GPS information (read continuously in the background, see 'GPS.py')
+    print("********************** GPS **********************")
+    with timing.phase("GPS read"):
+        return GPS.get_position(timestamp)
 
 
 # --------------------------------------------
@@ -225,39 +273,66 @@ def wait_timestamp(starting_time):
 # Keep a trace of the day and time at which the system has started
 
 now = datetime.now()  # get time
-logger.info("Starting of Seacanairy on the " + str(now.strftime("%d/%m/%Y at %H:%M:%S")))  # delete time decimals
+logger.info("Starting of Seacanairy on the %s", now.strftime("%d/%m/%Y at %H:%M:%S"))  # delete time decimals
 
 # INITIATE CSV FILE
 
+# Records of one cycle, in the order of the data file (see 'schema.py')
+record_types = schema.PM_only_records if OPC_PM_only else schema.records
+
+# Name of the columns of the data file, created from the records of the sensors
+header = ["Date/Time"] + schema.header(record_types)
+
 # Create the file to store the data if it doesn't exist
 csv_file = directory_path + "/" + str(project_name) + "-data.csv"
-if not os.path.isfile(csv_file):  # if the file doesn't exist
-    os.mknod(csv_file)  # create the file
+if not os.path.isfile(csv_file):
     print("Created data file", csv_file)
-    # Write a first line to the file, this will be the column headers
-    append_data_to_csv("Date/Time", "Relative Humidity (%RH)", "Temperature (°C)", "Pressure (hPa)",
-                       "CO2 average (ppm)", "CO2 instant (ppm)",
-                       "PM 1 (μg/m³)", "PM 2.5 (μg/m³)", "PM 10 (μg/m³)",
-                       "Temperature OPC (°C)", "Relative Humidity OPC (%RH)",
-                       "sampling time OPC (sec)", "sample flow rate OPC (ml/s)",
-                       "bin 0", "bin 1", "bin 2", "bin 3", "bin 4", "bin 5",
-                       "bin 6", "bin 7", "bin 8", "bin 9", "bin 10", "bin 11",
-                       "bin 12", "bin 13", "bin 14", "bin 15", "bin 16", "bin 17",
-                       "bin 18", "bin 19", "bin 20", "bin 21", "bin 22", "bin 23",
-                       "bin 1 MToF", "bin 3 MToF", "bin 5 MToF", "bin 7 MToF",
-                       "reject count glitch", "reject count long TOF", "reject count ratio",
-                       "reject count out of range", "fan revolution count", "laser status",
-                       "temperature (°C)", "temperature (mV)",
-                       "NO2 (ppm)", "NO2 main (mV)", "NO2 aux (mV)",
-                       "OX (ppm)", "OX main (mV)", "OX aux (mV)",
-                       "SO2 (ppm)", "SO2 main (mV)", "SO2 aux (mV)",
-                       "CO2 (ppm)", "CO2 main (mV)", "CO2 aux (mV)",
-                       "Date and time (UTC)",
-                       "GPS fix date and time (UTC)", "latitude", "longitude", "SOG (kts)", "COG",
-                       "horizontal dilution of precision", "accuracy",
-                       "altitude (m)", "WGS84 correction (m)", "fix type", "sensor status")
 else:
-    logger.info("'" + str(csv_file) + "' already exist, appending data to this file")
+    logger.info("'%s' already exist, appending data to this file", csv_file)
+# The file stays open during the whole session, the incomplete last line is removed if the power was lost
+# The header is written at the beginning of the file, and of each new file after a rotation
+data_file = storage.CSVWriter(csv_file, CSV_flush_rows, CSV_flush_interval, CSV_fsync, CSV_preallocate, header,
+                              rotation_size, rotation_interval, compression)
+atexit.register(data_file.close)  # write the lines still in memory when the software stops
+
+# INITIATE BINARY FILE
+
+if binary_storage_activation:
+    # Same data in a binary file (see 'binary_storage.py'), numbers as float64 and the texts on a fixed size
+    # The date and time of the cycle is stored as seconds since 1970
+    binary_columns = [(header[0], 'f8')] + [(column.title, 'f8' if column.type == schema.NUMBER else
+                                             'S' + str(column.width)) for column in schema.columns(record_types)]
+    binary_file = binary_storage.BinaryWriter(directory_path + "/" + str(project_name) + "-data.bin",
+                                              binary_columns, CSV_fsync)
+    atexit.register(binary_file.close)
+
+# INITIATE SQLITE DATABASE
+
+if SQLite_storage_activation:
+    # Same data in a SQLite database (see 'sqlite_storage.py'), the date and time is the 'timestamp' column
+    SQLite_columns = [(column.title, 'REAL' if column.type == schema.NUMBER else 'TEXT')
+                      for column in schema.columns(record_types)]
+    SQLite_file = sqlite_storage.SQLiteWriter(directory_path + "/" + str(project_name) + "-data.sqlite",
+                                              SQLite_columns, "latitude", "longitude", SQLite_batch_size,
+                                              CSV_fsync)
+    atexit.register(SQLite_file.close)
+
+# INITIATE PARQUET EXPORT
+
+if parquet_export_activation:
+    # Same data in Parquet files (see 'parquet_export.py'), in the folder 'parquet' shared by all the sessions
+    # the types of schema.py are the ones of parquet_export.py ('number', 'text' or 'status')
+    parquet_columns = [(column.title, column.type) for column in schema.columns(record_types)]
+    parquet_sink = parquet_export.ParquetSink(current_working_directory + "/parquet", str(project_name),
+                                              parquet_columns, parquet_rows_per_file)
+    atexit.register(parquet_sink.close)
+
+# INITIATE FRAME ARCHIVE
+
+if frame_archive_activation:
+    # Raw frames of the sensors (see 'frame_archive.py'), started before the GPS reader to get all the NMEA lines
+    frame_archive.start(directory_path + "/" + str(project_name) + "-frames.bin", CSV_fsync)
+    atexit.register(frame_archive.close)
 
 # WARN USER IF A SENSOR IS DEACTIVATED
 
@@ -286,96 +361,114 @@ else:  # if user don't want to use the sensor...
         # It means that CO2 sensor is maybe not plugged in...
         pass  # nothing to do if it fails
 
+if GPS_activation:
+    # Start reading the GPS in the background, the first fixes will be available for the first sample
+    GPS.start_reader()
+
 if OPCN3_activation:
     # Set the desired OPC fan speed
     OPCN3.set_fan_speed(OPC_fan_speed)
+    # Serial number, firmware and bin boundaries of the sensor, read once (see 'OPCN3.load_configuration')
+    OPCN3.load_configuration()
+    # the fan and the laser can be kept on between the measurements (continuous sampling), turn them off at the end
+    atexit.register(OPCN3.stop)
+    if OPC_PM_only:
+        # Start reading the PM in the background, the first values will be available for the first sample
+        OPCN3.start_PM_reader()
 
 if CO2_activation:
     # Ask the CO2 sensor to take a new sample
     CO2.trigger_measurement(True)
 
+# Duration of each phase of the cycle, with the statistics stored in the session folder
+if store_timing:
+    timing.setup(directory_path + "/" + str(project_name) + "-timing.json", timing_window)
+else:
+    timing.setup(None, timing_window)
+
+# Workers used to read the different buses at the same time (see 'read_SPI_bus', 'read_I2C_bus', 'read_UART_bus')
+executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix='bus')
+
 # LOOP
 
+# Give the starting time of each cycle, on absolute boundaries to avoid the drift from one cycle to the next
+scheduler = CycleScheduler(sampling_period, align_on_clock, overrun_policy)
+
 while True:
+    # Wait for the next cycle, and get the time in second at which the measurement start
+    start = scheduler.wait_next_cycle()  # return the time expressed in second since the python date reference
+    # a bit the same as 'millis()' on Arduino
+    # easier to work with than with a complex string datetime format and a timedelta function...
+
     # Get date and time to store in the Excel file
-    now = datetime.now()
+    # The scheduled time is used and not the current time, so that all the units write the same timestamps
+    now = datetime.fromtimestamp(start)
     now = now.strftime("%d-%m-%Y %H:%M:%S")  # remove the decimals and change the date order
 
-    # Get the time in second at which the measurement start
-    start = time.time()  # return the time expressed in second since the python date reference
-    # a bit the same as 'millis()' on Arduino
-    # easier to work with than with a complex string datetime format and a timedelta function...
+    timing.start_cycle()
 
-    pump_start()  # start the pump
+    with timing.phase("pump start"):
+        pump_start()  # start the pump
 
     # If user want to flush the piping system before beginning the sampling
     if fresh_air_piping_flushing_time != 0:
-        loading_bar('Flushing fresh air in the piping system', fresh_air_piping_flushing_time)
-
-    to_write = []  # create the list in which data to store will be saved
-    # [a, b, c] + [d, e, f] = [a, b, c, d, e, f]
-
-    CO2.trigger_measurement()
-
-    if OPCN3_activation:
-        # Get OPC-N3 sensor data (see 'OPCN3.py')
-        print("********************* OPC-N3 *********************")
-        OPC_data = OPCN3.getdata(OPC_flushing_time, OPC_sampling_time)
-        to_write += [OPC_data["PM 1"], OPC_data["PM 2.5"], OPC_data["PM 10"],
-                     OPC_data["temperature"], OPC_data["relative humidity"],
-                     OPC_data["sampling time"], OPC_data["sample flow rate"],
-                     OPC_data["bin 0"], OPC_data["bin 1"], OPC_data["bin 2"], OPC_data["bin 3"],
-                     OPC_data["bin 4"], OPC_data["bin 5"], OPC_data["bin 6"], OPC_data["bin 7"],
-                     OPC_data["bin 8"], OPC_data["bin 9"], OPC_data["bin 10"], OPC_data["bin 11"],
-                     OPC_data["bin 12"], OPC_data["bin 13"], OPC_data["bin 14"], OPC_data["bin 15"],
-                     OPC_data["bin 16"], OPC_data["bin 17"], OPC_data["bin 18"], OPC_data["bin 19"],
-                     OPC_data["bin 20"], OPC_data["bin 21"], OPC_data["bin 22"], OPC_data["bin 23"],
-                     OPC_data["bin 1 MToF"], OPC_data["bin 3 MToF"],
-                     OPC_data["bin 5 MToF"], OPC_data["bin 7 MToF"],
-                     OPC_data["reject count glitch"],
-                     OPC_data["reject count long TOF"], OPC_data["reject count ratio"],
-                     OPC_data["reject count out of range"],
-                     OPC_data["fan revolution count"], OPC_data["laser status"]]
-
-    if CO2_activation:
-        # Get CO2 sensor data (see 'CO2.py')
-        print("******************* CO2 SENSOR *******************")
-        CO2_data = CO2.get_data()
-        to_write += [CO2_data["relative humidity"], CO2_data["temperature"], CO2_data["pressure"],
-                     CO2_data["average"], CO2_data["instant"]]
-
-    if AFE_activation:
-        # Get OPC-N3 sensor data (see 'AFE.py')
-        print("****************** AFE BOARD ********************")
-        AFE_data = AFE.getdata()
-        to_write += [AFE_data["temperature"], AFE_data["temperature raw"],
-                     AFE_data["NO2 ppm"], AFE_data["NO2 main"], AFE_data["NO2 aux"],
-                     AFE_data["OX ppm"], AFE_data["OX main"], AFE_data["OX aux"],
-                     AFE_data["SO2 ppm"], AFE_data["SO2 main"], AFE_data["SO2 aux"],
-                     AFE_data["CO ppm"], AFE_data["CO main"], AFE_data["CO aux"]]
-
-    pump_stop()
-
-    if GPS_activation:
-        # print("Wait switching from SPI to UART...", end='\r')
-        # time.sleep(1)  # avoid too close communication between SPI of OPC and UART of GPS
-        # Get GPS information
-        print("********************** GPS **********************")
-        GPS_data = GPS.get_position()
-        to_write += [GPS_data["current time"], GPS_data["fix date and time"],
-                     GPS_data["latitude"], GPS_data["longitude"],
-                     GPS_data["SOG"], GPS_data["COG"], GPS_data["horizontal precision"], GPS_data["accuracy"],
-                     GPS_data["altitude"], GPS_data["WGS84 correction"], GPS_data["fix status"], GPS_data["status"]]
+        with timing.phase("flushing"):
+            loading_bar('Flushing fresh air in the piping system', fresh_air_piping_flushing_time)
+
+    if parallel_acquisition:
+        # Each bus gets its own worker: SPI0 (OPC-N3), I2C-1 (CO2 sensor and AFE board), UART (GPS)
+        # The CO2 sensor and the AFE board share the same I2C bus, so they are read one after the other
+        SPI_future = executor.submit(read_SPI_bus)
+        I2C_future = executor.submit(read_I2C_bus)
+        UART_future = executor.submit(read_UART_bus, start)
+
+        OPC_record = SPI_future.result()
+        CO2_record, AFE_record = I2C_future.result()
+        if not OPC_keeps_sampling():
+            with timing.phase("pump stop"):
+                pump_stop()  # the pump is only needed for the OPC-N3, the CO2 sensor and the AFE board
+        GPS_record = UART_future.result()
+
+    else:
+        OPC_record = read_SPI_bus()
+        CO2_record, AFE_record = read_I2C_bus()
+        if not OPC_keeps_sampling():
+            with timing.phase("pump stop"):
+                pump_stop()
+        GPS_record = read_UART_bus(start)
+
+    # Values of the records in the order of the header (see 'schema.py'), None is written "error"
+    to_write = schema.to_row([CO2_record, OPC_record, AFE_record, GPS_record])
 
     # Store everything in the csv file
-    append_data_to_csv(now, *to_write)
+    with timing.phase("CSV write"):
+        data_file.writerow([now, *to_write])
+        if binary_storage_activation:
+            binary_file.append([start, *to_write])  # seconds since 1970 instead of the date/time text
+        if SQLite_storage_activation:
+            SQLite_file.append(start, to_write)
+        if parquet_export_activation:
+            parquet_sink.append(start, to_write)
+        frame_archive.flush()  # nothing is done if the archive is not started
 
     # Time at which the sampling finishes
     finish = time.time()  # as previously, expressed in seconds since reference date
 
     # Calculate the amount of time the sampling process took, round to 0 to avoid decimals
     # int(...) to delete the remaining 0 behind the coma
-    logger.info("Sampling finished in " + str(int(round(finish - start, 0))) + " seconds")
+    logger.info("Sampling finished in %s seconds", int(round(finish - start, 0)))
+
+    # Warn if the phases measured are longer than the sampling period, and store their statistics
+    timing.end_cycle(sampling_period)
 
-    # Wait that the sampling period is passed
-    wait_timestamp(start)
+    if OPCN3_activation:
+        # continuous sampling: turn the fan and the laser off if the next cycle is far (see 'OPCN3.py')
+        pump_kept_on = OPC_keeps_sampling()
+        OPCN3.idle(scheduler.next_start - time.time())
+        if pump_kept_on and not OPC_keeps_sampling():
+            pump_stop()  # the fan and the laser have been turned off, the pump is not needed until the next cycle
+
+    if CO2_activation or AFE_activation:
+        logger.debug("I2C bus statistics: %s", i2c_bus.get_bus(1).statistics())
+    if OPCN3_activation:
+        logger.debug("OPC-N3 SPI statistics: %s", OPCN3.transmission_statistics())
@@ -0,0 +1,633 @@
+"""
+Simulated hardware for the Seacanairy
+Replace the spidev, smbus2, serial (pyserial) and RPi.GPIO libraries by simulated devices speaking the same
+protocols as the sensors:
+- Alphasense OPC-N3 on the SPI bus (busy/ready bytes 0x31/0xF3, histogram with CRC16...)
+- E+E Elektronik EE894 CO2 sensor on the I²C bus (frames with CRC8, custom memory)
+- LTC2497 ADC of the Alphasense AFE board (Pi-16ADC) on the I²C bus
+- U-BLOX-7 GNSS module on the UART port (NMEA lines, one fix per second)
+- GPIO of the Raspberry Pi (air pump relay)
+So that the whole seacanairy.py can run, be tested and benchmarked on a computer without the sensors.
+Activate it with 'Simulation' in 'seacanairy_settings.yaml', or call simulation.install() BEFORE importing the
+sensor files.
+"""
+
+import sys
+import types
+import time
+import math
+import random
+import struct
+import threading
+from datetime import datetime, timezone
+
+import checksum
+
+# --------------------------------------------------------
+# PARAMETERS
+# --------------------------------------------------------
+# Can be changed with install(), see also the 'Simulation' part of 'seacanairy_settings.yaml'
+
+latency = 0  # seconds added to each transaction on the buses
+error_rate = 0  # probability (0 to 1) that a transaction fails or that a frame is corrupted
+busy_answers = 2  # number of 'busy' (0x31) answers of the OPC-N3 before 'ready' (0xF3)
+OPC_replay_file = None  # file containing recorded OPC-N3 histograms (86 bytes each, one after the other)
+GPS_replay_file = None  # file containing recorded NMEA lines (f-e a log of the GPS)
+
+random_generator = random.Random(0)  # same simulated data at each execution
+
+
+def transaction_delay():
+    """
+    Wait the simulated latency of a transaction
+    :return: nothing
+    """
+    if latency > 0:
+        time.sleep(latency)
+
+
+def transaction_fails():
+    """
+    Decide randomly if a transaction fails, according to the error rate
+    :return: True if the transaction must fail
+    """
+    return error_rate > 0 and random_generator.random() < error_rate
+
+
+def corrupt(frame):
+    """
+    Change randomly one byte of a frame (the checksum will be wrong) according to the error rate
+    :param frame: List[bytes]
+    :return: List[bytes]
+    """
+    if transaction_fails() and frame:
+        frame = list(frame)
+        i = random_generator.randrange(len(frame))
+        frame[i] ^= 0xFF
+    return frame
+
+
+# --------------------------------------------------------
+# OPC-N3 (SPI)
+# --------------------------------------------------------
+
+
+class SimulatedOPCN3:
+    """
+    Alphasense OPC-N3 answering byte by byte on the SPI bus
+    """
+    busy = 0x31
+    ready = 0xF3
+
+    # default bin boundaries of the OPC-N3 (µm)
+    bin_boundaries = [0.35, 0.46, 0.66, 1.0, 1.3, 1.7, 2.3, 3.0, 4.0, 5.2, 6.5, 8.0, 10.0, 12.0, 14.0, 16.0,
+                      18.0, 20.0, 22.0, 25.0, 28.0, 31.0, 34.0, 37.0, 40.0]
+
+    def __init__(self):
+        self.fan = False
+        self.laser = False
+        self.fan_DAC = 255
+        self.pending = []  # bytes to send back during the next transfers
+        self.pending_time = 0  # time of the last transfer (forget the pending bytes after a pause)
+        self.argument_for = None  # command waiting for its argument bytes
+        self.arguments = []
+        self.busy_count = 0
+        self.histogram_start = time.monotonic()
+        self.replay = []
+        if OPC_replay_file:
+            with open(OPC_replay_file, 'rb') as file:
+                data = file.read()
+            self.replay = [data[i:i + 86] for i in range(0, len(data) - 85, 86)]
+        self.replay_index = 0
+
+    def transfer(self, data):
+        """
+        Exchange bytes with the sensor (what the RPi sends and what the sensor sends at the same time)
+        :param data: List[bytes sent]
+        :return: List[bytes received]
+        """
+        now = time.monotonic()
+        if now - self.pending_time > 0.5:  # the sensor forgets the transaction after a pause
+            self.pending = []
+            self.argument_for = None
+        self.pending_time = now
+        return [self.exchange(byte) for byte in data]
+
+    def exchange(self, byte):
+        if self.argument_for is not None:
+            return self.argument(byte)
+        if self.pending:
+            return self.pending.pop(0)
+        return self.command(byte)
+
+    def command(self, byte):
+        """
+        First byte of a transaction: the sensor answers 'busy' a few times then 'ready'
+        """
+        if self.busy_count < busy_answers:
+            self.busy_count += 1
+            return self.busy
+        self.busy_count = 0
+
+        if byte == 0x03:  # power state, one argument
+            self.argument_for = 0x03
+        elif byte == 0x42:  # fan potentiometer, two arguments
+            self.argument_for = 0x42
+            self.arguments = []
+        elif byte == 0x13:  # DAC and power status
+            self.pending = [int(self.fan), int(self.laser), self.fan_DAC, 200, int(self.laser), 0x02]
+        elif byte == 0x30:  # histogram
+            self.pending = corrupt(self.histogram())
+        elif byte == 0x32:  # PM only
+            self.pending = corrupt(self.PM())
+        elif byte == 0x10:  # serial number
+            self.pending = list(b"OPC-N3 177510000 (simulated)".ljust(60))
+        elif byte == 0x3F:  # information string
+            self.pending = list(b"OPC-N3 Iss1.1 FirmwareVer=1.17a...............BS (simulated)".ljust(60)[:60])
+        elif byte == 0x12:  # firmware version (major, minor)
+            self.pending = [1, 17]
+        elif byte == 0x3C:  # configuration variables
+            self.pending = self.configuration()
+        else:
+            return 0x00  # unknown command
+        return self.ready
+
+    def argument(self, byte):
+        """
+        Bytes following a command which needs arguments
+        """
+        if self.argument_for == 0x03:
+            self.argument_for = None
+            if byte == 0x02:
+                self.fan = False
+            elif byte == 0x03:
+                self.fan = True
+            elif byte == 0x06:
+                self.laser = False
+            elif byte == 0x07:
+                self.laser = True
+            return 0x03
+        self.arguments.append(byte)  # fan potentiometer: [0, value]
+        if len(self.arguments) == 2:
+            self.argument_for = None
+            self.fan_DAC = self.arguments[1]
+        return 0x42
+
+    def histogram(self):
+        """
+        Create the 86 bytes of a histogram and start a new one (as the real sensor does)
+        """
+        if self.replay:
+            frame = self.replay[self.replay_index % len(self.replay)]
+            self.replay_index += 1
+            self.histogram_start = time.monotonic()
+            return list(frame)
+
+        now = time.monotonic()
+        sampling_time = min(now - self.histogram_start, 600)
+        self.histogram_start = now
+
+        flow_rate = 5.5  # ml/s
+        if self.fan and self.laser:
+            # about 20 particles per ml in the first bin, less and less in the bigger bins
+            means = [20 / (i + 1) ** 2 * flow_rate * sampling_time for i in range(24)]
+            bins = [int(random_generator.gauss(mean, math.sqrt(mean) + 0.1)) for mean in means]
+            bins = [max(0, min(count, 0xFFFF)) for count in bins]
+            PM = [max(0.0, random_generator.gauss(mean, mean / 10)) for mean in (3.0, 6.0, 12.0)]
+        else:
+            bins = [0] * 24
+            PM = [0.0, 0.0, 0.0]
+        MToF = [random_generator.randrange(20, 40) for _ in range(4)]
+        temperature = int((21.5 + 45) / 175 * 65535)
+        relative_humidity = int(55.0 / 100 * 65535)
+        fan_revolutions = int(sampling_time * 100) if self.fan else 0
+        frame = struct.pack('<24H4B4H3f6H', *bins, *MToF, min(int(sampling_time * 100), 0xFFFF),
+                            int(flow_rate * 100), temperature, relative_humidity, *PM,
+                            0, 0, 0, 0, fan_revolutions & 0xFFFF, 600 if self.laser else 0)
+        return list(frame + struct.pack('<H', checksum.crc16_modbus(frame)))
+
+    def PM(self):
+        """
+        Create the 14 bytes of a PM reading (PM 1, PM 2.5, PM 10 and checksum)
+        """
+        if self.fan and self.laser:
+            PM = [max(0.0, random_generator.gauss(mean, mean / 10)) for mean in (3.0, 6.0, 12.0)]
+        else:
+            PM = [0.0, 0.0, 0.0]
+        frame = struct.pack('<3f', *PM)
+        return list(frame + struct.pack('<H', checksum.crc16_modbus(frame)))
+
+    def configuration(self):
+        """
+        Create the 168 bytes of the configuration variables
+        """
+        frame = struct.pack('<25H', *[int(100 + 160 * i) for i in range(25)])  # bin boundaries (ADC)
+        frame += struct.pack('<25H', *[int(round(d * 100)) for d in self.bin_boundaries])  # bin boundaries (µm)
+        frame += struct.pack('<24H', *[100] * 24)  # bin weightings (1.00)
+        frame += struct.pack('<7H', 100, 250, 1000, 1440, 0, 0, 0)  # PM diameters, max TOF, AM parameters
+        frame += bytes([0, 0, 0, 0, 48, 0])  # AM flags, TOF to SFR factor, PVP, bin weighting index
+        return list(frame)
+
+
+class SpiDev:
+    """
+    Replace spidev.SpiDev
+    """
+
+    devices = {}  # simulated devices by (bus, device), shared by all the SpiDev objects
+
+    def __init__(self, bus=None, device=None):
+        self.max_speed_hz = 500000
+        self.mode = 0
+        self.device = None
+        if bus is not None:
+            self.open(bus, device)
+
+    def open(self, bus, device):
+        if (bus, device) not in SpiDev.devices:
+            SpiDev.devices[(bus, device)] = SimulatedOPCN3()
+        self.device = SpiDev.devices[(bus, device)]
+
+    def close(self):
+        self.device = None
+
+    def xfer(self, data, speed_hz=0, delay_usecs=0, bits_per_word=0):
+        if self.device is None:
+            raise OSError(9, "Bad file descriptor")  # same error as spidev when the port is closed
+        transaction_delay()
+        return self.device.transfer(data)
+
+    xfer2 = xfer
+
+    def writebytes(self, data):
+        self.xfer(data)
+
+    def readbytes(self, length):
+        return self.xfer([0] * length)
+
+
+# --------------------------------------------------------
+# EE894 CO2 SENSOR AND AFE BOARD ADC (I²C)
+# --------------------------------------------------------
+
+
+class SimulatedEE894:
+    """
+    E+E Elektronik EE894 CO2 sensor on the I²C bus
+    """
+
+    def __init__(self):
+        self.pointer = None  # last command written (the next reading depends on it)
+        self.custom_memory = [0] * 256
+        self.custom_memory[0:2] = [0x02, 0x58]  # measuring interval: 60.0 seconds (in 0.1 seconds)
+
+    @staticmethod
+    def pair(value):
+        """
+        Two bytes (MSB first) followed by their CRC8
+        """
+        data = [(value >> 8) & 0xFF, value & 0xFF]
+        return data + [checksum.crc8(data)]
+
+    def read_register(self, register):
+        return 0  # status byte: everything OK
+
+    def write(self, data):
+        if data[0:2] == [0x71, 0x54] and len(data) > 3:  # write to custom memory (index, bytes..., CRC8)
+            index = data[2]
+            values = data[3:-1]
+            if checksum.crc8(data[2:-1]) == data[-1]:
+                self.custom_memory[index:index + len(values)] = values
+            self.pointer = data[0:3]
+        else:
+            self.pointer = data
+
+    def read(self, length):
+        if self.pointer == [0xE0, 0x00]:  # temperature (0.01 K) and relative humidity (0.01 %RH)
+            temperature = int((21.0 + random_generator.gauss(0, 0.1) + 273.15) * 100)
+            relative_humidity = int((55.0 + random_generator.gauss(0, 0.5)) * 100)
+            frame = self.pair(temperature) + self.pair(relative_humidity)
+        elif self.pointer == [0xE0, 0x27]:  # CO2 average, CO2 instant (ppm) and pressure (0.1 mbar)
+            CO2 = int(random_generator.gauss(420, 5))
+            frame = self.pair(420) + self.pair(CO2) + self.pair(10132)
+        elif self.pointer is not None and self.pointer[0:2] == [0x71, 0x54]:  # read custom memory
+            index = self.pointer[2]
+            frame = self.custom_memory[index:index + length]
+        else:
+            frame = [0xFF] * length
+        return corrupt(frame[:length])
+
+
+class SimulatedLTC2497:
+    """
+    LTC2497 16 channels ADC of the AFE board (Pi-16ADC) on the I²C bus
+    """
+    vref = 5
+    max_reading = 8388608.0
+
+    # tension on each channel (volts): temperature, then main/auxiliary electrodes of NO2, OX, SO2, CO
+    tensions = {0xB0: 0.290, 0xB8: 0.282, 0xB1: 0.303, 0xB9: 0.317, 0xB2: 0.405,
+                0xBA: 0.328, 0xB3: 0.297, 0xBB: 0.277, 0xB4: 0.327}
+
+    def __init__(self):
+        self.channel = 0xB0
+
+    def read_register(self, register):
+        return 0
+
+    def write(self, data):
+        self.channel = data[0]
+
+    def read(self, length):
+        volts = self.tensions.get(self.channel, 0.0) + random_generator.gauss(0, 0.0005)
+        valor = int(max(volts, 0) / self.vref * self.max_reading)
+        # first bit = sign (1 = positive), second bit = over range (0), then 22 bits of data
+        frame = [0x80 | ((valor >> 16) & 0x3F), (valor >> 8) & 0xFF, valor & 0xE0]
+        return (frame + [0] * length)[:length]
+
+
+class i2c_msg:
+    """
+    Replace smbus2.i2c_msg
+    """
+
+    def __init__(self, address, read, data):
+        self.addr = address
+        self.is_read = read
+        self.buf = list(data)
+        self.len = len(self.buf)
+
+    @staticmethod
+    def write(address, buf):
+        return i2c_msg(address, False, buf)
+
+    @staticmethod
+    def read(address, length):
+        return i2c_msg(address, True, [0] * length)
+
+    def __iter__(self):
+        return iter(self.buf)
+
+    def __len__(self):
+        return self.len
+
+
+class SMBus:
+    """
+    Replace smbus2.SMBus
+    """
+
+    devices = {}  # simulated devices by (bus, address), shared by all the SMBus objects
+    devices_lock = threading.Lock()
+
+    def __init__(self, bus=None):
+        self.bus = bus
+        with SMBus.devices_lock:
+            if not SMBus.devices:
+                SMBus.devices[(1, 0x33)] = SimulatedEE894()
+                SMBus.devices[(1, 0b1110110)] = SimulatedLTC2497()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        pass
+
+    def device(self, address):
+        transaction_delay()
+        if (self.bus, address) not in SMBus.devices or transaction_fails():
+            raise OSError(121, "Remote I/O error")  # same error as smbus2 when nobody answers
+        return SMBus.devices[(self.bus, address)]
+
+    def read_byte_data(self, address, register):
+        return self.device(address).read_register(register)
+
+    def write_byte(self, address, value):
+        self.device(address).write([value])
+
+    def read_i2c_block_data(self, address, register, length):
+        return self.device(address).read(length)
+
+    def i2c_rdwr(self, *messages):
+        for message in messages:
+            device = self.device(message.addr)
+            if message.is_read:
+                message.buf = device.read(message.len)
+            else:
+                device.write(message.buf)
+
+
+# --------------------------------------------------------
+# GPS (UART)
+# --------------------------------------------------------
+
+
+def NMEA_line(body):
+    """
+    Add the '$', the checksum and the end of line to a NMEA sentence
+    :param body: str, sentence without '$' and checksum
+    :return: bytes
+    """
+    return ("$" + body + "*%02X\r\n" % checksum.nmea_checksum(body)).encode('ascii')
+
+
+class SimulatedGPS:
+    """
+    U-BLOX-7 GNSS module sending one fix per second, on a ship sailing at constant speed
+    """
+
+    def __init__(self):
+        self.latitude = 51.2300  # Antwerp
+        self.longitude = 4.4000
+        self.speed = 10.0  # knots
+        self.course = 270.0  # degrees
+        self.replay = []
+        if GPS_replay_file:
+            with open(GPS_replay_file, 'rb') as file:
+                self.replay = [line.strip() + b"\r\n" for line in file if line.startswith(b"$")]
+        self.replay_index = 0
+
+    @staticmethod
+    def NMEA_position(value, positive, negative, degree_digits):
+        compas = positive if value >= 0 else negative
+        value = abs(value)
+        deg = int(value)
+        return ("%0" + str(degree_digits) + "d%08.5f") % (deg, (value - deg) * 60), compas
+
+    def lines(self, now):
+        """
+        NMEA lines of one second
+        :param now: time (seconds since 1970)
+        :return: List[bytes]
+        """
+        if self.replay:
+            # send the recorded lines until the next GPRMC (one fix per second)
+            group = []
+            while len(group) < len(self.replay):
+                line = self.replay[self.replay_index % len(self.replay)]
+                if line.startswith(b"$GPRMC") and group:
+                    break
+                group.append(line)
+                self.replay_index += 1
+            return group
+
+        # move the ship
+        distance = self.speed / 3600  # nautical miles in one second = minutes of latitude
+        self.latitude += distance * math.cos(math.radians(self.course)) / 60
+        self.longitude += distance * math.sin(math.radians(self.course)) / 60 / math.cos(math.radians(self.latitude))
+
+        utc = datetime.fromtimestamp(now, timezone.utc)
+        fix_time = utc.strftime("%H%M%S") + ".00"
+        latitude, NS = self.NMEA_position(self.latitude, "N", "S", 2)
+        longitude, EW = self.NMEA_position(self.longitude, "E", "W", 3)
+        return [
+            NMEA_line("GPRMC," + fix_time + ",A," + latitude + "," + NS + "," + longitude + "," + EW + "," +
+                      "%.3f" % self.speed + "," + "%.2f" % self.course + "," + utc.strftime("%d%m%y") + ",,,A"),
+            NMEA_line("GPVTG," + "%.2f" % self.course + ",T,,M," + "%.3f" % self.speed + ",N,18.520,K,A"),
+            NMEA_line("GPGGA," + fix_time + "," + latitude + "," + NS + "," + longitude + "," + EW +
+                      ",1,08,1.01,12.3,M,46.9,M,,"),
+        ]
+
+
+class Serial:
+    """
+    Replace serial.Serial (pyserial), the GPS sends its lines once per second, in real time
+    """
+
+    def __init__(self, port=None, baudrate=9600, timeout=None, **kwargs):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.is_open = True
+        self.gps = SimulatedGPS()
+        self.buffer = b""
+        self.next_second = math.floor(time.time()) + 1  # the GPS sends its lines at the start of each second
+
+    def receive(self):
+        """
+        Add in the buffer the lines sent by the GPS since the last call
+        """
+        now = time.time()
+        while now >= self.next_second:
+            for line in self.gps.lines(self.next_second):
+                self.buffer += bytes(corrupt(list(line[:-2]))) + line[-2:]  # keep the end of line
+            self.next_second += 1
+
+    @property
+    def in_waiting(self):
+        self.receive()
+        return len(self.buffer)
+
+    def readline(self):
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        while True:
+            self.receive()
+            end = self.buffer.find(b"\n")
+            if end != -1:
+                line, self.buffer = self.buffer[:end + 1], self.buffer[end + 1:]
+                return line
+            if deadline is not None and time.time() >= deadline:
+                return b""
+            # sleep until the next second (or the timeout)
+            wake_up = self.next_second if deadline is None else min(self.next_second, deadline)
+            time.sleep(max(0.0, wake_up - time.time()))
+
+    def read_all(self):
+        self.receive()
+        data, self.buffer = self.buffer, b""
+        return data
+
+    def reset_input_buffer(self):
+        self.read_all()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+# --------------------------------------------------------
+# GPIO
+# --------------------------------------------------------
+
+
+class GPIO:
+    """
+    Replace RPi.GPIO, only keep the state of the pins in memory
+    """
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+
+    pins = {}
+
+    @staticmethod
+    def setmode(mode):
+        pass
+
+    @staticmethod
+    def setwarnings(flag):
+        pass
+
+    @staticmethod
+    def setup(pin, direction, initial=0, pull_up_down=None):
+        GPIO.pins[pin] = initial
+
+    @staticmethod
+    def output(pin, value):
+        GPIO.pins[pin] = value
+
+    @staticmethod
+    def input(pin):
+        return GPIO.pins.get(pin, 0)
+
+    @staticmethod
+    def cleanup(pin=None):
+        GPIO.pins.clear()
+
+
+# --------------------------------------------------------
+# INSTALLATION
+# --------------------------------------------------------
+
+
+def make_module(name, **items):
+    module = types.ModuleType(name)
+    module.__dict__.update(items)
+    return module
+
+
+def install(simulation_settings=None):
+    """
+    Replace the hardware libraries by the simulated ones
+    Must be called BEFORE importing the sensor files (OPCN3.py, CO2.py, AFE.py, GPS.py, i2c_bus.py)
+    :param simulation_settings: Optional: 'Simulation' part of 'seacanairy_settings.yaml'
+    :return: nothing
+    """
+    global latency, error_rate, busy_answers, OPC_replay_file, GPS_replay_file
+    if simulation_settings is not None:
+        latency = simulation_settings['Latency of each transaction (seconds)']
+        error_rate = simulation_settings['Error rate (0 to 1)']
+        busy_answers = simulation_settings['OPC-N3 busy answers before ready']
+        OPC_replay_file = simulation_settings['Replay OPC-N3 histograms from file'] or None
+        GPS_replay_file = simulation_settings['Replay GPS NMEA lines from file'] or None
+
+    GPIO_module = make_module('RPi.GPIO', **{name: getattr(GPIO, name) for name in dir(GPIO)
+                                             if not name.startswith('_')})
+    sys.modules.update({
+        'spidev': make_module('spidev', SpiDev=SpiDev),
+        'smbus2': make_module('smbus2', SMBus=SMBus, i2c_msg=i2c_msg),
+        'serial': make_module('serial', Serial=Serial),
+        'RPi': make_module('RPi', GPIO=GPIO_module),
+        'RPi.GPIO': GPIO_module,
+    })
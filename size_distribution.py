@@ -0,0 +1,218 @@
+"""
+Particle size distribution from the 24 bins of the OPC-N3 histogram, computed with numpy
+The geometry of the bins (diameters, width in log scale, volume of a particle) is computed only once, then the
+distributions of one histogram or of years of histograms are computed in one go:
+- number concentration of each bin (particles/cm³) = counts / (sampling time x sample flow rate)
+- dN/dlogDp (particles/cm³), dV/dlogDp (µm³/cm³) and dM/dlogDp (µg/m³) with the density of the particles
+The diameter of a bin is the geometric mean of its boundaries, the particles are considered as spheres.
+
+    geometry = size_distribution.BinGeometry(OPCN3.bin_boundaries())  # default OPC-N3 boundaries if None
+    result = size_distribution.distribute(bins, sampling_time, sample_flow_rate, density=1.65, geometry=geometry)
+    result["dN/dlogDp"]  # shape (number of histograms, 24)
+
+bins can be one histogram (24 values) or many (one line per histogram), see also from_records() (OPCN3.getdata())
+and from_reprocessed() ('OPC-N3' array of reprocess.py).
+
+From the command line (session folder, -data.csv file or -frames.npz file of reprocess.py):
+    $ python3 size_distribution.py <file> [density (g/cm³)]
+"""
+
+import os
+import csv
+import sys
+import json
+
+import numpy as np
+
+import schema  # titles of the columns of the data file
+
+# default bin boundaries of the OPC-N3 (µm), used when the configuration of the sensor is not known
+default_boundaries = [0.35, 0.46, 0.66, 1.0, 1.3, 1.7, 2.3, 3.0, 4.0, 5.2, 6.5, 8.0, 10.0, 12.0, 14.0, 16.0,
+                      18.0, 20.0, 22.0, 25.0, 28.0, 31.0, 34.0, 37.0, 40.0]
+
+default_density = 1.65  # g/cm³, density used by the OPC-N3 for its PM calculation
+
+number_of_bins = 24
+
+# configurations of the OPC-N3 already read (see 'OPCN3.load_configuration')
+configuration_cache_file = "OPCN3-configurations.json"
+
+
+class BinGeometry:
+    """
+    Geometry of the 24 bins, computed once for all the histograms
+    """
+
+    def __init__(self, boundaries=None, weightings=None):
+        """
+        :param boundaries: Optional: List[25 diameters (µm)], limits of the bins (default_boundaries if None)
+        :param weightings: Optional: List[24 factors] applied to the counts (f-e "bin weightings" of the sensor
+                           configuration), 1 if None
+        """
+        if boundaries is None:
+            boundaries = default_boundaries
+        self.boundaries = np.asarray(boundaries, dtype=np.float64)
+        if self.boundaries.shape != (number_of_bins + 1,) or np.any(np.diff(self.boundaries) <= 0):
+            raise ValueError("Bin boundaries must be " + str(number_of_bins + 1) + " increasing diameters")
+        lower = self.boundaries[:-1]
+        upper = self.boundaries[1:]
+        self.diameters = np.sqrt(lower * upper)  # µm, geometric mean of the boundaries
+        self.dlogDp = np.log10(upper / lower)
+        self.particle_volumes = np.pi / 6 * self.diameters ** 3  # µm³, volume of one particle of each bin
+        if weightings is None:
+            self.weightings = np.ones(number_of_bins)
+        else:
+            self.weightings = np.asarray(weightings, dtype=np.float64)
+
+
+default_geometry = BinGeometry()
+
+
+def distribute(bins, sampling_time, sample_flow_rate, density=default_density, geometry=default_geometry):
+    """
+    Size distributions of one or many histograms
+    A histogram without valid sampling time or flow rate gives NaN
+    :param bins: counts of the 24 bins, shape (24,) or (number of histograms, 24)
+    :param sampling_time: seconds, one value or one per histogram
+    :param sample_flow_rate: ml/s, one value or one per histogram
+    :param density: density of the particles (g/cm³)
+    :param geometry: BinGeometry
+    :return: Dictionary{"number" (particles/cm³ per bin), "dN/dlogDp" (particles/cm³), "dV/dlogDp" (µm³/cm³),
+             "dM/dlogDp" (µg/m³), "total number" (particles/cm³), "total volume" (µm³/cm³),
+             "total mass" (µg/m³)}, shapes of bins (per bin) or of sampling_time (totals)
+    """
+    bins = np.asarray(bins, dtype=np.float64)
+    sampled_volume = np.asarray(sampling_time, dtype=np.float64) * np.asarray(sample_flow_rate, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # ml = cm³ of air sampled, NaN if nothing was sampled
+        sampled_volume = np.where(sampled_volume > 0, sampled_volume, np.nan)
+        number = bins * geometry.weightings / sampled_volume[..., np.newaxis]
+    volume = number * geometry.particle_volumes  # µm³/cm³
+    mass = volume * density  # µm³/cm³ x g/cm³ = 1e-12 g/cm³ = µg/m³
+    return {
+        "number": number,
+        "dN/dlogDp": number / geometry.dlogDp,
+        "dV/dlogDp": volume / geometry.dlogDp,
+        "dM/dlogDp": mass / geometry.dlogDp,
+        "total number": number.sum(axis=-1),
+        "total volume": volume.sum(axis=-1),
+        "total mass": mass.sum(axis=-1),
+    }
+
+
+def from_records(records, density=default_density, geometry=default_geometry):
+    """
+    Size distributions of OPC-N3 records (see OPCN3.getdata()), the records in error give NaN
+    :param records: List[schema.OPCN3Record]
+    :param density: density of the particles (g/cm³)
+    :param geometry: BinGeometry
+    :return: Dictionary (see distribute())
+    """
+    names = ['bin' + str(i) for i in range(number_of_bins)]
+    bins = np.array([[np.nan if getattr(record, name) is None else getattr(record, name) for name in names]
+                     for record in records], dtype=np.float64).reshape(-1, number_of_bins)
+    sampling_time = np.array([np.nan if record.sampling_time is None else record.sampling_time
+                              for record in records], dtype=np.float64)
+    sample_flow_rate = np.array([np.nan if record.sample_flow_rate is None else record.sample_flow_rate
+                                 for record in records], dtype=np.float64)
+    return distribute(bins, sampling_time, sample_flow_rate, density, geometry)
+
+
+def from_reprocessed(histograms, density=default_density, geometry=default_geometry, only_valid=True):
+    """
+    Size distributions of the histograms decoded again by reprocess.py
+    :param histograms: numpy structured array 'OPC-N3' of the -frames.npz file
+    :param density: density of the particles (g/cm³)
+    :param geometry: BinGeometry
+    :param only_valid: True to keep only the histograms with a correct checksum
+    :return: Dictionary (see distribute()), plus "time" (seconds since 1970) of each histogram
+    """
+    if only_valid:
+        histograms = histograms[histograms['valid']]
+    bins = np.stack([histograms['bin' + str(i)] for i in range(number_of_bins)], axis=-1)
+    result = distribute(bins, histograms['sampling_time'], histograms['sample_flow_rate'], density, geometry)
+    result["time"] = histograms['time']
+    return result
+
+
+def from_data_file(csv_file, density=default_density, geometry=default_geometry):
+    """
+    Size distributions of the lines of a -data.csv file ("error" gives NaN)
+    :param csv_file: path of the csv file
+    :param density: density of the particles (g/cm³)
+    :param geometry: BinGeometry
+    :return: Dictionary (see distribute())
+    """
+    titles = {column.name: column.title for column in schema.OPCN3_columns}
+    wanted = [titles['bin' + str(i)] for i in range(number_of_bins)] + [titles['sampling_time'],
+                                                                        titles['sample_flow_rate']]
+    values = []
+    with open(csv_file, newline='', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            line = []
+            for title in wanted:
+                try:
+                    line.append(float(row[title]))
+                except (KeyError, TypeError, ValueError):
+                    line.append(np.nan)  # "error", line partially written, column missing ('PM only' mode)
+            values.append(line)
+        file.close()
+    values = np.array(values, dtype=np.float64).reshape(-1, number_of_bins + 2)
+    return distribute(values[:, :number_of_bins], values[:, number_of_bins], values[:, number_of_bins + 1],
+                      density, geometry)
+
+
+def cached_geometry(cache_file=configuration_cache_file, serial_number=None):
+    """
+    Geometry of the bins of a sensor already read by OPCN3.load_configuration()
+    :param cache_file: json file of the configurations
+    :param serial_number: Optional: serial number of the sensor, the first one of the file if None
+    :return: BinGeometry, None if the sensor is not in the file
+    """
+    try:
+        with open(cache_file, encoding='utf-8') as file:
+            cache = json.load(file)
+            file.close()
+    except (OSError, ValueError):
+        return None
+    if serial_number is None and cache:
+        serial_number = next(iter(cache))
+    if serial_number not in cache:
+        return None
+    return BinGeometry(cache[serial_number]["bin boundaries (µm)"])
+
+
+if __name__ == '__main__':  # if you run this code directly ($ python3 size_distribution.py file [density])
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python3 size_distribution.py <session folder, -data.csv or -frames.npz file> "
+              "[density (g/cm³)]")
+        sys.exit(1)
+    source = sys.argv[1].rstrip('/')
+    if os.path.isdir(source):
+        source = os.path.join(source, os.path.basename(source) + "-data.csv")
+    particle_density = float(sys.argv[2]) if len(sys.argv) == 3 else default_density
+
+    bin_geometry = cached_geometry()
+    if bin_geometry is None:
+        print("No OPC-N3 configuration in '" + configuration_cache_file + "', default bin boundaries used")
+        bin_geometry = default_geometry
+
+    if source.endswith(".npz"):
+        distributions = from_reprocessed(np.load(source)["OPC-N3"], particle_density, bin_geometry)
+    else:
+        distributions = from_data_file(source, particle_density, bin_geometry)
+
+    count = int(np.sum(~np.isnan(distributions["total number"])))
+    print(count, "histograms, density", particle_density, "g/cm³, mean distribution:")
+    print("Bin".ljust(5), "Dp (µm)".rjust(9), "dN/dlogDp (#/cm³)".rjust(19), "dV/dlogDp (µm³/cm³)".rjust(21),
+          "dM/dlogDp (µg/m³)".rjust(19))
+    if count:
+        with np.errstate(invalid='ignore'):
+            means = {name: np.nanmean(distributions[name].reshape(-1, number_of_bins), axis=0)
+                     for name in ("dN/dlogDp", "dV/dlogDp", "dM/dlogDp")}
+        for i in range(number_of_bins):
+            print(str(i).ljust(5), str(round(bin_geometry.diameters[i], 3)).rjust(9),
+                  str(round(means["dN/dlogDp"][i], 3)).rjust(19), str(round(means["dV/dlogDp"][i], 3)).rjust(21),
+                  str(round(means["dM/dlogDp"][i], 3)).rjust(19))
+        print("Total number:", round(float(np.nanmean(distributions["total number"])), 3), "#/cm³ | Total mass:",
+              round(float(np.nanmean(distributions["total mass"])), 3), "µg/m³")
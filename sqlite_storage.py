@@ -0,0 +1,238 @@
+"""
+SQLite storage of the data measured by the Seacanairy (same data as the -data.csv file)
+One row per sampling cycle in the table 'measurements', with:
+- typed columns: REAL for the numbers (NULL when the sensor returned "error", "-", "no fix"...), TEXT for the texts
+- 'timestamp': date and time of the cycle in seconds since 1970, indexed
+- 'latitude decimal', 'longitude decimal': GPS position in decimal degrees
+- 'spatial key': number of the cell of 0.1° x 0.1° (about 11 x 7 km in the North Sea) containing the position,
+  indexed with the timestamp, to find quickly the measurements made near a place
+The database is in WAL mode (the data can be read during the sampling) and the rows are inserted by groups
+in one transaction, to reduce the writing on the SD card.
+
+    connection = sqlite3.connect("session-data.sqlite")
+    rows = sqlite_storage.select_near(connection, 51.27, 4.35, start, end, columns=["PM 2.5 (μg/m³)"])
+"""
+
+import sqlite3
+import logging
+
+logger = logging.getLogger('STORAGE')
+
+table = "measurements"
+
+cell_size = 0.1  # degrees, size of the cells of the spatial key
+
+# values of the sensors meaning that there is no data
+no_data = ("error", "-", "no fix", "")
+
+
+def quote(name):
+    """
+    Write a column name in a SQL command (the names contain spaces, parenthesis, units...)
+    :param name: column name
+    :return: string
+    """
+    return '"' + name.replace('"', '""') + '"'
+
+
+def unique_names(names):
+    """
+    SQLite does not make the difference between upper and lower case in the column names: a number is added to the
+    names already used (f-e "Temperature (°C)" of the CO2 sensor and "temperature (°C)" of the AFE board)
+    :param names: List[column names]
+    :return: List[column names, all different for SQLite]
+    """
+    used = set()
+    to_return = []
+    for name in names:
+        unique = name
+        number = 2
+        while unique.lower() in used:
+            unique = name + " " + str(number)
+            number += 1
+        used.add(unique.lower())
+        to_return.append(unique)
+    return to_return
+
+
+def spatial_key(latitude, longitude):
+    """
+    Number of the cell containing a position
+    :param latitude: decimal degrees
+    :param longitude: decimal degrees
+    :return: integer, None if the position is unknown
+    """
+    if latitude is None or longitude is None:
+        return None
+    row = int((latitude + 90) // cell_size)
+    column = int((longitude + 180) // cell_size)
+    return row * int(round(360 / cell_size)) + column
+
+
+def lat_long_to_decimal(text):
+    """
+    Convert a latitude/longitude written by the GPS file (f-e "51°13.80000' N") into decimal degrees
+    :param text: latitude or longitude
+    :return: float, negative for South and West, None if the text is not a position
+    """
+    try:
+        degrees, rest = str(text).split('°')
+        minutes, compas = rest.split("'")
+        value = int(degrees) + float(minutes) / 60
+    except ValueError:
+        return None
+    if compas.strip() in ("S", "W"):
+        value = -value
+    return value
+
+
+class SQLiteWriter:
+    """
+    Insert the data of the sampling cycles in a SQLite database
+    """
+
+    def __init__(self, file_path, columns, latitude_column=None, longitude_column=None, batch_size=1,
+                 fsync=False):
+        """
+        :param file_path: path of the database, created if it doesn't exist
+        :param columns: List[(column name, 'REAL' or 'TEXT')]
+        :param latitude_column: name of the column containing the latitude (for the spatial key)
+        :param longitude_column: name of the column containing the longitude
+        :param batch_size: number of rows inserted in one transaction
+        :param fsync: True to wait until each transaction is physically written on the SD card
+        """
+        self.file_path = file_path
+        self.columns = list(columns)
+        self.names = [name for name, type in self.columns]
+        self.latitude_index = self.names.index(latitude_column) if latitude_column in self.names else None
+        self.longitude_index = self.names.index(longitude_column) if longitude_column in self.names else None
+        self.names = unique_names(self.names)
+        self.columns = list(zip(self.names, [type for name, type in self.columns]))
+        self.real_columns = [type == 'REAL' for name, type in self.columns]
+        self.batch_size = max(1, batch_size)
+        self.pending = []  # rows waiting to be inserted
+
+        self.connection = sqlite3.connect(file_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # NORMAL: a power loss can lose the last transactions, but never corrupts the database
+        self.connection.execute("PRAGMA synchronous=" + ("FULL" if fsync else "NORMAL"))
+        self.create_table()
+
+        all_columns = ["timestamp"] + self.names + ["latitude decimal", "longitude decimal", "spatial key"]
+        self.insert = "INSERT INTO " + table + " (" + ", ".join(quote(name) for name in all_columns) + \
+                      ") VALUES (" + ", ".join("?" * len(all_columns)) + ")"
+
+    def create_table(self):
+        """
+        Create the table and the indexes, add the columns missing in an existing database
+        :return: nothing
+        """
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS " + table + " (timestamp REAL NOT NULL, " +
+                                    "\"latitude decimal\" REAL, \"longitude decimal\" REAL, \"spatial key\" INTEGER)")
+            existing = [row[1].lower() for row in self.connection.execute("PRAGMA table_info(" + table + ")")]
+            for name, type in self.columns:
+                if name.lower() not in existing:
+                    self.connection.execute("ALTER TABLE " + table + " ADD COLUMN " + quote(name) + " " + type)
+            self.connection.execute("CREATE INDEX IF NOT EXISTS " + table + "_timestamp ON " + table +
+                                    " (timestamp)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS " + table + "_position ON " + table +
+                                    " (\"spatial key\", timestamp)")
+
+    def to_row(self, timestamp, values):
+        """
+        Convert the values of one cycle into one row of the table
+        :param timestamp: date and time of the cycle (seconds since 1970)
+        :param values: List[values, in the order of the columns]
+        :return: tuple
+        """
+        row = [timestamp]
+        for i in range(len(self.names)):
+            value = values[i] if i < len(values) else None
+            if value is None or value is False or (isinstance(value, str) and value in no_data):
+                row.append(None)
+            elif self.real_columns[i]:
+                try:
+                    row.append(float(value))
+                except (TypeError, ValueError):
+                    row.append(None)
+            else:
+                row.append(str(value))
+
+        latitude = None
+        longitude = None
+        if self.latitude_index is not None and self.longitude_index is not None:
+            latitude = lat_long_to_decimal(row[self.latitude_index + 1])
+            longitude = lat_long_to_decimal(row[self.longitude_index + 1])
+        row += [latitude, longitude, spatial_key(latitude, longitude)]
+        return tuple(row)
+
+    def append(self, timestamp, values):
+        """
+        Add the data of one cycle (inserted now or with the next ones, depending on batch_size)
+        :param timestamp: date and time of the cycle (seconds since 1970)
+        :param values: List[values, in the order of the columns]
+        :return: nothing
+        """
+        self.pending.append(self.to_row(timestamp, values))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Insert all the rows waiting, in one transaction
+        :return: nothing
+        """
+        if not self.pending:
+            return
+        try:
+            with self.connection:  # one transaction, committed at the end of the block
+                self.connection.executemany(self.insert, self.pending)
+            self.pending = []
+        except sqlite3.Error:
+            # the rows are kept and inserted with the next ones
+            logger.error("Failed to insert %s rows in '%s'", len(self.pending), self.file_path, exc_info=True)
+
+    def close(self):
+        """
+        Insert the rows waiting and close the database
+        :return: nothing
+        """
+        self.flush()
+        self.connection.close()
+
+
+# --------------------------------------------------------
+# READING
+# --------------------------------------------------------
+
+
+def select_near(connection, latitude, longitude, start=None, end=None, cells=1, columns=None):
+    """
+    Measurements made near a position, during a period
+    :param connection: sqlite3 connection to the database
+    :param latitude: decimal degrees
+    :param longitude: decimal degrees
+    :param start: Optional: first date and time (seconds since 1970)
+    :param end: Optional: last date and time (seconds since 1970)
+    :param cells: number of cells around the position (1 = the cell of the position and the 8 cells around)
+    :param columns: Optional: List[names of the columns to return], all the columns if None
+    :return: List[rows (tuples)] sorted by timestamp
+    """
+    keys = []
+    for row in range(-cells, cells + 1):
+        for column in range(-cells, cells + 1):
+            keys.append(spatial_key(latitude + row * cell_size, longitude + column * cell_size))
+
+    selected = "*" if columns is None else ", ".join(["timestamp"] + [quote(name) for name in columns])
+    command = "SELECT " + selected + " FROM " + table + " WHERE \"spatial key\" IN (" + \
+              ", ".join("?" * len(keys)) + ")"
+    parameters = keys
+    if start is not None:
+        command += " AND timestamp >= ?"
+        parameters.append(start)
+    if end is not None:
+        command += " AND timestamp <= ?"
+        parameters.append(end)
+    command += " ORDER BY timestamp"
+    return connection.execute(command, parameters).fetchall()
@@ -0,0 +1,240 @@
+"""
+Storage of the data measured by the Seacanairy
+- append_data_to_csv(): open the file, write one line and close the file
+- CSVWriter: keep the file open during the whole session and write the lines by groups, to reduce the wear of the
+  SD card and the time spent to write at each cycle. The file can be rotated and compressed (see 'rotation.py').
+"""
+
+import os
+import io
+import csv  # for storing data in file
+import time
+import logging
+import threading  # the lines waiting are written after 'flush_interval' seconds, even if no new line comes
+
+import rotation  # start a new file when it is too big/old, compress the previous ones
+
+logger = logging.getLogger('STORAGE')
+
+
+def append_data_to_csv(csv_file, *data_to_write):
+    """
+    Store all the arguments given in the -data.csv file
+    All arguments will be separated by a coma in the csv file
+    :param csv_file: path of the csv file
+    :param data_to_write: unlimited amount of arguments
+    :return: nothing
+    """
+    to_write = [*data_to_write]  # Concatenate all the arguments in one list
+
+    with open(csv_file, mode='a', newline='') as data_file:
+        writer = csv.writer(data_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(to_write)
+    data_file.close()  # close file after use(general safety practice)
+
+
+def find_data_end(file, chunk_size=65536):
+    """
+    Find the end of the last complete line of a file
+    After a power loss, the end of the file can contain zeros (space preallocated, or data not written yet on the
+    SD card) and/or a line only partially written: everything after the last end of line is not valid
+    :param file: file opened in binary mode
+    :param chunk_size: number of bytes read at once, from the end of the file
+    :return: position (bytes) just after the last '\n', 0 if there is no complete line
+    """
+    end = file.seek(0, os.SEEK_END)
+    while end > 0:
+        start = max(0, end - chunk_size)
+        file.seek(start)
+        chunk = file.read(end - start)
+        last_line_end = chunk.rfind(b'\n')
+        if last_line_end != -1:
+            return start + last_line_end + 1
+        end = start
+    return 0
+
+
+class CSVWriter:
+    """
+    csv file kept open during the whole sampling session
+    The lines are kept in memory and written together on the SD card:
+    - every 'flush_rows' lines, or 'flush_interval' seconds after the oldest line waiting was added (a timer
+      writes it, also when no other line comes in the meantime)
+    - with os.fsync() if 'fsync' is True, so that the data are really on the SD card and not only in the cache
+    The file can be extended by blocks of 'preallocate' bytes, so the size of the file (metadata of the SD card) is
+    not changed at each line. When the file is opened again (f-e after a power loss), the zeros and the line
+    partially written at the end are removed, the complete lines are kept.
+    When the file is bigger than 'max_size' or older than 'rotate_interval', it is renamed with the date and time,
+    compressed in the background and a new file is started with the same header.
+    """
+
+    def __init__(self, file_path, flush_rows=1, flush_interval=0, fsync=False, preallocate=0, header=None,
+                 max_size=0, rotate_interval=0, compression=rotation.NONE):
+        """
+        :param file_path: path of the csv file, created if it doesn't exist
+        :param flush_rows: number of lines kept in memory before writing them (1 = write every line)
+        :param flush_interval: maximum time (seconds) a line is kept in memory (+ the time needed to write it), 0 to
+                               only use 'flush_rows'
+        :param fsync: True to wait until the data are physically written on the SD card
+        :param preallocate: size (bytes) of the blocks reserved in advance at the end of the file, 0 to disable
+        :param header: Optional: List[column names], written at the beginning of each new file
+        :param max_size: size (bytes) above which a new file is started, 0 = no limit
+        :param rotate_interval: time (seconds) after which a new file is started, 0 = no limit
+        :param compression: compression of the previous files: 'gzip', 'zstd' or 'none'
+        """
+        self.file_path = file_path
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.preallocate = preallocate if hasattr(os, 'posix_fallocate') else 0
+        self.header = header
+        self.max_size = max_size
+        self.rotate_interval = rotate_interval
+        self.compression = rotation.check_compression(compression)
+        rotation.compress_old_segments(file_path, self.compression)
+
+        # lines waiting to be written, already converted in csv format
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        self.pending_rows = 0
+        self.oldest_pending = None  # time.monotonic() of the first line waiting
+        self.flush_timer = None  # threading.Timer writing the lines waiting after 'flush_interval' seconds
+        self.lock = threading.RLock()  # the timer writes from its own thread
+
+        self.open()
+
+    def open(self):
+        """
+        Open the file (created if it doesn't exist) and write the header if the file is empty
+        :return: nothing
+        """
+        if not os.path.isfile(self.file_path):
+            open(self.file_path, 'wb').close()
+        self.file = open(self.file_path, 'r+b')
+        self.opened = time.monotonic()
+
+        self.data_end = self.recover()  # position at which the next line is written
+        self.allocated = os.fstat(self.file.fileno()).st_size  # size reserved on the SD card
+
+        if self.data_end == 0 and self.header is not None:
+            # written directly, before the lines waiting in memory (if any)
+            header = io.StringIO()
+            csv.writer(header, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL).writerow(self.header)
+            self.write(header.getvalue().encode('utf-8'))
+
+    def recover(self):
+        """
+        Remove what is after the last complete line (zeros preallocated, line partially written at a power loss)
+        :return: position of the end of the valid data (bytes)
+        """
+        size = self.file.seek(0, os.SEEK_END)
+        data_end = find_data_end(self.file)
+        if data_end != size:
+            self.file.seek(data_end)
+            removed = self.file.read(size - data_end).rstrip(b'\x00')
+            if removed:
+                logger.warning("Last line of '%s' was incomplete (power loss?), removed %s bytes: %s", self.file_path,
+                               len(removed), removed[:100])
+            self.file.truncate(data_end)
+        return data_end
+
+    def writerow(self, row):
+        """
+        Add a line to the file (written now or later, depending on flush_rows and flush_interval)
+        :param row: List[values of the line]
+        :return: nothing
+        """
+        with self.lock:
+            self.writer.writerow(row)
+            self.pending_rows += 1
+            if self.oldest_pending is None:
+                self.oldest_pending = time.monotonic()
+                if self.flush_interval > 0 and self.pending_rows < self.flush_rows:
+                    self.flush_timer = threading.Timer(self.flush_interval, self.flush_when_due)
+                    self.flush_timer.daemon = True
+                    self.flush_timer.start()
+
+            if self.pending_rows >= self.flush_rows:
+                self.flush()
+
+    def flush_when_due(self):
+        """
+        Write the lines waiting, called by the timer 'flush_interval' seconds after the oldest one was added
+        :return: nothing
+        """
+        try:
+            self.flush()
+        except (OSError, ValueError):  # ValueError: file already closed
+            logger.error("Failed to write the lines waiting in '%s'", self.file_path, exc_info=True)
+
+    def flush(self):
+        """
+        Write all the lines waiting in memory
+        :return: nothing
+        """
+        with self.lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()  # nothing happens if it is the timer calling
+                self.flush_timer = None
+            if self.pending_rows == 0:
+                return
+            self.write(self.buffer.getvalue().encode('utf-8'))
+
+            self.buffer.seek(0)
+            self.buffer.truncate()
+            self.pending_rows = 0
+            self.oldest_pending = None
+
+            if (self.max_size > 0 and self.data_end >= self.max_size) or \
+                    (self.rotate_interval > 0 and time.monotonic() - self.opened >= self.rotate_interval):
+                self.rotate()
+
+    def write(self, data):
+        """
+        Write bytes at the end of the data
+        :param data: bytes
+        :return: nothing
+        """
+        if self.preallocate and self.data_end + len(data) > self.allocated:
+            # reserve the next block(s) at once, the size of the file does not change at each line
+            blocks = (self.data_end + len(data) - self.allocated) // self.preallocate + 1
+            try:
+                os.posix_fallocate(self.file.fileno(), self.allocated, blocks * self.preallocate)
+                self.allocated += blocks * self.preallocate
+            except OSError:
+                logger.warning("Failed to preallocate space in '%s', disabling preallocation", self.file_path)
+                self.preallocate = 0
+
+        self.file.seek(self.data_end)
+        self.file.write(data)
+        self.file.flush()  # give the data to the system now, not when the Python buffer is full
+        self.data_end += len(data)
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def rotate(self):
+        """
+        Close the file, rename it with the date and time, compress it in the background and start a new file
+        :return: nothing
+        """
+        self.close()
+        segment = rotation.segment_path(self.file_path)
+        os.rename(self.file_path, segment)
+        logger.info("Data file renamed '%s', starting a new one", segment)
+        rotation.compress_later(segment, self.compression)
+        self.open()
+
+    def close(self):
+        """
+        Write the lines waiting in memory and give back the space preallocated but not used
+        :return: nothing
+        """
+        with self.lock:
+            if self.file.closed:
+                return
+            self.flush()
+            if self.allocated > self.data_end:
+                self.file.truncate(self.data_end)
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            self.file.close()
@@ -0,0 +1,176 @@
+"""
+Duration of each phase of the sampling cycle (pump start, flushing, OPC-N3 warm-up, CO2 status polling...)
+Measured with the monotonic clock, which does not jump when the system time is changed (f-e by NTP)
+At the end of each cycle, the rolling statistics (p50, p95, max) of each phase are written in a small json file,
+and a warning is logged if the cycle is longer than the sampling period, with the phases that took the most time.
+
+Use it with 'with':
+    with timing.phase("OPC histogram wait"):
+        loading_bar('Sampling PM', delay)
+"""
+
+import os
+import json
+import time
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger('TIMING')
+
+metrics_file = None  # json file with the statistics, nothing is written if None (see setup())
+window = 100  # number of cycles used for the rolling statistics
+
+history = {}  # phase name: deque(durations of the last cycles, in seconds)
+cycle = {}  # durations of the current cycle: Dictionary{thread name: Dictionary{phase name: seconds}}
+cycle_lock = threading.Lock()  # the buses are read in different threads (see 'seacanairy.py')
+
+
+def setup(file=None, rolling_window=100):
+    """
+    Choose where the statistics are stored
+    :param file: path of the json file, None to only log the warnings
+    :param rolling_window: number of cycles used to compute p50, p95 and max
+    :return: nothing
+    """
+    global metrics_file, window
+    metrics_file = file
+    window = rolling_window
+    for name in history:
+        history[name] = deque(history[name], maxlen=window)
+
+
+@contextmanager
+def phase(name):
+    """
+    Measure the duration of the code inside the 'with' block
+    The phases must not be nested: the durations of a same thread are added to compute the cycle duration
+    :param name: name of the phase, as written in the statistics
+    """
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        record(name, time.monotonic() - start)
+
+
+def record(name, duration):
+    """
+    Add a duration to the current cycle
+    :param name: name of the phase
+    :param duration: seconds
+    :return: nothing
+    """
+    thread = threading.current_thread().name
+    with cycle_lock:
+        phases = cycle.setdefault(thread, {})
+        phases[name] = phases.get(name, 0) + duration  # a phase can happen several times (f-e reading attempts)
+
+
+def start_cycle():
+    """
+    Forget the durations measured outside the sampling cycle (f-e during the start of the Seacanairy)
+    :return: nothing
+    """
+    with cycle_lock:
+        cycle.clear()
+
+
+def projected_duration(phases_per_thread):
+    """
+    Duration of the cycle: phases of the main thread one after the other, plus the longest bus (the buses are
+    read at the same time in the other threads)
+    :param phases_per_thread: Dictionary{thread name: Dictionary{phase name: seconds}}
+    :return: seconds
+    """
+    main = 0
+    longest_bus = 0
+    for thread, phases in phases_per_thread.items():
+        if thread == threading.main_thread().name:
+            main += sum(phases.values())
+        else:
+            longest_bus = max(longest_bus, sum(phases.values()))
+    return main + longest_bus
+
+
+def percentile(values, percent):
+    """
+    Percentile of a list of values (nearest rank, no interpolation)
+    :param values: List[numbers], not empty
+    :param percent: 0 to 100
+    :return: value
+    """
+    ordered = sorted(values)
+    rank = int(round(percent / 100 * (len(ordered) - 1)))
+    return ordered[rank]
+
+
+def statistics():
+    """
+    Rolling statistics of each phase
+    :return: Dictionary{phase name: Dictionary{"last", "p50", "p95", "max", "cycles"}} (seconds)
+    """
+    to_return = {}
+    for name, durations in history.items():
+        if len(durations) == 0:
+            continue
+        to_return[name] = {
+            "last": round(durations[-1], 3),
+            "p50": round(percentile(durations, 50), 3),
+            "p95": round(percentile(durations, 95), 3),
+            "max": round(max(durations), 3),
+            "cycles": len(durations)
+        }
+    return to_return
+
+
+def write_metrics():
+    """
+    Write the statistics in the json file (replaced at each cycle, never half written), one line per phase
+    :return: nothing
+    """
+    if metrics_file is None:
+        return
+    temporary_file = metrics_file + ".tmp"
+    lines = [json.dumps(name) + ": " + json.dumps(values) for name, values in statistics().items()]
+    try:
+        with open(temporary_file, 'w') as file:
+            file.write("{\n" + ",\n".join(lines) + "\n}\n")
+            file.close()
+        os.replace(temporary_file, metrics_file)
+    except OSError:
+        logger.error("Failed to write the timing statistics in '%s'", metrics_file)
+
+
+def end_cycle(sampling_period):
+    """
+    Store the durations of the cycle, update the statistics and warn if the cycle is too long
+    :param sampling_period: seconds available for one cycle
+    :return: projected duration of the cycle (seconds)
+    """
+    with cycle_lock:
+        phases_per_thread = {thread: dict(phases) for thread, phases in cycle.items()}
+        cycle.clear()
+
+    projected = projected_duration(phases_per_thread)
+
+    all_phases = {}
+    for phases in phases_per_thread.values():
+        for name, duration in phases.items():
+            all_phases[name] = all_phases.get(name, 0) + duration
+    all_phases["cycle (projected)"] = projected
+
+    for name, duration in all_phases.items():
+        if name not in history:
+            history[name] = deque(maxlen=window)
+        history[name].append(duration)
+
+    write_metrics()
+
+    if projected > sampling_period:
+        longest = sorted(all_phases.items(), key=lambda item: item[1], reverse=True)[1:4]  # [0] is the cycle
+        logger.warning("Projected cycle duration is %s seconds, longer than the sampling period (%s seconds). "
+                       "Longest phases: %s", round(projected, 1), sampling_period,
+                       ", ".join(name + " " + str(round(duration, 1)) + " s" for name, duration in longest))
+    return projected